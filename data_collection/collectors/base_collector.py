@@ -14,9 +14,13 @@ import logging
 from bs4 import BeautifulSoup
 import cv2
 import numpy as np
+from utils.ingest import ingest_stage
+from utils.logs import ProgressReporter
+from utils.profiling import span
+from utils.records import MetadataBuffer
+from utils.writer import ImageWriter
 
-# Setup logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# Handlers are configured by the entry point (utils.logs.setup_logging), not on import
 logger = logging.getLogger(__name__)
 
 class SimplePhotoCollector:
@@ -34,8 +38,16 @@ class SimplePhotoCollector:
         })
         
         self.downloaded_urls = set()
-        self.metadata = []
+        # columnar, so millions of records stay compact; appends and iteration work like a list
+        self.metadata = MetadataBuffer()
+        # scores committed files on a process pool; created before the writer so it is closed after it at exit
+        self.ingest = ingest_stage(self.output_dir)
+        # files are written, fsynced and renamed off the download thread
+        self.writer = ImageWriter(self.output_dir / "images")
+        # per-image outcomes are counted here and logged as periodic rates
+        self.progress = ProgressReporter(type(self).__name__, logger=logger)
         
+    @span('validate_image')
     def validate_image(self, image_content):
         """Validate image quality and content"""
         try:
@@ -65,10 +77,17 @@ class SimplePhotoCollector:
         except Exception as e:
             return False, f"Validation error: {e}"
     
-    def download_image(self, url, filename):
-        """Download and save image with validation"""
+    @span('download_image')
+    def download_image(self, url, filename, record=None):
+        """Download, validate and queue the image for writing
+
+        `record` is appended to self.metadata only once the file is durably on
+        disk and scored, so metadata never points at a partial image. Call flush() before
+        reading self.metadata. Returns the number of bytes queued, 0 when the
+        image was rejected.
+        """
         try:
-            logger.info(f"Downloading: {url}")
+            logger.debug("Downloading: %s", url)
             response = self.session.get(url, timeout=15, stream=True)
             response.raise_for_status()
             
@@ -78,21 +97,35 @@ class SimplePhotoCollector:
             # Validate image
             is_valid, message = self.validate_image(content)
             if not is_valid:
-                logger.warning(f"Skipping {filename}: {message}")
-                return False
-            
-            # Save image
-            filepath = self.output_dir / "images" / filename
-            with open(filepath, 'wb') as f:
-                f.write(content)
+                logger.debug("Skipping %s: %s", filename, message)
+                self.progress.add('rejected')
+                return 0
             
-            logger.info(f"✓ Saved: {filename} - {message}")
-            return True
+            # Queue for the writer; blocks only when the disk falls behind
+            # once durable the file is scored, and only then is its record committed
+            on_commit = lambda: self.ingest.submit(filename, record, self.metadata.append)
+            self.writer.submit(filename, content, on_commit)
+
+            logger.debug("Queued: %s - %s", filename, message)
+            self.progress.add('images')
+            self.progress.add('mb', len(content) / 1024 ** 2)
+            return len(content)
             
         except Exception as e:
             logger.error(f"Error downloading {url}: {e}")
-            return False
+            self.progress.add('errors')
+            return 0
     
+    def download_job(self, url, filename, record=None):
+        """download_image deferred as a crawl scheduler job; marks the URL as downloaded once it is stored"""
+        def job():
+            stored = self.download_image(url, filename, record)
+            if stored:
+                self.downloaded_urls.add(url)
+            return stored
+        return job
+
+    @span('generate_filename')
     def generate_filename(self, url, prefix="img"):
         """Generate unique filename"""
         url_hash = hashlib.md5(url.encode()).hexdigest()[:8]
@@ -104,3 +137,12 @@ class SimplePhotoCollector:
             ext = 'jpg'
         
         return f"{prefix}_{url_hash}.{ext}"
+
+    def flush(self):
+        """Wait until every queued image is on disk, scored and its metadata record committed"""
+        self.writer.flush()
+        self.ingest.flush()
+        self.progress.report(final=True)
+        stats = self.writer.stats()
+        logger.info(f"Writer: {stats['files']} files, {stats['write_mb_per_s']:.1f} MB/s, "
+                    f"{stats['files_per_batch']:.1f} files per fsync, max queue depth {stats['max_queue_depth']}")
@@ -6,38 +6,49 @@ import random
 import requests
 
 
-def collect_sample_coco_tv(sample_size: int = 1000):
-    """Download a small sample of COCO train2017 images with TVs"""
-    collector = SimplePhotoCollector()
-    downloaded = 0
-
+def coco_sample_ids(count: int = 1000, annotations: str = 'instances_train2017.json'):
+    """Random COCO train2017 image ids"""
     # COCO image IDs range from 000000000000.jpg to 000000118287.jpg (train2017)
     # all_ids = list(range(1, 118288))  # total train2017 images
     # sample_ids = random.sample(all_ids, sample_size)
 
-    coco = COCO('instances_train2017.json')
+    coco = COCO(annotations)
     valid_ids = [img['id'] for img in coco.dataset['images']]
-    sample_ids = random.sample(valid_ids, 1000)
+    return random.sample(valid_ids, count)
 
-    logger.info(f"Downloading {sample_size} sample COCO images...")
-
-    for img_id in sample_ids:
-        if downloaded >= sample_size:
-            break  # stop when we reach the desired number of images
 
+def coco_jobs(collector, image_ids):
+    """One download job per COCO train2017 image id"""
+    for img_id in image_ids:
         img_filename = f"{img_id:012d}.jpg"
         url = f"http://images.cocodataset.org/train2017/{img_filename}"
         filename = collector.generate_filename(url, "coco_sample")
+        yield collector.download_job(url, filename, record={
+            "filename": filename,
+            "source_url": url,
+            "source": "coco_dataset",
+            "coco_id": img_id,
+            "category": "tv_detection"
+        })
+
+
+def collect_sample_coco_tv(sample_size: int = 1000):
+    """Download a small sample of COCO train2017 images with TVs"""
+    collector = SimplePhotoCollector()
+    downloaded = 0
+
+    sample_ids = coco_sample_ids(1000)
+
+    logger.info(f"Downloading {sample_size} sample COCO images...")
+
+    for img_id, job in zip(sample_ids, coco_jobs(collector, sample_ids)):
+        if downloaded >= sample_size:
+            break  # stop when we reach the desired number of images
 
+        url = f"http://images.cocodataset.org/train2017/{img_id:012d}.jpg"
         try:
 
-            if collector.download_image(url, filename):
-                collector.metadata.append({
-                    "filename": filename,
-                    "source_url": url,
-                    "source": "coco_dataset",
-                    "category": "tv_detection"
-                })
+            if job():
                 downloaded += 1
         except requests.exceptions.HTTPError as e:
             if e.response.status_code == 404:
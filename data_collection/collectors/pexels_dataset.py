@@ -1,44 +1,43 @@
 import time
-from bs4 import BeautifulSoup
+from utils.html_extract import extract_image_urls, save_page
 from .base_collector import SimplePhotoCollector, logger
 
-def collect_from_pexels():
+def pexels_jobs(collector, term, limit=None, save_pages_dir=None, category=None):
+    """Download jobs for one Pexels search; the search page is only fetched when the first job is pulled"""
+    search_url = f"https://www.pexels.com/search/{term.replace(' ', '%20')}/"
+    logger.info(f"Searching Pexels for: {term}")
+    resp = collector.session.get(search_url)
+    if save_pages_dir:
+        save_page(save_pages_dir, f"pexels_{term}", resp.content)
+    img_urls = extract_image_urls(resp.content, class_contains="photo-item", limit=limit, base_url=search_url)
+
+    for src in img_urls:
+        if src in collector.downloaded_urls:
+            continue
+        filename = collector.generate_filename(src, f"pexels_{term.replace(' ', '_')}")
+        record = {
+            "filename": filename,
+            "source_url": src,
+            "source": "pexels",
+            "search_term": term
+        }
+        if category:
+            record["category"] = category
+        yield collector.download_job(src, filename, record)
+
+def collect_from_pexels(max_images_per_term: int = 10, save_pages_dir=None):
     collector = SimplePhotoCollector()
     search_terms = ["living room tv", "fireplace interior", "modern living room"]
 
     downloaded = 0
     for term in search_terms:
         try:
-            search_url = f"https://www.pexels.com/search/{term.replace(' ', '%20')}/"
-            logger.info(f"Searching Pexels for: {term}")
-            resp = collector.session.get(search_url)
-            soup = BeautifulSoup(resp.content, "html.parser")
-            #img_elements = soup.find_all('img')[:10]
-            img_elements = soup.find_all('img', {'class': lambda x: x and 'photo-item' in str(x)})[:10]
-
-
-            for img in img_elements:
-                src = img.get("src") or img.get("data-src")
-                if not src or src in collector.downloaded_urls:
-                    continue
-
-                filename = collector.generate_filename(src, f"pexels_{term.replace(' ', '_')}")
-                if collector.download_image(src, filename):
-                    collector.downloaded_urls.add(src)
-                    collector.metadata.append({
-                        "filename": filename,
-                        "source_url": src,
-                        "source": "pexels",
-                        "search_term": term
-                    })
+            for job in pexels_jobs(collector, term, max_images_per_term, save_pages_dir):
+                if job():
                     downloaded += 1
                 time.sleep(2)
         except Exception as e:
             logger.error(f"Error collecting from Pexels: {e}")
 
     logger.info(f"Downloaded {downloaded} images from Pexels")
-
-    response = collector.session.get(search_url)
-    soup = BeautifulSoup(response.content, 'html.parser')
-    print(soup.prettify()[:1000])  # print first 1000 chars of HTML
     return collector
@@ -2,11 +2,11 @@ import time
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.common.by import By
-from bs4 import BeautifulSoup
 import tempfile
+from utils.html_extract import extract_image_urls, save_page
 from .base_collector import SimplePhotoCollector, logger
 
-def collect_from_pexels(headless: bool = True, max_images_per_term: int = 10):
+def collect_from_pexels(headless: bool = True, max_images_per_term: int = 10, save_pages_dir=None):
     collector = SimplePhotoCollector()
 
     # Setup headless Selenium
@@ -47,24 +47,25 @@ def collect_from_pexels(headless: bool = True, max_images_per_term: int = 10):
                 driver.execute_script("window.scrollBy(0, document.body.scrollHeight);")
                 time.sleep(2)
 
-            soup = BeautifulSoup(driver.page_source, "html.parser")
-            img_elements = soup.find_all('img', {'class': lambda x: x and 'photo-item' in str(x)})[:max_images_per_term]
+            page_source = driver.page_source
+            if save_pages_dir:
+                save_page(save_pages_dir, f"pexels_{term}", page_source)
+            img_urls = extract_image_urls(page_source, class_contains="photo-item",
+                                          limit=max_images_per_term, base_url=search_url)
 
             downloaded = 0
-            for img in img_elements:
-                src = img.get("src") or img.get("data-src")
-                if not src or src in collector.downloaded_urls:
+            for src in img_urls:
+                if src in collector.downloaded_urls:
                     continue
 
                 filename = collector.generate_filename(src, f"pexels_{term.replace(' ', '_')}")
-                if collector.download_image(src, filename):
+                if collector.download_image(src, filename, record={
+                    "filename": filename,
+                    "source_url": src,
+                    "source": "pexels",
+                    "search_term": term
+                }):
                     collector.downloaded_urls.add(src)
-                    collector.metadata.append({
-                        "filename": filename,
-                        "source_url": src,
-                        "source": "pexels",
-                        "search_term": term
-                    })
                     downloaded += 1
                     total_downloaded += 1
 
@@ -3,8 +3,14 @@ from pathlib import Path
 import hashlib
 import logging
 import time
+from typing import Dict, Optional
 import cv2
 import numpy as np
+from utils.ingest import ingest_stage
+from utils.logs import ProgressReporter
+from utils.profiling import span
+from utils.records import MetadataBuffer
+from utils.writer import ImageWriter
 
 logger = logging.getLogger(__name__)
 
@@ -20,27 +26,47 @@ class RealEstatePhotoCollector:
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64)'
         })
         self.collected_urls = set()
-        self.metadata = []
+        self.metadata = MetadataBuffer()
+        self.ingest = ingest_stage(self.output_dir)
+        self.writer = ImageWriter(self.output_dir / "images")
+        self.progress = ProgressReporter(type(self).__name__, logger=logger)
 
-    def download_image(self, url: str, filename: str) -> bool:
+    @span('download_image')
+    def download_image(self, url: str, filename: str, record: Optional[Dict] = None) -> int:
+        """Validate and queue the image for the writer; `record` joins self.metadata once the file is durable and scored
+
+        Returns the number of bytes queued, 0 when the image was rejected.
+        """
         try:
             response = self.session.get(url, timeout=10)
             response.raise_for_status()
             if len(response.content) < 1024:
-                return False
+                self.progress.add('rejected')
+                return 0
             img_array = np.frombuffer(response.content, dtype=np.uint8)
             img = cv2.imdecode(img_array, cv2.IMREAD_COLOR)
             if img is None or img.shape[0] < 300 or img.shape[1] < 300:
-                return False
-            filepath = self.output_dir / "images" / filename
-            with open(filepath, 'wb') as f:
-                f.write(response.content)
-            logger.info(f"Downloaded: {filename} ({img.shape[1]}x{img.shape[0]})")
-            return True
+                self.progress.add('rejected')
+                return 0
+            # once durable the file is scored, and only then is its record committed
+            on_commit = lambda: self.ingest.submit(filename, record, self.metadata.append)
+            self.writer.submit(filename, response.content, on_commit)
+            logger.debug("Downloaded: %s (%dx%d)", filename, img.shape[1], img.shape[0])
+            self.progress.add('images')
+            self.progress.add('mb', len(response.content) / 1024 ** 2)
+            return len(response.content)
         except Exception as e:
             logger.error(f"Error downloading {url}: {e}")
-            return False
+            self.progress.add('errors')
+            return 0
+
+    def flush(self):
+        """Wait until every queued image is on disk, scored and its metadata record committed"""
+        self.writer.flush()
+        self.ingest.flush()
+        self.progress.report(final=True)
 
+    @span('generate_filename')
     def generate_filename(self, url: str, source: str) -> str:
         url_hash = hashlib.md5(url.encode()).hexdigest()[:8]
         extension = url.split('.')[-1].lower()
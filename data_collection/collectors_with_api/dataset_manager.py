@@ -14,7 +14,13 @@ from selenium.webdriver.common.by import By
 from selenium.webdriver.chrome.options import Options
 import cv2
 import numpy as np
+from utils.profiling import span
+from utils.quality import score_metadata
+from utils.records import MetadataBuffer
+from utils.similarity import SimilarityIndex
+from utils.thumbnails import ThumbnailStore, contact_sheets
 
+logger = logging.getLogger(__name__)
 
 class DatasetManager:
     """Manage the collected dataset"""
@@ -22,11 +28,66 @@ class DatasetManager:
     def __init__(self, dataset_dir: str = "real_estate_dataset"):
         self.dataset_dir = Path(dataset_dir)
     
-    def save_metadata(self, metadata: List[Dict]):
-        """Save metadata to CSV"""
-        df = pd.DataFrame(metadata)
+    @span('save_metadata')
+    def save_metadata(self, metadata, score_quality: bool = True, index_similarity: bool = True,
+                      thumbnails: bool = True):
+        """Save a MetadataBuffer (or list of dicts) to CSV after scoring quality, indexing for similarity search
+        and packing thumbnails"""
+        if score_quality:
+            # collectors score at ingest; this only fills in records that bypassed it
+            score_metadata(metadata, self.dataset_dir / "images", missing_only=True)
+        if not isinstance(metadata, MetadataBuffer):
+            metadata = MetadataBuffer(metadata)
+        filenames = [name for name in metadata.column('filename') if name]
+        # collectors index and pack thumbnails at ingest; this only adds images that bypassed it
+        if index_similarity:
+            self.index_images(filenames)
+        if thumbnails:
+            self.thumbnail_store().add_files(self.dataset_dir / "images", filenames)
+        # Arrow-backed frame over the buffer's columns, no second copy of the records
+        df = metadata.to_pandas()
         df.to_csv(self.dataset_dir / "metadata" / "dataset_metadata.csv", index=False)
         logger.info(f"Saved metadata for {len(metadata)} images")
+
+    def similarity_index(self) -> SimilarityIndex:
+        return SimilarityIndex(self.dataset_dir / "index")
+
+    def index_images(self, filenames: Optional[List[str]] = None) -> int:
+        """Add descriptors of images not indexed yet (default: every image in the dataset)"""
+        images_dir = self.dataset_dir / "images"
+        if filenames is None:
+            filenames = sorted(f.name for f in images_dir.glob("*") if f.suffix.lower() in ('.jpg', '.jpeg', '.png'))
+        return self.similarity_index().add_files(images_dir, filenames)
+
+    def thumbnail_store(self) -> ThumbnailStore:
+        return ThumbnailStore(self.dataset_dir / "thumbnails")
+
+    def create_contact_sheets(self, group_by: str = 'source', per_sheet: int = 100) -> Dict[str, List[Path]]:
+        """Contact sheet JPEGs per source or search term, rendered from packed thumbnails only"""
+        metadata_file = self.dataset_dir / "metadata" / "dataset_metadata.csv"
+        if not metadata_file.exists():
+            return {}
+        records = pd.read_csv(metadata_file).to_dict('records')
+        store = self.thumbnail_store()
+        # collectors pack thumbnails at ingest; images saved before that are packed on first use
+        store.add_files(self.dataset_dir / "images",
+                        [r['filename'] for r in records if isinstance(r.get('filename'), str)])
+        return contact_sheets(store, records, group_by, self.dataset_dir / "contact_sheets" / group_by, per_sheet)
+
+    def find_similar(self, query, k: int = 20) -> List[Dict]:
+        """Images most similar to `query` (an image path or a dataset filename), with their metadata
+
+        Use it to find more examples like a hard case, e.g. an unusual TV
+        cabinet or a fake fireplace insert.
+        """
+        matches = self.similarity_index().search(query, k)
+        metadata_file = self.dataset_dir / "metadata" / "dataset_metadata.csv"
+        rows = {}
+        if metadata_file.exists():
+            df = pd.read_csv(metadata_file)
+            rows = df.set_index('filename').to_dict('index') if 'filename' in df.columns else {}
+        return [dict(rows.get(filename, {}), filename=filename, similarity=similarity)
+                for filename, similarity in matches]
     
     def filter_by_keywords(self, keywords: List[str]) -> List[str]:
         """Filter images that likely contain TVs/fireplaces"""
@@ -45,9 +106,39 @@ class DatasetManager:
                 filtered_files.append(filename)
         
         return filtered_files
+
+    def filter_by_quality(self, min_score: int = 3) -> List[str]:
+        """Filenames whose quality_score is at least `min_score`"""
+        metadata_file = self.dataset_dir / "metadata" / "dataset_metadata.csv"
+        if not metadata_file.exists():
+            return []
+
+        df = pd.read_csv(metadata_file)
+        if 'quality_score' not in df.columns:
+            return df['filename'].tolist()
+        return df.loc[df['quality_score'] >= min_score, 'filename'].tolist()
     
-    def create_annotation_template(self):
-        """Create template for manual annotation"""
+    def create_annotation_template(self, min_quality: int = 0):
+        """Create template for manual annotation, one row per image, best quality first"""
+        metadata_file = self.dataset_dir / "metadata" / "dataset_metadata.csv"
+        if metadata_file.exists():
+            df = pd.read_csv(metadata_file)
+            if 'quality_score' not in df.columns:
+                df['quality_score'] = 0
+            df = df[df['quality_score'].fillna(0) >= min_quality]
+            template_df = pd.DataFrame({
+                'filename': df['filename'],
+                'tv_present': False,
+                'fireplace_present': False,
+                'tv_bbox': '',
+                'fireplace_bbox': '',
+                'room_type': '',
+                'quality_score': df['quality_score'].fillna(0).astype(int),
+            }).sort_values('quality_score', ascending=False, kind='stable')
+            template_df.to_csv(self.dataset_dir / "annotations" / "annotation_template.csv", index=False)
+            logger.info(f"Created annotation template with {len(template_df)} images")
+            return
+
         template = {
             'filename': '',
             'tv_present': False,
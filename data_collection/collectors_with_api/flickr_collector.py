@@ -30,17 +30,17 @@ class FlickrCollector(RealEstatePhotoCollector):
                     img_url = photo.get('url_b') or photo.get('url_c')
                     if img_url and img_url not in self.collected_urls:
                         filename = self.generate_filename(img_url, 'flickr')
-                        if self.download_image(img_url, filename):
+                        if self.download_image(img_url, filename, record={
+                            'filename': filename,
+                            'source_url': img_url,
+                            'flickr_id': photo['id'],
+                            'title': photo.get('title', ''),
+                            'source': 'flickr',
+                            'search_term': tags,
+                            'downloaded_at': time.time()
+                        }):
                             self.collected_urls.add(img_url)
                             downloaded += 1
-                            self.metadata.append({
-                                'filename': filename,
-                                'source_url': img_url,
-                                'flickr_id': photo['id'],
-                                'title': photo.get('title', ''),
-                                'source': 'flickr',
-                                'downloaded_at': time.time()
-                            })
                 time.sleep(1)
             except Exception as e:
                 logger.error(f"Error searching Flickr: {e}")
@@ -1,13 +1,16 @@
+import argparse
 import logging
 from collectors.unsplash_collector import UnsplashCollector
 from collectors.flickr_collector import FlickrCollector
 from dataset_manager import DatasetManager
+from utils.logs import setup_logging
+from utils.profiling import MODES, maybe_profile
+from utils.records import MetadataBuffer
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 def collect_dataset():
-    all_metadata = []
+    all_metadata = MetadataBuffer()
 
     UNSPLASH_API_KEY = "YOUR_UNSPLASH_API_KEY"
     if UNSPLASH_API_KEY != "YOUR_UNSPLASH_API_KEY":
@@ -16,7 +19,8 @@ def collect_dataset():
         for q in queries:
             downloaded = unsplash.search_photos(q, per_page=30, pages=3)
             logger.info(f"Downloaded {downloaded} Unsplash images for '{q}'")
-            all_metadata.extend(unsplash.metadata)
+        unsplash.flush()
+        all_metadata.extend(unsplash.metadata)
 
     FLICKR_API_KEY = "YOUR_FLICKR_API_KEY"
     if FLICKR_API_KEY != "YOUR_FLICKR_API_KEY":
@@ -25,7 +29,8 @@ def collect_dataset():
         for tags in tags_list:
             downloaded = flickr.search_photos(tags, per_page=50, pages=2)
             logger.info(f"Downloaded {downloaded} Flickr images for tags '{tags}'")
-            all_metadata.extend(flickr.metadata)
+        flickr.flush()
+        all_metadata.extend(flickr.metadata)
 
     if all_metadata:
         manager = DatasetManager()
@@ -37,4 +42,12 @@ def collect_dataset():
         logger.warning("No images collected. Make sure API keys are set!")
 
 if __name__ == "__main__":
-    collect_dataset()
+    parser = argparse.ArgumentParser(description="Collect photos through the Unsplash and Flickr APIs")
+    parser.add_argument("--log-format", choices=["json", "text"], default="json")
+    parser.add_argument("--log-level", default="INFO", help="DEBUG adds sampled per-image lines")
+    parser.add_argument("--profile", choices=MODES, help="profile the run with cProfile or the stack sampler")
+    parser.add_argument("--profile-dir", default="real_estate_dataset/metadata/profile")
+    args = parser.parse_args()
+    setup_logging(args.log_level, args.log_format, log_file="real_estate_dataset/metadata/collection.log.jsonl")
+    with maybe_profile(args.profile, args.profile_dir):
+        collect_dataset()
@@ -20,17 +20,17 @@ class UnsplashCollector(RealEstatePhotoCollector):
                     img_url = photo['urls']['regular']
                     if img_url not in self.collected_urls:
                         filename = self.generate_filename(img_url, 'unsplash')
-                        if self.download_image(img_url, filename):
+                        if self.download_image(img_url, filename, record={
+                            'filename': filename,
+                            'source_url': img_url,
+                            'unsplash_id': photo['id'],
+                            'description': photo.get('description', ''),
+                            'source': 'unsplash',
+                            'search_term': query,
+                            'downloaded_at': time.time()
+                        }):
                             self.collected_urls.add(img_url)
                             downloaded += 1
-                            self.metadata.append({
-                                'filename': filename,
-                                'source_url': img_url,
-                                'unsplash_id': photo['id'],
-                                'description': photo.get('description', ''),
-                                'source': 'unsplash',
-                                'downloaded_at': time.time()
-                            })
                 time.sleep(1)
             except Exception as e:
                 logger.error(f"Error searching Unsplash: {e}")
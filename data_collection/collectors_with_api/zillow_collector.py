@@ -4,13 +4,56 @@ from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.common.by import By
 import time
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+from utils.html_extract import save_page
+from utils.zillow_extract import extract_gallery, extract_listings, merge_listings, search_url
 
 logger = logging.getLogger(__name__)
 
+
+class SeleniumFetcher:
+    """fetch(url) -> page source, with one browser per worker thread
+
+    WebDriver sessions are not thread-safe, so each thread lazily starts its
+    own and keeps it for every page it loads; close() quits them all.
+    """
+
+    def __init__(self, setup: Callable[[], webdriver.Chrome], render_wait: float = 3.0, pause: float = 2.0):
+        self.setup = setup
+        self.render_wait = render_wait
+        self.pause = pause  # politeness delay after each page, per browser
+        self._local = threading.local()
+        self._drivers = []
+        self._lock = threading.Lock()
+
+    def __call__(self, url: str) -> str:
+        driver = getattr(self._local, 'driver', None)
+        if driver is None:
+            driver = self._local.driver = self.setup()
+            with self._lock:
+                self._drivers.append(driver)
+        driver.get(url)
+        time.sleep(self.render_wait)
+        html = driver.page_source
+        time.sleep(self.pause)
+        return html
+
+    def close(self):
+        with self._lock:
+            drivers, self._drivers = self._drivers, []
+        for driver in drivers:
+            try:
+                driver.quit()
+            except Exception as e:
+                logger.warning(f"Could not quit browser: {e}")
+
 class ZillowCollector(RealEstatePhotoCollector):
     def __init__(self, output_dir: str = "real_estate_dataset"):
         super().__init__(output_dir)
         self.base_url = "https://www.zillow.com"
+        self._urls_lock = threading.Lock()  # collect_listings shares collected_urls across threads
 
     def setup_selenium(self, headless: bool = True):
         chrome_options = Options()
@@ -53,19 +96,115 @@ class ZillowCollector(RealEstatePhotoCollector):
                 img_url = img_element.get_attribute('src')
                 if img_url and img_url not in self.collected_urls:
                     filename = self.generate_filename(img_url, 'zillow')
-                    if self.download_image(img_url, filename):
+                    if self.download_image(img_url, filename, record={
+                        'filename': filename,
+                        'source_url': img_url,
+                        'property_url': property_url,
+                        'source': 'zillow',
+                        'downloaded_at': time.time()
+                    }):
                         self.collected_urls.add(img_url)
                         downloaded += 1
-                        self.metadata.append({
-                            'filename': filename,
-                            'source_url': img_url,
-                            'property_url': property_url,
-                            'source': 'zillow',
-                            'downloaded_at': time.time()
-                        })
                 time.sleep(1)
             driver.quit()
             return downloaded
         except Exception as e:
             logger.error(f"Error collecting from {property_url}: {e}")
             return downloaded
+
+    def search_listings(self, locations: List[str], pages: int = 5, workers: int = 4,
+                        fetch: Optional[Callable[[str], str]] = None, save_pages_dir=None) -> List[Dict]:
+        """Search (location, page) shards in parallel and read listings from the embedded search JSON
+
+        Returns [{'zpid', 'url', 'photos'}] deduped by zpid across every
+        location, in (page, location) order whatever the completion order.
+        A location stops at its first page without listings. `fetch(url)`
+        defaults to a browser per worker; pass fixture_fetcher(dir) to run on
+        saved pages.
+        """
+        own_fetch = fetch is None
+        fetch = fetch or SeleniumFetcher(self.setup_selenium)
+        # page-major, so every location's early pages go first and an exhausted location stops early
+        tasks = [(location, page) for page in range(1, pages + 1) for location in locations]
+        last_page = {location: pages for location in locations}
+        lock = threading.Lock()
+
+        def run(task):
+            location, page = task
+            with lock:
+                if page > last_page[location]:
+                    return []
+            url = search_url(location, page, self.base_url)
+            try:
+                html = fetch(url)
+            except Exception as e:
+                logger.error(f"Error searching Zillow {url}: {e}")
+                return []
+            if save_pages_dir:
+                save_page(save_pages_dir, url, html)
+            listings = extract_listings(html, self.base_url)
+            if not listings:
+                with lock:
+                    last_page[location] = min(last_page[location], page - 1)
+            logger.debug("%s page %d: %d listings", location, page, len(listings))
+            return listings
+
+        start = time.perf_counter()
+        try:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='zillow-search') as pool:
+                results = list(pool.map(run, tasks))
+        finally:
+            if own_fetch:
+                fetch.close()
+        listings = merge_listings(results)
+        logger.info(f"Found {len(listings)} unique properties from {sum(map(len, results))} results on "
+                    f"{sum(1 for r in results if r)} pages in {time.perf_counter() - start:.1f}s")
+        return listings
+
+    def collect_listing_photos(self, listing: Dict, max_photos: Optional[int] = None,
+                               fetch: Optional[Callable[[str], str]] = None) -> int:
+        """Download a listing's gallery: the full one from its page when `fetch` is given, else the card photos"""
+        photos = listing['photos']
+        if fetch is not None:
+            try:
+                photos = extract_gallery(fetch(listing['url'])) or photos
+            except Exception as e:
+                logger.error(f"Error loading gallery of {listing['url']}: {e}")
+        downloaded = 0
+        for img_url in photos[:max_photos]:
+            # claim the URL before downloading, so two listings sharing a photo never fetch it twice
+            with self._urls_lock:
+                if img_url in self.collected_urls:
+                    continue
+                self.collected_urls.add(img_url)
+            filename = self.generate_filename(img_url, 'zillow')
+            if self.download_image(img_url, filename, record={
+                'filename': filename,
+                'source_url': img_url,
+                'property_url': listing['url'],
+                'zpid': listing['zpid'],
+                'source': 'zillow',
+                'downloaded_at': time.time()
+            }):
+                downloaded += 1
+            else:
+                with self._urls_lock:
+                    self.collected_urls.discard(img_url)
+        return downloaded
+
+    def collect_listings(self, listings: List[Dict], max_photos: Optional[int] = None, workers: int = 4,
+                         full_gallery: bool = True, fetch: Optional[Callable[[str], str]] = None) -> int:
+        """collect_listing_photos over many listings in parallel; with full_gallery each listing page is loaded"""
+        own_fetch = full_gallery and fetch is None
+        if own_fetch:
+            fetch = SeleniumFetcher(self.setup_selenium)
+        try:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='zillow-gallery') as pool:
+                counts = list(pool.map(lambda l: self.collect_listing_photos(l, max_photos,
+                                                                             fetch if full_gallery else None),
+                                       listings))
+        finally:
+            if own_fetch:
+                fetch.close()
+        logger.info(f"Downloaded {sum(counts)} photos from {len(listings)} properties")
+        return sum(counts)
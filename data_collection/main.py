@@ -1,19 +1,71 @@
+import argparse
 import time
-from collectors.open_datasets import collect_from_open_datasets
+from collectors.base_collector import SimplePhotoCollector
+from collectors.open_datasets import collect_from_open_datasets, sample_jobs
+from collectors.pexels_dataset import pexels_jobs
 from collectors.pexels_dataset_with_Selenium import collect_from_pexels
-from collectors.coco_dataset import collect_sample_coco_tv #collect_from_coco_tv #create_coco_tv_subset #
+from collectors.coco_dataset import collect_sample_coco_tv, coco_jobs, coco_sample_ids #collect_from_coco_tv #create_coco_tv_subset #
+from utils.logs import setup_logging
 from utils.metadata import save_metadata
+from utils.profiling import MODES, maybe_profile
+from utils.scheduler import CrawlScheduler, SourceQuota
 from collectors.base_collector import logger
 
+# Scheduled mode: share of each source, its budget and the per-class targets
+SOURCE_QUOTAS = {
+    "coco_dataset": SourceQuota(weight=1.0, max_images=1000, requests_per_minute=120),
+    "pexels": SourceQuota(weight=2.0, requests_per_minute=30),
+    "sample_dataset": SourceQuota(weight=0.5, requests_per_minute=60),
+}
+PEXELS_TERMS = {"living room tv": "tv", "fireplace interior": "fireplace", "modern living room": "living_room"}
+CATEGORY_TARGETS = {"tv": 2000, "fireplace": 2000}
+MAX_IMAGES_PER_TERM = 10
+
+def collect_scheduled(workers: int = 4):
+    """Run every source in one collector under the fair-share scheduler"""
+    collector = SimplePhotoCollector()
+    scheduler = CrawlScheduler(SOURCE_QUOTAS, CATEGORY_TARGETS)
+    scheduler.add_stream("sample_dataset", "samples", sample_jobs(collector), category="living_room")
+    for term, category in PEXELS_TERMS.items():
+        scheduler.add_stream("pexels", term, pexels_jobs(collector, term, category=category),
+                             category=category, max_images=MAX_IMAGES_PER_TERM)
+    try:
+        scheduler.add_stream("coco_dataset", "train2017_sample", coco_jobs(collector, coco_sample_ids()),
+                             category="tv")
+    except Exception as e:
+        logger.error(f"COCO source unavailable: {e}")
+    scheduler.run(workers)
+    return collector
+
 def main():
+    parser = argparse.ArgumentParser(description="Collect real estate photos")
+    parser.add_argument("--scheduled", action="store_true",
+                        help="run all sources together under per-source quotas and category targets")
+    parser.add_argument("--workers", type=int, default=4, help="concurrent downloads in scheduled mode")
+    parser.add_argument("--log-format", choices=["json", "text"], default="json")
+    parser.add_argument("--log-level", default="INFO", help="DEBUG adds sampled per-image lines")
+    parser.add_argument("--profile", choices=MODES, help="profile the run: cprofile (main thread, exact counts) "
+                        "or sample (all threads, low overhead); both add tracemalloc and span timings")
+    parser.add_argument("--profile-dir", help="profile reports, default real_estate_photos/logs/profile-<time>")
+    args = parser.parse_args()
+    setup_logging(args.log_level, args.log_format, log_file="real_estate_photos/logs/collection.log.jsonl")
+    profile_dir = args.profile_dir or f"real_estate_photos/logs/profile-{time.strftime('%Y%m%d-%H%M%S')}"
+
     logger.info("=== Starting Real Estate Photo Collection ===")
+    with maybe_profile(args.profile, profile_dir):
+        collect(args)
+
+def collect(args):
     collectors = []
     try:
-        #collectors.append(collect_from_open_datasets()); time.sleep(2)
-        #collectors.append(collect_from_pexels()); time.sleep(2)
-        # COCO_PATH = "/workspaces/Real-estate-Photo-editor/data_collection/real_estate_photos/images/coco_data"
-        # collectors.append(collect_from_coco_tv(COCO_PATH))
-        collectors.append(collect_sample_coco_tv())
+        if args.scheduled:
+            collectors.append(collect_scheduled(args.workers))
+        else:
+            #collectors.append(collect_from_open_datasets()); time.sleep(2)
+            #collectors.append(collect_from_pexels()); time.sleep(2)
+            # COCO_PATH = "/workspaces/Real-estate-Photo-editor/data_collection/real_estate_photos/images/coco_data"
+            # collectors.append(collect_from_coco_tv(COCO_PATH))
+            collectors.append(collect_sample_coco_tv())
     except Exception as e:
         logger.error(f"Collection error: {e}")
 
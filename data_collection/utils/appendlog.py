@@ -0,0 +1,68 @@
+"""
+Append-only name logs for the on-disk stores
+One JSON string per line; the log's length is the commit point of the rows a store writes beside it
+"""
+
+import json
+import os
+from pathlib import Path
+from typing import Dict, List, Sequence
+
+
+class NameLog:
+    """Row -> name list of a store, appended line by line instead of rewritten
+
+    A store writes its rows first and appends their names last, so a row is
+    live only once its name line is complete: a crash leaves at most a torn
+    last line, which is ignored on read and cut by the next append.
+    refresh() reads only the lines appended (by this or another instance on
+    the same file) since the last call, so keeping up costs nothing per
+    existing name.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.names: List[str] = []
+        self.rows: Dict[str, int] = {}
+        self._size = 0  # bytes of complete lines read so far
+        self.refresh()
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def refresh(self) -> bool:
+        """Pick up names committed since the last refresh or append; True when there were any"""
+        try:
+            size = os.stat(self.path).st_size
+        except FileNotFoundError:
+            return False
+        if size == self._size:
+            return False
+        if size < self._size:
+            # cut or replaced underneath us, read it again
+            self.names, self.rows, self._size = [], {}, 0
+        with open(self.path, 'rb') as f:
+            f.seek(self._size)
+            data = f.read(size - self._size)
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].splitlines():
+            name = json.loads(line)
+            self.rows[name] = len(self.names)
+            self.names.append(name)
+        self._size += end
+        return end > 0
+
+    def append(self, names: Sequence[str]):
+        """Commit `names` as the next rows, after the rows themselves are written"""
+        if not len(names):
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, 'ab') as f:
+            if f.tell() != self._size:
+                f.truncate(self._size)
+            data = "".join(json.dumps(name) + "\n" for name in names).encode()
+            f.write(data)
+        for name in names:
+            self.rows[name] = len(self.names)
+            self.names.append(name)
+        self._size += len(data)
@@ -0,0 +1,209 @@
+"""
+COCO -> training label export
+Writes YOLO txt files and a COCO-subset JSON for the target categories in one vectorized pass
+"""
+
+import json
+import re
+import time
+import logging
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Union
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# COCO category name -> training class id
+DEFAULT_CLASS_MAP = {'tv': 0}
+
+_COCO_ID_PATTERN = re.compile(r"(\d{12})\.jpg")
+
+
+def image_ids_from_metadata(metadata: Iterable[Dict]) -> Dict[int, str]:
+    """Map COCO image id -> collected filename stem from collector metadata"""
+    stems = {}
+    for item in metadata:
+        coco_id = item.get('coco_id')
+        if coco_id is None:
+            match = _COCO_ID_PATTERN.search(item.get('source_url', ''))
+            if not match:
+                continue
+            coco_id = int(match.group(1))
+        stems[int(coco_id)] = Path(item['filename']).stem
+    return stems
+
+
+class CocoLabelExporter:
+    """Holds the COCO annotations as flat NumPy arrays for fast label export"""
+
+    def __init__(self, annotations: Union[str, Path, Dict], class_map: Optional[Dict[str, int]] = None):
+        start = time.perf_counter()
+        if not isinstance(annotations, dict):
+            with open(annotations) as f:
+                annotations = json.load(f)
+        self.dataset = annotations
+        self.class_map = dict(class_map or DEFAULT_CLASS_MAP)
+
+        cats = annotations['categories']
+        self.category_names = {c['id']: c['name'] for c in cats}
+        missing = set(self.class_map) - set(self.category_names.values())
+        if missing:
+            raise ValueError(f"Categories not in COCO annotations: {sorted(missing)}")
+
+        # COCO category id -> training class id, -1 for categories we do not export
+        self.class_lookup = np.full(max(self.category_names) + 1, -1, dtype=np.int64)
+        for cat_id, name in self.category_names.items():
+            if name in self.class_map:
+                self.class_lookup[cat_id] = self.class_map[name]
+
+        images = annotations['images']
+        order = np.argsort(np.fromiter((img['id'] for img in images), dtype=np.int64, count=len(images)))
+        self.images = [images[i] for i in order]
+        self.image_ids = np.fromiter((img['id'] for img in self.images), dtype=np.int64, count=len(images))
+        self.image_wh = np.array([(img['width'], img['height']) for img in self.images], dtype=np.float64).reshape(-1, 2)
+
+        anns = annotations['annotations']
+        self.ann_image_ids = np.fromiter((a['image_id'] for a in anns), dtype=np.int64, count=len(anns))
+        self.ann_category_ids = np.fromiter((a['category_id'] for a in anns), dtype=np.int64, count=len(anns))
+        self.ann_crowd = np.fromiter((a.get('iscrowd', 0) for a in anns), dtype=bool, count=len(anns))
+        self.ann_area = np.fromiter((a.get('area', 0.0) for a in anns), dtype=np.float64, count=len(anns))
+        self.ann_bbox = np.array([a['bbox'] for a in anns], dtype=np.float64).reshape(-1, 4)
+        logger.info(f"Loaded {len(images)} images / {len(anns)} annotations in {time.perf_counter() - start:.2f}s")
+
+    def _select(self, image_ids: Optional[Iterable[int]] = None, include_crowd: bool = False):
+        """Indices of exported annotations (sorted by image) and their class ids"""
+        classes = self.class_lookup[self.ann_category_ids]
+        keep = (classes >= 0) & (self.ann_bbox[:, 2] > 0) & (self.ann_bbox[:, 3] > 0)
+        if not include_crowd:
+            keep &= ~self.ann_crowd
+        if image_ids is not None:
+            keep &= np.isin(self.ann_image_ids, np.fromiter(image_ids, dtype=np.int64))
+        idx = np.flatnonzero(keep)
+        idx = idx[np.argsort(self.ann_image_ids[idx], kind='stable')]
+        return idx, classes[idx]
+
+    def _image_rows(self, image_ids: np.ndarray) -> np.ndarray:
+        rows = np.searchsorted(self.image_ids, image_ids)
+        rows = np.minimum(rows, len(self.image_ids) - 1)
+        if not np.array_equal(self.image_ids[rows], image_ids):
+            raise KeyError("Annotations reference image ids missing from 'images'")
+        return rows
+
+    def yolo_labels(self, image_ids: Optional[Iterable[int]] = None):
+        """Return (image_ids, rows) where rows is (N, 5) [class, cx, cy, w, h] normalized"""
+        idx, classes = self._select(image_ids)
+        ann_images = self.ann_image_ids[idx]
+        wh = self.image_wh[self._image_rows(ann_images)]
+        boxes = self.ann_bbox[idx]
+
+        rows = np.empty((len(idx), 5), dtype=np.float64)
+        rows[:, 0] = classes
+        rows[:, 1:3] = (boxes[:, :2] + boxes[:, 2:] / 2) / wh
+        rows[:, 3:5] = boxes[:, 2:] / wh
+        np.clip(rows[:, 1:], 0.0, 1.0, out=rows[:, 1:])
+        return ann_images, rows
+
+    def export_yolo(self, out_dir, image_ids: Optional[Iterable[int]] = None,
+                    stems: Optional[Dict[int, str]] = None, include_empty: bool = False) -> int:
+        """Write one YOLO txt per image, named after `stems` (default: COCO file name)"""
+        start = time.perf_counter()
+        out_dir = Path(out_dir)
+        out_dir.mkdir(parents=True, exist_ok=True)
+        if image_ids is None and stems is not None:
+            image_ids = list(stems)
+        elif image_ids is not None:
+            image_ids = list(image_ids)
+
+        ann_images, rows = self.yolo_labels(image_ids)
+        labelled, first = np.unique(ann_images, return_index=True)
+        bounds = np.append(first, len(ann_images))
+
+        def stems_of(ids):
+            if stems is not None:
+                return [stems[i] for i in ids]
+            return [Path(self.images[row]['file_name']).stem for row in self._image_rows(np.asarray(ids, dtype=np.int64))]
+
+        # One format call per image, the row loop happens inside the % operator
+        line = "%d %.6f %.6f %.6f %.6f\n"
+        for stem, lo, hi in zip(stems_of(labelled.tolist()), bounds[:-1].tolist(), bounds[1:].tolist()):
+            (out_dir / f"{stem}.txt").write_text((line * (hi - lo)) % tuple(rows[lo:hi].ravel()))
+
+        written = len(labelled)
+        if include_empty and image_ids is not None:
+            empty = sorted(set(int(i) for i in image_ids) - set(labelled.tolist()))
+            for stem in stems_of(empty):
+                (out_dir / f"{stem}.txt").write_text("")
+            written += len(empty)
+
+        logger.info(f"Wrote {len(rows)} YOLO boxes for {written} images in {time.perf_counter() - start:.2f}s")
+        return written
+
+    def export_coco_subset(self, out_path, image_ids: Optional[Iterable[int]] = None,
+                           stems: Optional[Dict[int, str]] = None) -> Dict:
+        """Write a COCO JSON with only the selected images and target categories
+
+        Category ids in the output are the training class ids.
+        """
+        if image_ids is None and stems is not None:
+            image_ids = list(stems)
+        elif image_ids is not None:
+            image_ids = list(image_ids)
+        idx, classes = self._select(image_ids, include_crowd=True)
+
+        if image_ids is None:
+            selected = np.unique(self.ann_image_ids[idx])
+        else:
+            selected = np.intersect1d(np.fromiter(image_ids, dtype=np.int64), self.image_ids)
+        images = []
+        for row in self._image_rows(selected).tolist():
+            image = dict(self.images[row])
+            if stems is not None:
+                image['file_name'] = f"{stems[image['id']]}{Path(image['file_name']).suffix}"
+            images.append(image)
+
+        annotations = [
+            {'id': i + 1, 'image_id': image_id, 'category_id': cls, 'bbox': bbox, 'area': area, 'iscrowd': crowd}
+            for i, (image_id, cls, bbox, area, crowd) in enumerate(zip(
+                self.ann_image_ids[idx].tolist(), classes.tolist(), self.ann_bbox[idx].tolist(),
+                self.ann_area[idx].tolist(), self.ann_crowd[idx].astype(int).tolist()))
+        ]
+        subset = {
+            'images': images,
+            'annotations': annotations,
+            'categories': [{'id': cls, 'name': name} for name, cls in sorted(self.class_map.items(), key=lambda x: x[1])],
+        }
+        out_path = Path(out_path)
+        out_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(out_path, 'w') as f:
+            json.dump(subset, f)
+        logger.info(f"Wrote COCO subset with {len(images)} images / {len(annotations)} annotations to {out_path}")
+        return subset
+
+
+def parse_class_map(specs: List[str]) -> Dict[str, int]:
+    """Parse ["tv=0", "couch=1"] into {"tv": 0, "couch": 1}"""
+    class_map = {}
+    for spec in specs:
+        name, _, cls = spec.rpartition('=')
+        class_map[name] = int(cls)
+    return class_map
+
+
+if __name__ == "__main__":
+    import argparse
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Export COCO boxes as YOLO txt + COCO subset labels")
+    parser.add_argument("annotations", help="e.g. instances_train2017.json")
+    parser.add_argument("out_dir")
+    parser.add_argument("--classes", nargs="+", default=["tv=0"], help="COCO name=class id pairs")
+    parser.add_argument("--metadata", help="collector metadata.json; restricts export to collected images")
+    args = parser.parse_args()
+
+    stems = None
+    if args.metadata:
+        with open(args.metadata) as f:
+            stems = image_ids_from_metadata(json.load(f))
+    exporter = CocoLabelExporter(args.annotations, parse_class_map(args.classes))
+    exporter.export_yolo(Path(args.out_dir) / "labels", stems=stems)
+    exporter.export_coco_subset(Path(args.out_dir) / "annotations.json", stems=stems)
@@ -0,0 +1,195 @@
+"""
+Fast image URL extraction for search result pages
+Only img/source nodes are materialized, and the largest srcset candidate wins
+"""
+
+import io
+import re
+import time
+import logging
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+from urllib.parse import urljoin
+
+logger = logging.getLogger(__name__)
+
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:
+    LexborHTMLParser = None
+
+try:
+    from lxml import etree
+except ImportError:
+    etree = None
+
+IMAGE_TAGS = ("img", "source")
+SRCSET_ATTRS = ("srcset", "data-srcset")
+SRC_ATTRS = ("src", "data-src")
+
+# url = run of non-whitespace not ending in a comma, descriptors run up to the next comma
+_SRCSET_CANDIDATE = re.compile(r"([^\s,](?:\S*[^\s,])?)(?:,|\s*([^,]*))")
+
+
+def available_backends() -> List[str]:
+    """Parser backends usable in this environment, fastest first"""
+    backends = []
+    if LexborHTMLParser is not None:
+        backends.append("selectolax")
+    if etree is not None:
+        backends.append("lxml")
+    backends.append("bs4")
+    return backends
+
+
+def _nodes_selectolax(html) -> Iterable[Dict[str, str]]:
+    tree = LexborHTMLParser(html)
+    for node in tree.css("img, source"):
+        yield node.attributes
+
+
+def _nodes_lxml(html) -> Iterable[Dict[str, str]]:
+    if isinstance(html, str):
+        html = html.encode("utf-8")
+    # iterparse with a tag filter only hands back the nodes we care about
+    for _, element in etree.iterparse(io.BytesIO(html), events=("start",), tag=IMAGE_TAGS, html=True,
+                                      recover=True, no_network=True):
+        yield dict(element.attrib)
+
+
+def _nodes_bs4(html) -> Iterable[Dict[str, str]]:
+    from bs4 import BeautifulSoup, SoupStrainer
+    parser = "lxml" if etree is not None else "html.parser"
+    soup = BeautifulSoup(html, parser, parse_only=SoupStrainer(IMAGE_TAGS))
+    for tag in soup.find_all(IMAGE_TAGS):
+        attrs = dict(tag.attrs)
+        if isinstance(attrs.get("class"), list):
+            attrs["class"] = " ".join(attrs["class"])
+        yield attrs
+
+
+_BACKENDS = {
+    "selectolax": _nodes_selectolax,
+    "lxml": _nodes_lxml,
+    "bs4": _nodes_bs4,
+}
+
+
+def parse_srcset(srcset: str) -> List[tuple]:
+    """Parse a srcset attribute into (url, width, density) tuples"""
+    candidates = []
+    for match in _SRCSET_CANDIDATE.finditer(srcset or ""):
+        url, descriptor = match.group(1), (match.group(2) or "").strip()
+        width, density = None, 1.0
+        try:
+            if descriptor.endswith("w"):
+                width = int(descriptor[:-1])
+            elif descriptor.endswith("x"):
+                density = float(descriptor[:-1])
+        except ValueError:
+            continue
+        candidates.append((url, width, density))
+    return candidates
+
+
+def best_srcset_candidate(srcset: str) -> Optional[str]:
+    """Pick the largest candidate of a srcset (by width descriptor, else density)"""
+    candidates = parse_srcset(srcset)
+    if not candidates:
+        return None
+    if any(width is not None for _, width, _ in candidates):
+        return max(candidates, key=lambda c: c[1] or 0)[0]
+    return max(candidates, key=lambda c: c[2])[0]
+
+
+def best_image_url(attrs: Dict[str, str]) -> Optional[str]:
+    """Best URL of an img/source node: largest srcset candidate, then src"""
+    for attr in SRCSET_ATTRS:
+        url = best_srcset_candidate(attrs.get(attr))
+        if url:
+            return url
+    for attr in SRC_ATTRS:
+        if attrs.get(attr):
+            return attrs[attr]
+    return None
+
+
+def extract_image_urls(html, class_contains: Optional[str] = None, limit: Optional[int] = None,
+                       base_url: Optional[str] = None, backend: Optional[str] = None) -> List[str]:
+    """Extract unique image URLs from a page, in document order
+
+    With `class_contains` only img nodes whose class attribute contains that
+    string are kept (e.g. "photo-item" on Pexels); otherwise <source> nodes of
+    <picture> elements are used as well.
+    """
+    backend = backend or available_backends()[0]
+    urls, seen = [], set()
+    for attrs in _BACKENDS[backend](html):
+        if class_contains is not None and class_contains not in (attrs.get("class") or ""):
+            continue
+        url = best_image_url(attrs)
+        if not url or url.startswith("data:"):
+            continue
+        if base_url:
+            url = urljoin(base_url, url)
+        if url in seen:
+            continue
+        seen.add(url)
+        urls.append(url)
+        if limit is not None and len(urls) >= limit:
+            break
+    return urls
+
+
+def page_path(pages_dir, name: str) -> Path:
+    """Where save_page stores the page called `name` (a label or its URL)"""
+    return Path(pages_dir) / f"{re.sub(r'[^A-Za-z0-9_-]+', '_', name)}.html"
+
+
+def save_page(pages_dir, name: str, html) -> Path:
+    """Save a raw search page so extraction can be benchmarked offline"""
+    Path(pages_dir).mkdir(parents=True, exist_ok=True)
+    path = page_path(pages_dir, name)
+    path.write_bytes(html.encode("utf-8") if isinstance(html, str) else html)
+    return path
+
+
+def _legacy_extract(html, class_contains):
+    """The original full-page BeautifulSoup + lambda filter, kept as a baseline"""
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html, "html.parser")
+    imgs = soup.find_all('img', {'class': lambda x: x and class_contains in str(x)})
+    return [img.get("src") or img.get("data-src") for img in imgs]
+
+
+def benchmark_extraction(pages_dir, class_contains: str = "photo-item", repeat: int = 5) -> Dict[str, float]:
+    """Time every backend on the saved pages, returns ms per page"""
+    pages = [p.read_bytes() for p in sorted(Path(pages_dir).glob("*.html"))]
+    if not pages:
+        logger.warning(f"No saved pages in {pages_dir}")
+        return {}
+
+    runners = {name: (lambda html, b=name: extract_image_urls(html, class_contains, backend=b))
+               for name in available_backends()}
+    runners["legacy_html_parser"] = lambda html: _legacy_extract(html, class_contains)
+
+    results = {}
+    for name, run in runners.items():
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for html in pages:
+                run(html)
+        results[name] = (time.perf_counter() - start) * 1000 / (repeat * len(pages))
+        logger.info(f"{name}: {results[name]:.2f} ms/page over {len(pages)} pages")
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Benchmark image URL extraction on saved pages")
+    parser.add_argument("pages_dir")
+    parser.add_argument("--class-contains", default="photo-item")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    benchmark_extraction(args.pages_dir, args.class_contains, args.repeat)
@@ -0,0 +1,234 @@
+"""
+Per-image work at ingest
+The writer hands every file it makes durable to the ingest stage, which batches them onto a process pool and
+completes their metadata records (quality scores) before they are committed to the collector's buffer;
+similarity descriptors go into <output_dir>/index and packed thumbnails into <output_dir>/thumbnails on the way
+"""
+
+import atexit
+import os
+import queue
+import threading
+import time
+import logging
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from utils.quality import _score_paths
+from utils.similarity import SimilarityIndex, _describe_paths
+from utils.thumbnails import ThumbnailStore, _render_paths
+
+logger = logging.getLogger(__name__)
+
+# the IVF lists are extended once this many rows are waiting, not per batch; until then new rows are scanned exactly
+IVF_UPDATE_ROWS = 4096
+# descriptors and thumbnails are appended to their stores every this many files, or when the stage goes idle,
+# so the stores' files grow in a few large writes rather than one small write per batch
+PERSIST_EVERY = 256
+
+_stages: Dict[Path, 'IngestStage'] = {}
+_stages_lock = threading.Lock()
+
+
+def _ingest_paths(paths: List[str], score_quality: bool, describe: bool, thumbnails: bool) -> List[Dict]:
+    """Worker entry point: everything computed for one batch of files, one dict per file"""
+    results = [{} for _ in paths]
+    if score_quality:
+        for result, scores in zip(results, _score_paths(paths)):
+            result['quality'] = scores
+    if describe:
+        descriptors, ok = _describe_paths(paths)
+        for result, descriptor, good in zip(results, descriptors, ok):
+            result['descriptor'] = descriptor if good else None
+    if thumbnails:
+        for result, levels in zip(results, _render_paths(paths)):
+            result['thumbnails'] = levels
+    return results
+
+
+class IngestStage:
+    """Batches committed files onto a process pool and completes their records
+
+    submit() is called from the writer's commit path, so only durable files
+    are processed. A batch goes to the pool when batch_size files are
+    waiting or the oldest has waited max_wait_ms; up to two batches per
+    worker are in flight while downloads continue. Results are applied in
+    submission order by the stage thread, which hands each record to its
+    on_done callback (the collector's metadata.append) as soon as its batch
+    is back. Descriptors and thumbnails are buffered and appended to the
+    similarity index and thumbnail pack every PERSIST_EVERY files or when
+    the stage goes idle; flush() returns once they are written.
+
+    One stage serves a whole output directory, see ingest_stage().
+    """
+
+    def __init__(self, output_dir, score_quality: bool = True, index_similarity: bool = True,
+                 thumbnails: bool = True, batch_size: int = 32, max_wait_ms: float = 500.0,
+                 workers: Optional[int] = None, max_queue: int = 4096):
+        self.output_dir = Path(output_dir)
+        self.images_dir = self.output_dir / "images"
+        self.score_quality = score_quality
+        self.index = SimilarityIndex(self.output_dir / "index") if index_similarity else None
+        self.thumbnails = ThumbnailStore(self.output_dir / "thumbnails") if thumbnails else None
+        self.batch_size = batch_size
+        self.max_wait_s = max_wait_ms / 1000.0
+        self.workers = workers or os.cpu_count()
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        self._lock = threading.Lock()
+        self._stats = {'files': 0, 'batches': 0, 'errors': 0, 'scored': 0, 'indexed': 0, 'thumbnails': 0}
+        # applied but not yet persisted: (name, descriptor) and (name, thumbnail levels), and their item count
+        self._descriptors: List = []
+        self._rendered: List = []
+        self._unpersisted = 0
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='ingest', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, filename: str, record: Optional[Dict] = None,
+               on_done: Optional[Callable[[Dict], None]] = None):
+        """Queue a durable file; on_done(record) runs once its record is complete"""
+        if self._closed:
+            raise RuntimeError("IngestStage is closed")
+        self._queue.put((filename, record, on_done))
+
+    def _run(self):
+        batch: List = []
+        in_flight = deque()
+        deadline = None
+        while True:
+            if batch:
+                timeout = max(0.0, deadline - time.perf_counter())
+            elif in_flight:
+                timeout = 0.05
+            else:
+                self._persist()  # idle: nothing can join the buffered rows soon
+                timeout = None
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = ()
+            if item is None:
+                self._dispatch(batch, in_flight)
+                while in_flight:
+                    self._apply(*in_flight.popleft())
+                self._persist()
+                if self.index is not None:
+                    self.index.update_ivf()
+                self._queue.task_done()
+                return
+            if item:
+                batch.append(item)
+                if deadline is None:
+                    deadline = time.perf_counter() + self.max_wait_s
+            if batch and (len(batch) >= self.batch_size or time.perf_counter() >= deadline):
+                self._dispatch(batch, in_flight)
+                batch, deadline = [], None
+            while in_flight and (in_flight[0][1].done() or len(in_flight) > 2 * self.workers):
+                self._apply(*in_flight.popleft())
+            if self._unpersisted >= PERSIST_EVERY:
+                self._persist()
+
+    def _dispatch(self, batch: List, in_flight: deque):
+        if batch:
+            paths = [str(self.images_dir / filename) for filename, _, _ in batch]
+            in_flight.append((batch, self._pool.submit(_ingest_paths, paths, self.score_quality,
+                                                       self.index is not None, self.thumbnails is not None)))
+
+    def _apply(self, batch: List, future):
+        try:
+            results = future.result()
+        except Exception as e:
+            logger.error(f"Ingest batch of {len(batch)} failed: {e}")
+            results = [{} for _ in batch]
+            with self._lock:
+                self._stats['errors'] += len(batch)
+        scored = 0
+        for (filename, record, on_done), result in zip(batch, results):
+            if result.get('descriptor') is not None:
+                self._descriptors.append((filename, result['descriptor']))
+            if result.get('thumbnails') is not None:
+                self._rendered.append((filename, result['thumbnails']))
+            scores = result.get('quality')
+            if scores and record is not None:
+                record.update(scores)
+                scored += 1
+            if on_done is not None and record is not None:
+                try:
+                    on_done(record)
+                except Exception as e:
+                    logger.error(f"Ingest callback for {filename} failed: {e}")
+        self._unpersisted += len(batch)
+        with self._lock:
+            self._stats['files'] += len(batch)
+            self._stats['batches'] += 1
+            self._stats['scored'] += scored
+
+    def _persist(self):
+        """Append buffered descriptors and thumbnails to their stores, then mark their items done"""
+        if not self._unpersisted:
+            return
+        indexed = packed = 0
+        if self._descriptors:
+            try:
+                indexed = self.index.add_descriptors([name for name, _ in self._descriptors],
+                                                     [d for _, d in self._descriptors], update_ivf=False)
+                self.index.update_ivf(IVF_UPDATE_ROWS)
+            except Exception as e:
+                logger.error(f"Indexing {len(self._descriptors)} images failed: {e}")
+        if self._rendered:
+            try:
+                packed = self.thumbnails.add_rendered([name for name, _ in self._rendered],
+                                                      [levels for _, levels in self._rendered])
+            except Exception as e:
+                logger.error(f"Packing thumbnails of {len(self._rendered)} images failed: {e}")
+        with self._lock:
+            self._stats['indexed'] += indexed
+            self._stats['thumbnails'] += packed
+        self._descriptors, self._rendered = [], []
+        for _ in range(self._unpersisted):
+            self._queue.task_done()
+        self._unpersisted = 0
+
+    def flush(self):
+        """Wait until every submitted file is processed, its record handed on and its thumbnails stored"""
+        self._queue.join()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+        self._pool.shutdown()
+        atexit.unregister(self.close)
+        with _stages_lock:
+            if _stages.get(self.output_dir.resolve()) is self:
+                del _stages[self.output_dir.resolve()]
+        stats = self.stats()
+        if stats['files']:
+            logger.info(f"Ingest: {stats['files']} files in {stats['batches']} batches, {stats['scored']} scored, "
+                        f"{stats['indexed']} indexed, {stats['thumbnails']} thumbnails, {stats['errors']} errors")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def ingest_stage(output_dir) -> IngestStage:
+    """The process-wide stage of an output directory, so every collector writing there shares one pool"""
+    key = Path(output_dir).resolve()
+    with _stages_lock:
+        stage = _stages.get(key)
+        if stage is None:
+            stage = _stages[key] = IngestStage(output_dir)
+        return stage
@@ -0,0 +1,262 @@
+"""
+Non-blocking logging for data collection
+Records go through a queue to one listener thread that formats (JSON lines or text) and writes them, per-image
+messages are sampled debug lines, and progress is reported as periodic rate summaries
+"""
+
+import atexit
+import itertools
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from typing import Dict, Optional
+
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+# LogRecord attributes that are not user fields passed with extra=
+_RESERVED = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'taskName'}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_handler: Optional[logging.Handler] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, thread, msg, the extra= fields and any exception"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'msg': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that leaves formatting to the listener thread
+
+    The stock prepare() runs the full formatter in the logging thread; here
+    only the %-arguments are merged (they may be mutated after the call) and
+    exceptions rendered, the rest happens off the hot path. The record is
+    changed in place: this is the root logger's only handler.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.args:
+            record.msg = record.getMessage()
+            record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class SampleFilter(logging.Filter):
+    """Keep the first and then every `every`-th DEBUG record of each call site, all other levels pass
+
+    Call sites are told apart by their message template, so per-item lines
+    must use %-style arguments (logger.debug("Queued %s", name)), not
+    f-strings, both for this and so disabled levels cost no formatting.
+    """
+
+    def __init__(self, every: int = 100):
+        super().__init__()
+        self.every = max(1, every)
+        self._counters: Dict[str, itertools.count] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG:
+            return True
+        counter = self._counters.get(record.msg)
+        if counter is None:
+            counter = self._counters.setdefault(record.msg, itertools.count())
+        n = next(counter)  # itertools.count is atomic under the GIL
+        if n % self.every:
+            return False
+        if n:
+            record.sampled = self.every
+        return True
+
+
+def setup_logging(level=logging.INFO, fmt: str = 'json', log_file=None, sample_every: int = 100,
+                  stream=None) -> logging.handlers.QueueListener:
+    """Route every record of the process through a queue to a background writer thread
+
+    fmt 'json' writes JSON lines to stderr, 'text' the usual one-line
+    format; log_file, when given, always gets JSON lines. Calling it again
+    replaces the previous setup. The listener is stopped (and the queue
+    drained) at exit.
+    """
+    global _listener, _handler
+    shutdown_logging()
+    targets = []
+    console = logging.StreamHandler(stream or sys.stderr)
+    console.setFormatter(JsonFormatter() if fmt == 'json' else logging.Formatter(TEXT_FORMAT))
+    targets.append(console)
+    if log_file:
+        os.makedirs(os.path.dirname(os.path.abspath(log_file)), exist_ok=True)
+        file_handler = logging.FileHandler(log_file, encoding='utf-8')
+        file_handler.setFormatter(JsonFormatter())
+        targets.append(file_handler)
+
+    _handler = _DeferredQueueHandler(queue.SimpleQueue())
+    _handler.addFilter(SampleFilter(sample_every))
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_handler)
+    root.setLevel(level)
+    _listener = logging.handlers.QueueListener(_handler.queue, *targets, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+    return _listener
+
+
+def shutdown_logging():
+    """Flush queued records and stop the writer thread"""
+    global _listener, _handler
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        logging.getLogger().removeHandler(_handler)
+        _listener, _handler = None, None
+
+
+class ProgressReporter:
+    """Counters updated per item, logged as one rate summary every `interval` seconds
+
+    add() is a lock and a few additions; the summary line is written by a
+    daemon timer thread, so a stalled crawl still reports once (at rate 0)
+    and then stays quiet until the counts move again.
+    """
+
+    def __init__(self, name: str, interval: float = 10.0, logger: Optional[logging.Logger] = None):
+        self.name = name
+        self.interval = interval
+        self.logger = logger or logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._counts: Dict[str, float] = {}
+        self._last: Dict[str, float] = {}
+        self._started = self._reported = time.monotonic()
+        self._idle = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f'progress-{name}', daemon=True)
+        self._thread.start()
+
+    def add(self, key: str, amount: float = 1):
+        with self._lock:
+            self._counts[key] = self._counts.get(key, 0) + amount
+
+    def counts(self) -> Dict[str, float]:
+        with self._lock:
+            return dict(self._counts)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.report()
+
+    def report(self, final: bool = False):
+        now = time.monotonic()
+        with self._lock:
+            counts = dict(self._counts)
+            if not final and counts == self._last:
+                if self._idle:
+                    return
+                self._idle = True
+            else:
+                self._idle = False
+            last, self._last = self._last, counts
+            window, self._reported = now - self._reported, now
+        if not counts:
+            return
+        elapsed = now - self._started if final else window
+        base = {} if final else last
+        rates = {f'{key}_per_s': round((value - base.get(key, 0)) / elapsed, 2) if elapsed > 0 else 0.0
+                 for key, value in counts.items()}
+        summary = ", ".join(f"{key} {value:g} ({rates[f'{key}_per_s']:g}/s)" for key, value in sorted(counts.items()))
+        self.logger.info(f"{self.name} {'total' if final else 'progress'}: {summary}",
+                         extra={'progress': self.name, 'final': final, 'counts': counts, 'rates': rates})
+
+    def close(self):
+        if not self._stop.is_set():
+            self._stop.set()
+            self._thread.join()
+            self.report(final=True)
+
+
+def benchmark_logging(count: int = 20000) -> Dict[str, float]:
+    """Per-image logging cost in the calling thread, in microseconds
+
+    legacy: three synchronous f-string info lines per image through a
+    StreamHandler (to os.devnull). queued: the same lines through the queue.
+    sampled: the per-image lines as %-style debug with DEBUG disabled (the
+    default) and enabled with 1-in-100 sampling, plus a ProgressReporter.
+    """
+    devnull = open(os.devnull, 'w')
+    log = logging.getLogger('logs_benchmark')
+    log.propagate = False
+    results = {}
+
+    def legacy_style(i):
+        log.info(f"Downloading: https://images.example.com/photo-{i}.jpg")
+        log.info(f"✓ Queued: img_{i:08x}.jpg - Valid image: 1920x1080")
+        log.info(f"Downloaded {i} images")
+
+    def sampled_style(i, progress):
+        log.debug("Downloading: %s", f"https://images.example.com/photo-{i}.jpg")
+        log.debug("Queued %s (%s)", f"img_{i:08x}.jpg", "Valid image: 1920x1080")
+        progress.add('images')
+        progress.add('bytes', 250_000)
+
+    def timed(run):
+        start = time.perf_counter()
+        for i in range(count):
+            run(i)
+        return (time.perf_counter() - start) * 1e6 / count
+
+    sync = logging.StreamHandler(devnull)
+    sync.setFormatter(logging.Formatter(TEXT_FORMAT))
+    log.handlers, log.level = [sync], logging.INFO
+    results['legacy_sync_us'] = timed(legacy_style)
+
+    sink = logging.StreamHandler(devnull)
+    sink.setFormatter(JsonFormatter())
+    handler = _DeferredQueueHandler(queue.SimpleQueue())
+    handler.addFilter(SampleFilter(100))
+    listener = logging.handlers.QueueListener(handler.queue, sink)
+    listener.start()
+    log.handlers = [handler]
+    results['queued_json_us'] = timed(legacy_style)
+
+    progress = ProgressReporter('benchmark', interval=3600, logger=log)
+    results['sampled_debug_off_us'] = timed(lambda i: sampled_style(i, progress))
+    log.level = logging.DEBUG
+    results['sampled_debug_on_us'] = timed(lambda i: sampled_style(i, progress))
+    listener.stop()
+    devnull.close()
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Measure logging overhead per image")
+    parser.add_argument("--count", type=int, default=20000)
+    args = parser.parse_args()
+    setup_logging(fmt='text')
+    for key, value in benchmark_logging(args.count).items():
+        logging.getLogger(__name__).info(f"{key}: {value:.2f}")
@@ -1,23 +1,45 @@
 import json
+import textwrap
 from pathlib import Path
 from collectors.base_collector import logger
+from utils.profiling import span
+from utils.quality import score_metadata
+from utils.records import MetadataBuffer
 
-def save_metadata(collectors):
-    all_metadata = []
+def dump_records(records, f):
+    """json.dump(list(records), f, indent=2), one record at a time so the whole list is never materialized"""
+    f.write('[')
+    for i, item in enumerate(records):
+        f.write(',\n' if i else '\n')
+        f.write(textwrap.indent(json.dumps(item, indent=2), '  '))
+    f.write('\n]' if len(records) else ']')
+
+@span('save_metadata')
+def save_metadata(collectors, score_quality: bool = True):
+    all_metadata = MetadataBuffer()
     for collector in collectors:
+        # records are only committed once their files are durable and scored at ingest
+        collector.flush()
+        if score_quality:
+            # records added without going through the writer still get scored here
+            score_metadata(collector.metadata, collector.output_dir / "images", missing_only=True)
         all_metadata.extend(collector.metadata)
 
     metadata_file = Path("real_estate_photos/logs/metadata.json")
     with open(metadata_file, "w") as f:
-        json.dump(all_metadata, f, indent=2)
+        dump_records(all_metadata, f)
 
-    logger.info(f"Saved metadata for {len(all_metadata)} images")
+    logger.info(f"Saved metadata for {len(all_metadata)} images ({all_metadata.bytes_per_record():.0f} bytes/record in memory)")
 
     sources = {}
-    for item in all_metadata:
-        source = item.get("source", "unknown")
+    for source in all_metadata.column("source"):
+        source = source or "unknown"
         sources[source] = sources.get(source, 0) + 1
     for s, c in sources.items():
         logger.info(f"{s}: {c} images")
 
+    low_quality = sum(1 for score in all_metadata.column("quality_score") if score is not None and score <= 2)
+    if low_quality:
+        logger.info(f"{low_quality} images scored quality <= 2")
+
     return all_metadata
@@ -0,0 +1,280 @@
+"""
+On-demand profiling for collection and inference runs
+profile_run() wraps a run in cProfile and/or a stack sampler plus tracemalloc and writes collapsed stacks for flame
+graphs and top-N summaries; @span times named hot functions and is not in the call path while profiling is off
+
+Standard library only, so inference_pipeline can import it as data_collection.utils.profiling
+"""
+
+import contextlib
+import cProfile
+import functools
+import io
+import json
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+MODES = ('cprofile', 'sample')
+
+_enabled = False
+_span_lock = threading.Lock()
+# Each thread adds into its own name -> [calls, total_s, max_s] dict, so timing takes no lock;
+# span_stats() merges them. enable_spans() starts a fresh generation by replacing both.
+_span_local = threading.local()
+_span_tables: List[Dict[str, List[float]]] = []
+_methods = []  # (class, attribute, function, span name) of every @span method
+
+
+def _timed(fn, name: str):
+    @functools.wraps(fn)
+    def timed(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            table = getattr(_span_local, 'table', None)
+            if table is None:
+                table = _span_local.table = {}
+                with _span_lock:
+                    _span_tables.append(table)
+            totals = table.get(name)
+            if totals is None:
+                totals = table[name] = [0, 0.0, 0.0]
+            totals[0] += 1
+            totals[1] += elapsed
+            if elapsed > totals[2]:
+                totals[2] = elapsed
+    return timed
+
+
+class _Span:
+    """What @span returns
+
+    In a class body __set_name__ puts the plain function back on the class,
+    so a disabled span costs nothing; enable_spans() swaps in a timed
+    wrapper. Module-level functions stay wrapped in this object and pay one
+    flag check per call, which only suits functions that are not hot.
+    """
+
+    def __init__(self, fn, name: str):
+        self.fn = fn
+        self.name = name
+        functools.update_wrapper(self, fn)
+
+    def __set_name__(self, owner, attribute):
+        _methods.append((owner, attribute, self.fn, self.name))
+        setattr(owner, attribute, _timed(self.fn, self.name) if _enabled else self.fn)
+
+    def __call__(self, *args, **kwargs):
+        if not _enabled:
+            return self.fn(*args, **kwargs)
+        return _timed(self.fn, self.name)(*args, **kwargs)
+
+
+def span(name: Optional[str] = None):
+    """Decorator naming a function as a timing span, e.g. @span('download_image')"""
+    def decorate(fn):
+        return _Span(fn, name or fn.__name__)
+    return decorate
+
+
+def enable_spans():
+    global _enabled, _span_local, _span_tables
+    with _span_lock:
+        _span_local, _span_tables = threading.local(), []
+    _enabled = True
+    for owner, attribute, fn, name in _methods:
+        setattr(owner, attribute, _timed(fn, name))
+
+
+def disable_spans():
+    global _enabled
+    _enabled = False
+    for owner, attribute, fn, _ in _methods:
+        setattr(owner, attribute, fn)
+
+
+def span_stats() -> Dict[str, Dict[str, float]]:
+    """calls, total / mean / max ms per span since enable_spans()"""
+    totals: Dict[str, List[float]] = {}
+    with _span_lock:
+        tables = list(_span_tables)
+    for table in tables:
+        for name, (calls, total, peak) in list(table.items()):
+            merged = totals.setdefault(name, [0, 0.0, 0.0])
+            merged[0] += calls
+            merged[1] += total
+            merged[2] = max(merged[2], peak)
+    return {name: {'calls': int(calls), 'total_ms': total * 1000, 'mean_ms': total * 1000 / calls if calls else 0.0,
+                   'max_ms': peak * 1000}
+            for name, (calls, total, peak) in sorted(totals.items(), key=lambda item: -item[1][1])}
+
+
+# Leaf frames of a thread parked on a condition, queue or join; network reads are kept, they are crawl time
+_IDLE_FRAMES = {('threading.py', 'wait'), ('threading.py', '_wait_for_tstate_lock'), ('queue.py', 'get'),
+                ('selectors.py', 'select')}
+
+
+def _idle(code) -> bool:
+    return (os.path.basename(code.co_filename), code.co_name) in _IDLE_FRAMES
+
+
+def _label(code) -> str:
+    return f"{getattr(code, 'co_qualname', code.co_name)} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """Samples the stacks of every thread every `interval` seconds into collapsed-stack counts
+
+    Unlike cProfile it sees the worker threads (downloads, writer,
+    batcher), and its cost does not grow with the number of calls. Threads
+    parked in a wait (timers, writers on an empty queue) are left out unless
+    `idle`; blocking socket reads still count.
+    """
+
+    def __init__(self, interval: float = 0.005, idle: bool = False):
+        self.interval = interval
+        self.idle = idle
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def _run(self):
+        own = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            for ident, frame in sys._current_frames().items():
+                if ident == own or (not self.idle and _idle(frame.f_code)):
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_label(frame.f_code))
+                    frame = frame.f_back
+                stack.append(f"thread {names.get(ident, ident)}")
+                self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def write_collapsed(self, path: Path):
+        """One 'frame;frame;frame count' line per stack, the input of flamegraph.pl / speedscope"""
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+    def top(self, n: int = 30) -> List[Dict]:
+        """Functions by samples on the stack (inclusive) and on top of it (self)"""
+        inclusive, exclusive = Counter(), Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(';')[1:]  # drop the thread name
+            if not frames:
+                continue
+            exclusive[frames[-1]] += count
+            for frame in set(frames):
+                inclusive[frame] += count
+        total = sum(self.stacks.values()) or 1
+        return [{'function': name, 'inclusive_pct': 100 * count / total, 'self_pct': 100 * exclusive[name] / total}
+                for name, count in inclusive.most_common(n)]
+
+
+@contextlib.contextmanager
+def profile_run(output_dir, mode: str = 'cprofile', top: int = 30, interval_ms: float = 5.0, memory: bool = True,
+                idle: bool = False):
+    """Profile the enclosed block and write its reports to `output_dir`
+
+    Both modes sample every thread into stacks.collapsed and top_sampled.txt.
+    'cprofile' also runs cProfile on the calling thread (profile.pstats,
+    top_cprofile.txt), exact per-function counts at a higher overhead. With
+    `memory`, tracemalloc compares the heap before and after
+    (memory_top.txt, slower allocation while it runs). @span timings go to
+    spans.json. Reports are written even when the block raises or is
+    interrupted.
+    """
+    if mode not in MODES:
+        raise ValueError(f"Unknown profile mode {mode!r}, expected one of {MODES}")
+    out = Path(output_dir)
+    out.mkdir(parents=True, exist_ok=True)
+    enable_spans()
+    if memory:
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+    sampler = StackSampler(interval_ms / 1000, idle)
+    sampler.start()
+    profiler = cProfile.Profile() if mode == 'cprofile' else None
+    start = time.perf_counter()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield out
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        elapsed = time.perf_counter() - start
+        sampler.stop()
+        disable_spans()
+        _write_reports(out, elapsed, sampler, profiler, before if memory else None, top)
+
+
+def _write_reports(out: Path, elapsed: float, sampler: StackSampler, profiler: Optional[cProfile.Profile],
+                   before, top: int):
+    sampler.write_collapsed(out / "stacks.collapsed")
+    sampled = sampler.top(top)
+    with open(out / "top_sampled.txt", 'w') as f:
+        f.write(f"{sampler.samples} samples over {elapsed:.1f}s, all threads, "
+                f"{'with' if sampler.idle else 'without'} idle waits\n")
+        f.write(f"{'incl %':>7} {'self %':>7}  function\n")
+        for row in sampled:
+            f.write(f"{row['inclusive_pct']:7.1f} {row['self_pct']:7.1f}  {row['function']}\n")
+
+    if profiler is not None:
+        profiler.dump_stats(out / "profile.pstats")
+        text = io.StringIO()
+        stats = pstats.Stats(profiler, stream=text).strip_dirs()
+        stats.sort_stats('cumulative').print_stats(top)
+        stats.sort_stats('tottime').print_stats(top)
+        (out / "top_cprofile.txt").write_text(text.getvalue())
+
+    if before is not None:
+        after = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        with open(out / "memory_top.txt", 'w') as f:
+            f.write(f"traced now {current / 1024 ** 2:.1f} MB, peak {peak / 1024 ** 2:.1f} MB\n")
+            for diff in after.compare_to(before, 'lineno')[:top]:
+                f.write(f"{diff}\n")
+
+    spans = span_stats()
+    with open(out / "spans.json", 'w') as f:
+        json.dump({'elapsed_s': elapsed, 'spans': spans}, f, indent=2)
+
+    logger.info(f"Profile of {elapsed:.1f}s written to {out}")
+    for row in sampled[:5]:
+        logger.info(f"  {row['inclusive_pct']:5.1f}% incl {row['self_pct']:5.1f}% self  {row['function']}")
+    for name, s in spans.items():
+        logger.info(f"  span {name}: {s['calls']} calls, {s['total_ms']:.0f} ms total, {s['mean_ms']:.2f} ms mean")
+
+
+def maybe_profile(mode: Optional[str], output_dir, **kwargs):
+    """profile_run(output_dir, mode) for a --profile mode, a no-op context when it is None"""
+    if not mode:
+        return contextlib.nullcontext()
+    return profile_run(output_dir, mode, **kwargs)
@@ -0,0 +1,210 @@
+"""
+Batched image quality scoring at ingest
+Fills the 1-5 quality_score of the annotation template from a downscaled decode
+"""
+
+import os
+import time
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+import cv2
+import numpy as np
+
+from utils.records import MetadataBuffer
+
+logger = logging.getLogger(__name__)
+
+SCORE_SIZE = 256  # every image is scored on a SCORE_SIZE x SCORE_SIZE grayscale thumbnail
+
+# Thresholds are on the SCORE_SIZE thumbnail, not the full image
+THRESHOLDS = {
+    'blur_var': 60.0,       # Laplacian variance below this is blurry
+    'clip_fraction': 0.08,  # fraction of pixels at 0-4 or 251-255
+    'dark_mean': 50.0,
+    'bright_mean': 205.0,
+    'noise_sigma': 8.0,     # estimated Gaussian noise std
+    'blank_std': 6.0,       # almost flat image
+    'blank_entropy': 2.5,   # bits; placeholders use very few grey levels
+}
+
+_NOISE_SCALE = np.sqrt(np.pi / 2) / (6.0 * (SCORE_SIZE - 2) * (SCORE_SIZE - 2))
+
+
+def load_thumbnail(path, out: np.ndarray) -> bool:
+    """Decode `path` at reduced resolution into the SCORE_SIZE uint8 slot `out`"""
+    data = np.fromfile(str(path), dtype=np.uint8)
+    if data.size == 0:
+        return False
+    # Real estate photos are usually >= 1024px, so try the 1/4 decode first and
+    # fall back to a full decode only when that is too small
+    img = cv2.imdecode(data, cv2.IMREAD_REDUCED_GRAYSCALE_4)
+    if img is None:
+        return False
+    short = min(img.shape[:2])
+    if short < SCORE_SIZE:
+        flag = cv2.IMREAD_REDUCED_GRAYSCALE_2 if short * 2 >= SCORE_SIZE else cv2.IMREAD_GRAYSCALE
+        img = cv2.imdecode(data, flag)
+    cv2.resize(img, (SCORE_SIZE, SCORE_SIZE), dst=out, interpolation=cv2.INTER_AREA)
+    return True
+
+
+def score_batch(batch: np.ndarray) -> Dict[str, np.ndarray]:
+    """Vectorized quality metrics for a (N, SCORE_SIZE, SCORE_SIZE) uint8 batch"""
+    n = batch.shape[0]
+    x = batch.astype(np.float32)
+    center = x[:, 1:-1, 1:-1]
+
+    # Blur: variance of the 4-neighbour Laplacian
+    lap = 4 * center - x[:, :-2, 1:-1] - x[:, 2:, 1:-1] - x[:, 1:-1, :-2] - x[:, 1:-1, 2:]
+    blur_var = lap.var(axis=(1, 2))
+
+    # Noise: Immerkaer's fast sigma estimate (Laplacian-difference mask)
+    mask = (4 * center
+            - 2 * (x[:, :-2, 1:-1] + x[:, 2:, 1:-1] + x[:, 1:-1, :-2] + x[:, 1:-1, 2:])
+            + x[:, :-2, :-2] + x[:, :-2, 2:] + x[:, 2:, :-2] + x[:, 2:, 2:])
+    noise_sigma = np.abs(mask).sum(axis=(1, 2)) * _NOISE_SCALE
+
+    # Exposure: one bincount for the whole batch gives every histogram
+    offsets = (np.arange(n, dtype=np.int64) * 256)[:, None]
+    hist = np.bincount((batch.reshape(n, -1) + offsets).ravel(), minlength=n * 256).reshape(n, 256)
+    prob = hist / float(SCORE_SIZE * SCORE_SIZE)
+    clip_fraction = prob[:, :5].sum(axis=1) + prob[:, 251:].sum(axis=1)
+    mean = prob @ np.arange(256, dtype=np.float64)
+    std = np.sqrt(np.maximum(prob @ (np.arange(256, dtype=np.float64) ** 2) - mean ** 2, 0))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        entropy = -np.where(prob > 0, prob * np.log2(prob), 0).sum(axis=1)
+
+    return {
+        'blur_var': blur_var,
+        'noise_sigma': noise_sigma,
+        'clip_fraction': clip_fraction,
+        'mean': mean,
+        'std': std,
+        'entropy': entropy,
+    }
+
+
+def is_blank(metrics: Dict[str, np.ndarray], thresholds: Dict[str, float] = THRESHOLDS) -> np.ndarray:
+    """Flat or near-single-colour images (placeholders, failed renders)"""
+    return (metrics['std'] < thresholds['blank_std']) | (metrics['entropy'] < thresholds['blank_entropy'])
+
+
+def metrics_to_scores(metrics: Dict[str, np.ndarray], thresholds: Dict[str, float] = THRESHOLDS) -> np.ndarray:
+    """Map metric arrays to integer 1-5 quality scores"""
+    t = thresholds
+    penalty = (
+        (metrics['blur_var'] < t['blur_var']).astype(np.int8) * 2
+        + (metrics['blur_var'] < t['blur_var'] * 2)
+        + (metrics['clip_fraction'] > t['clip_fraction'])
+        + ((metrics['mean'] < t['dark_mean']) | (metrics['mean'] > t['bright_mean']))
+        + (metrics['noise_sigma'] > t['noise_sigma'])
+    )
+    scores = np.clip(5 - penalty, 1, 5)
+    scores[is_blank(metrics, t)] = 1
+    return scores.astype(np.int8)
+
+
+def _score_paths(paths: List[str]) -> List[Optional[Dict]]:
+    """Worker entry point: decode one batch of files and score it"""
+    batch = np.empty((len(paths), SCORE_SIZE, SCORE_SIZE), dtype=np.uint8)
+    ok = np.zeros(len(paths), dtype=bool)
+    for i, path in enumerate(paths):
+        try:
+            ok[i] = load_thumbnail(path, batch[i])
+        except Exception as e:
+            logger.warning(f"Could not decode {path} for scoring: {e}")
+    results = [None] * len(paths)
+    if not ok.any():
+        return results
+
+    metrics = score_batch(batch[ok])
+    scores = metrics_to_scores(metrics)
+    blank = is_blank(metrics)
+    for j, i in enumerate(np.flatnonzero(ok)):
+        results[i] = {
+            'quality_score': int(scores[j]),
+            'blur_var': round(float(metrics['blur_var'][j]), 2),
+            'noise_sigma': round(float(metrics['noise_sigma'][j]), 2),
+            'clip_fraction': round(float(metrics['clip_fraction'][j]), 4),
+            'brightness': round(float(metrics['mean'][j]), 2),
+            'is_blank': bool(blank[j]),
+        }
+    return results
+
+
+class QualityScorer:
+    """Score images in batches on a process pool as they are submitted"""
+
+    def __init__(self, batch_size: int = 64, workers: Optional[int] = None):
+        self.batch_size = batch_size
+        self.pool = ProcessPoolExecutor(max_workers=workers or os.cpu_count())
+        self._pending = []
+        self._futures = []
+
+    def submit(self, path):
+        self._pending.append(str(path))
+        if len(self._pending) >= self.batch_size:
+            self._flush()
+
+    def _flush(self):
+        if self._pending:
+            self._futures.append((self._pending, self.pool.submit(_score_paths, self._pending)))
+            self._pending = []
+
+    def results(self) -> Dict[str, Optional[Dict]]:
+        """Wait for every submitted image, returns {path: scores or None}"""
+        self._flush()
+        results = {}
+        for paths, future in self._futures:
+            results.update(zip(paths, future.result()))
+        self._futures = []
+        return results
+
+    def close(self):
+        self.pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def score_files(paths: Iterable, batch_size: int = 64, workers: Optional[int] = None) -> Dict[str, Optional[Dict]]:
+    """Score a list of image files, returns {path: scores or None}"""
+    start = time.perf_counter()
+    with QualityScorer(batch_size, workers) as scorer:
+        for path in paths:
+            scorer.submit(path)
+        results = scorer.results()
+    elapsed = time.perf_counter() - start
+    if results:
+        logger.info(f"Scored {len(results)} images in {elapsed:.2f}s ({len(results) / elapsed:.1f} images/s)")
+    return results
+
+
+def score_metadata(metadata, images_dir, batch_size: int = 64, workers: Optional[int] = None,
+                   missing_only: bool = False):
+    """Add quality_score and the raw metrics to every record of a list of dicts or a MetadataBuffer in place
+
+    missing_only skips records that already have a quality_score, e.g. the ones scored at ingest.
+    """
+    images_dir = Path(images_dir)
+    columnar = isinstance(metadata, MetadataBuffer)
+    filenames = metadata.column('filename') if columnar else [item.get('filename') for item in metadata]
+    if missing_only:
+        scores = metadata.column('quality_score') if columnar else [item.get('quality_score') for item in metadata]
+        filenames = [None if score is not None else name for name, score in zip(filenames, scores)]
+    paths = {name: str(images_dir / name) for name in filenames if name}
+    results = score_files(paths.values(), batch_size, workers)
+    updates = {i: results.get(paths.get(name)) for i, name in enumerate(filenames) if name}
+    updates = {i: scores for i, scores in updates.items() if scores}
+    if columnar:
+        metadata.update_rows(updates)
+    else:
+        for i, scores in updates.items():
+            metadata[i].update(scores)
+    return metadata
@@ -0,0 +1,452 @@
+"""
+Compact columnar metadata records
+Collectors append plain dicts; each field is kept as one growable NumPy column (numbers), dictionary codes
+(repeated strings such as source or search_term) or a UTF-8 blob with offsets (unique strings), so a record
+costs tens of bytes instead of a dict with its own keys, and Arrow / pandas see the buffers without a copy
+"""
+
+import json
+import sys
+import time
+import logging
+import threading
+import tracemalloc
+from numbers import Integral, Real
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+# Low-cardinality string fields stored as dictionary codes; other strings go to a text blob
+CATEGORICAL = frozenset({'source', 'category', 'search_term', 'property_url', 'room_type'})
+
+_GROWTH = 1.5  # capacity grows geometrically, so at most a third of a buffer is ever unused
+_MIN_CAPACITY = 64
+
+
+def _grown(buffer: np.ndarray, needed: int) -> np.ndarray:
+    """`buffer` with room for `needed` items; a new array, so views handed out earlier stay valid"""
+    if needed <= len(buffer):
+        return buffer
+    out = np.zeros(max(needed, int(len(buffer) * _GROWTH), _MIN_CAPACITY), dtype=buffer.dtype)
+    out[:len(buffer)] = buffer
+    return out
+
+
+_INT64 = (-2 ** 63, 2 ** 63 - 1)
+_EXACT_FLOAT_INT = 2 ** 53  # ints up to this magnitude survive a round trip through float64
+
+
+def _kind(name: str, value) -> str:
+    if value is None:
+        return 'null'
+    if isinstance(value, (bool, np.bool_)):
+        return 'bool'
+    if isinstance(value, Integral):
+        return 'int' if _INT64[0] <= value <= _INT64[1] else 'object'
+    if isinstance(value, Real):
+        return 'float'
+    if isinstance(value, str):
+        return 'category' if name in CATEGORICAL else 'text'
+    return 'object'
+
+
+class _Column:
+    """One field: values for rows [0, length) plus a validity mask, created on the first missing value
+
+    Whether a record had the field at all is kept by the buffer's row
+    layouts; here a missing field and an explicit None are both None. A
+    float column remembers which rows were ints (ints) and returns them as
+    ints. 'null' columns have only seen None so far, 'object' columns keep
+    the Python values of fields whose types do not agree.
+    """
+
+    _DTYPES = {'int': np.int64, 'float': np.float64, 'bool': np.bool_, 'category': np.int32}
+    # plain Python types each kind takes as is, checked before the slower ABC isinstance
+    _EXACT = {'int': {int}, 'float': {float}, 'bool': {bool}, 'category': {str}, 'text': {str}, 'null': set(),
+              'object': set()}
+
+    def __init__(self, kind: str, missing: int = 0):
+        self.kind = kind
+        self.length = 0
+        self.valid: Optional[np.ndarray] = None
+        self.ints: Optional[np.ndarray] = None
+        if kind == 'text':
+            self.offsets = np.zeros(_MIN_CAPACITY, dtype=np.int64)
+            self.data = np.zeros(0, dtype=np.uint8)
+        elif kind == 'object':
+            self.values = []
+        elif kind != 'null':
+            self.values = np.zeros(0, dtype=self._DTYPES[kind])
+        if kind == 'category':
+            self.dictionary: List[str] = []
+            self.codes: Dict[str, int] = {}
+        self.extend_missing(missing)
+
+    def accepts(self, value) -> bool:
+        if value is None or type(value) in self._EXACT[self.kind] or self.kind == 'object':
+            return True
+        kind = _kind('', value)
+        if self.kind in ('category', 'text'):
+            return isinstance(value, str)
+        if self.kind == 'float' and kind == 'int':
+            return abs(value) <= _EXACT_FLOAT_INT
+        return kind == self.kind
+
+    @staticmethod
+    def _flag(mask: Optional[np.ndarray], i: int, flag: bool, default: bool) -> Optional[np.ndarray]:
+        """mask with row i set to flag; None stands for every row being default"""
+        if mask is None:
+            if flag == default:
+                return None
+            mask = np.full(i + 1, default, dtype=bool)
+        mask = _grown(mask, i + 1)
+        mask[i] = flag
+        return mask
+
+    def append(self, value):
+        """Append one value (None is missing); the caller checked accepts()"""
+        i = self.length
+        present = value is not None
+        self.valid = self._flag(self.valid, i, present, True)
+        if self.kind == 'float':
+            self.ints = self._flag(self.ints, i, present and _kind('', value) == 'int', False)
+        if self.kind == 'text':
+            self.offsets = _grown(self.offsets, i + 2)
+            start = self.offsets[i]
+            encoded = value.encode('utf-8') if present else b''
+            self.data = _grown(self.data, start + len(encoded))
+            memoryview(self.data)[start:start + len(encoded)] = encoded
+            self.offsets[i + 1] = start + len(encoded)
+        elif self.kind == 'object':
+            self.values.append(value if present else None)
+        elif self.kind != 'null':
+            self.values = _grown(self.values, i + 1)
+            self.values[i] = self._encode(value)
+        self.length += 1
+
+    def _encode(self, value):
+        if value is None:
+            return -1 if self.kind == 'category' else 0
+        if self.kind != 'category':
+            return value
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.dictionary)
+            self.dictionary.append(sys.intern(str(value)))
+        return code
+
+    def extend_missing(self, count: int):
+        for _ in range(count):
+            self.append(None)
+
+    def get(self, i: int):
+        """Value of row i, None when it is missing"""
+        if self.kind == 'null' or (self.valid is not None and not self.valid[i]):
+            return None
+        if self.kind == 'text':
+            return self.data[self.offsets[i]:self.offsets[i + 1]].tobytes().decode('utf-8')
+        if self.kind == 'category':
+            return self.dictionary[self.values[i]]
+        if self.kind == 'object':
+            return self.values[i]
+        if self.ints is not None and self.ints[i]:
+            return int(self.values[i])
+        return self.values[i].item()
+
+    def set(self, i: int, value):
+        """Overwrite row i in place; text rows are rewritten by the buffer instead"""
+        present = value is not None
+        if self.valid is not None or not present:
+            if self.valid is None:
+                self.valid = np.ones(self.length, dtype=bool)
+            self.valid[i] = present
+        if self.kind == 'null' or not present:
+            return
+        if self.kind == 'float':
+            is_int = _kind('', value) == 'int'
+            if self.ints is not None or is_int:
+                if self.ints is None:
+                    self.ints = np.zeros(self.length, dtype=bool)
+                self.ints[i] = is_int
+        self.values[i] = value if self.kind == 'object' else self._encode(value)
+
+    def promoted(self, name: str, value) -> '_Column':
+        """Copy of this column widened to also hold `value`, every row keeping its value and type
+
+        A null-only column takes the kind of its first value, int widens to
+        float (rows stay ints on read) and any other mix becomes 'object'.
+        """
+        kind = _kind(name, value)
+        if self.kind == 'null':
+            pass
+        elif self.kind == 'int' and kind == 'float':
+            kind = 'float'
+            if self.length and np.abs(self.values[:self.length]).max() > _EXACT_FLOAT_INT:
+                kind = 'object'
+        else:
+            kind = 'object'
+        out = _Column(kind)
+        for i in range(self.length):
+            out.append(self.get(i))
+        return out
+
+    def nbytes(self) -> int:
+        """Allocated bytes, spare capacity included"""
+        total = sum(mask.nbytes for mask in (self.valid, self.ints) if mask is not None)
+        if self.kind == 'null':
+            return total
+        if self.kind == 'text':
+            return total + self.offsets.nbytes + self.data.nbytes
+        if self.kind == 'object':
+            return total + sys.getsizeof(self.values) + sum(sys.getsizeof(v) for v in self.values)
+        total += self.values.nbytes
+        if self.kind == 'category':
+            total += sum(sys.getsizeof(s) for s in self.dictionary) + sys.getsizeof(self.codes)
+        return total
+
+    def _bitmap(self):
+        if self.valid is None:
+            return None
+        return pa.py_buffer(np.packbits(self.valid[:self.length], bitorder='little'))
+
+    def to_arrow(self) -> 'pa.Array':
+        n = self.length
+        if self.kind == 'null':
+            return pa.nulls(n)
+        if self.kind == 'object':
+            # Arrow columns have one type, so mixed values are exported as their JSON text
+            return pa.array([None if v is None else _text(v) for v in self.values], type=pa.large_string())
+        if self.kind == 'text':
+            return pa.Array.from_buffers(pa.large_string(), n, [self._bitmap(), pa.py_buffer(self.offsets[:n + 1]),
+                                                                pa.py_buffer(self.data[:self.offsets[n]])])
+        if self.kind == 'bool':
+            # Arrow booleans are bit-packed, so this column is the one copy (n / 8 bytes)
+            return pa.Array.from_buffers(pa.bool_(), n, [self._bitmap(),
+                                                        pa.py_buffer(np.packbits(self.values[:n], bitorder='little'))])
+        if self.kind == 'category':
+            indices = pa.Array.from_buffers(pa.int32(), n, [self._bitmap(), pa.py_buffer(self.values[:n])])
+            return pa.DictionaryArray.from_arrays(indices, pa.array(self.dictionary, type=pa.string()))
+        arrow_type = pa.int64() if self.kind == 'int' else pa.float64()
+        return pa.Array.from_buffers(arrow_type, n, [self._bitmap(), pa.py_buffer(self.values[:n])])
+
+    def to_pandas(self):
+        """NumPy-backed pandas values, for when pyarrow is not installed"""
+        import pandas as pd
+        n = self.length
+        if self.kind in ('null', 'object', 'text'):
+            return np.array([self.get(i) for i in range(n)], dtype=object)
+        missing = None if self.valid is None else ~self.valid[:n]
+        if self.kind == 'category':
+            return pd.Categorical.from_codes(self.values[:n], self.dictionary)
+        if missing is None or not missing.any():
+            return self.values[:n]
+        if self.kind == 'int':
+            return pd.arrays.IntegerArray(self.values[:n], missing)
+        if self.kind == 'bool':
+            return pd.arrays.BooleanArray(self.values[:n], missing)
+        return np.where(missing, np.nan, self.values[:n])
+
+
+def _text(value) -> str:
+    return value if isinstance(value, str) else json.dumps(value)
+
+
+class MetadataBuffer:
+    """Columnar drop-in for a collector's list of metadata dicts
+
+    append(), extend(), len(), iteration and indexing behave like the list:
+    rows come back as new dicts with their record's keys in its order,
+    explicit None included. Each row stores a code for its key layout, the
+    distinct layouts are kept once. A field takes the type of its first value: ints, floats
+    and bools go to NumPy columns, CATEGORICAL strings to interned dictionary
+    codes and every other string to one UTF-8 blob. A later value that does
+    not fit widens the column without changing stored values: int -> float
+    (ints still read back as ints), any other mix -> a list of the Python
+    values. Lists and dicts are kept that way too; Arrow and pandas get
+    such columns as JSON text.
+
+    to_arrow() wraps the live buffers without copying and to_pandas() builds
+    on it, so exporting millions of records no longer doubles their memory.
+    Appends are safe from the writer thread while other threads read.
+    """
+
+    def __init__(self, records: Iterable[Dict] = ()):
+        self.columns: Dict[str, _Column] = {}
+        self.length = 0
+        # per row a code into layouts, the record's field names in order
+        self.layouts: List[tuple] = []
+        self._layout_codes: Dict[tuple, int] = {}
+        self._row_layout = np.zeros(0, dtype=np.int32)
+        self._lock = threading.Lock()
+        self.extend(records)
+
+    def __len__(self) -> int:
+        return self.length
+
+    def append(self, record: Dict):
+        with self._lock:
+            for name, value in record.items():
+                column = self.columns.get(name)
+                if column is None:
+                    column = self.columns[name] = _Column(_kind(name, value), self.length)
+                elif not column.accepts(value):
+                    column = self.columns[name] = column.promoted(name, value)
+                column.append(value)
+            for column in self.columns.values():
+                if column.length == self.length:
+                    column.append(None)
+            self._row_layout = _grown(self._row_layout, self.length + 1)
+            self._row_layout[self.length] = self._layout_code(tuple(record))
+            self.length += 1
+
+    def _layout_code(self, layout: tuple) -> int:
+        code = self._layout_codes.get(layout)
+        if code is None:
+            code = self._layout_codes[layout] = len(self.layouts)
+            self.layouts.append(layout)
+        return code
+
+    def extend(self, records: Iterable[Dict]):
+        for record in records:
+            self.append(record)
+
+    def __getitem__(self, i: int) -> Dict:
+        if i < 0:
+            i += self.length
+        if not 0 <= i < self.length:
+            raise IndexError("record index out of range")
+        columns = self.columns
+        return {name: columns[name].get(i) for name in self.layouts[self._row_layout[i]]}
+
+    def __iter__(self) -> Iterator[Dict]:
+        for i in range(self.length):
+            yield self[i]
+
+    def to_records(self) -> List[Dict]:
+        return list(self)
+
+    def column(self, name: str) -> List:
+        """All values of one field in row order, None where missing"""
+        column = self.columns.get(name)
+        if column is None:
+            return [None] * self.length
+        return [column.get(i) for i in range(self.length)]
+
+    def update_rows(self, updates: Dict[int, Dict]):
+        """Merge {row: {field: value}} into existing records, e.g. quality scores after ingest"""
+        by_field: Dict[str, Dict[int, object]] = {}
+        for i, fields in updates.items():
+            for name, value in fields.items():
+                by_field.setdefault(name, {})[i] = value
+        with self._lock:
+            for name, values in by_field.items():
+                column = self.columns.get(name)
+                if column is None:
+                    first = next((v for v in values.values() if v is not None), None)
+                    column = self.columns[name] = _Column(_kind(name, first), self.length)
+                for value in values.values():
+                    if not column.accepts(value):
+                        column = self.columns[name] = column.promoted(name, value)
+                if column.kind == 'text':
+                    # the blob cannot be patched in place; rewrite the column once
+                    out = _Column('text')
+                    for i in range(self.length):
+                        out.append(values[i] if i in values else column.get(i))
+                    self.columns[name] = out
+                    continue
+                for i, value in values.items():
+                    column.set(i, value)
+            # fields new to a row go after its existing ones, as with dict.update
+            for i, fields in updates.items():
+                layout = self.layouts[self._row_layout[i]]
+                extra = tuple(name for name in fields if name not in layout)
+                if extra:
+                    self._row_layout[i] = self._layout_code(layout + extra)
+
+    def nbytes(self) -> int:
+        with self._lock:
+            return self._row_layout.nbytes + sum(column.nbytes() for column in self.columns.values())
+
+    def bytes_per_record(self) -> float:
+        return self.nbytes() / self.length if self.length else 0.0
+
+    def memory_report(self) -> Dict[str, int]:
+        """Allocated bytes per field"""
+        with self._lock:
+            return {name: column.nbytes() for name, column in self.columns.items()}
+
+    def to_arrow(self) -> 'pa.Table':
+        """Arrow table over the current rows, sharing the column buffers"""
+        if pa is None:
+            raise ImportError("pyarrow is required for Arrow export: pip install pyarrow")
+        with self._lock:
+            return pa.table({name: column.to_arrow() for name, column in self.columns.items()})
+
+    def to_pandas(self):
+        """DataFrame of the current rows; Arrow-backed and zero-copy when pyarrow is installed"""
+        import pandas as pd
+        if pa is not None:
+            return self.to_arrow().to_pandas(types_mapper=pd.ArrowDtype)
+        with self._lock:
+            return pd.DataFrame({name: column.to_pandas() for name, column in self.columns.items()})
+
+
+def benchmark_memory(count: int = 200_000) -> Dict[str, float]:
+    """Bytes per record of synthetic collector metadata as dicts, as a MetadataBuffer and exported to pandas"""
+    sources = ['unsplash', 'flickr', 'zillow', 'pexels']
+    terms = ['living room tv', 'fireplace interior', 'modern living room', 'cozy fireplace']
+
+    def record(i):
+        return {
+            'filename': f"{sources[i % 4]}_{i:08x}.jpg",
+            'source_url': f"https://images.example.com/photo-{i:010d}?w=1080&q=80",
+            'source': sources[i % 4],
+            'search_term': terms[i % 4],
+            'downloaded_at': 1.7e9 + i,
+            'quality_score': i % 5 + 1,
+            'blur_var': 100.0 + i % 997,
+        }
+
+    results = {}
+    start = time.perf_counter()
+    dicts = [record(i) for i in range(count)]
+    results['dict_append_us'] = (time.perf_counter() - start) * 1e6 / count
+    del dicts
+    start = time.perf_counter()
+    MetadataBuffer(record(i) for i in range(count))
+    results['buffer_append_us'] = (time.perf_counter() - start) * 1e6 / count
+
+    # memory is measured in a second pass, tracemalloc slows allocation down
+    tracemalloc.start()
+    dicts = [record(i) for i in range(count)]
+    results['dict_bytes_per_record'] = tracemalloc.get_traced_memory()[0] / count
+    del dicts
+    base = tracemalloc.get_traced_memory()[0]
+    buffer = MetadataBuffer(record(i) for i in range(count))
+    results['buffer_bytes_per_record'] = (tracemalloc.get_traced_memory()[0] - base) / count
+    results['buffer_reported_bytes_per_record'] = buffer.bytes_per_record()
+    buffer.to_pandas()  # the first call pays for the pandas / pyarrow imports
+    base = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    df = buffer.to_pandas()
+    results['to_pandas_ms'] = (time.perf_counter() - start) * 1000
+    results['to_pandas_bytes_per_record'] = (tracemalloc.get_traced_memory()[0] - base) / count
+    del df
+    tracemalloc.stop()
+    return results
+
+if __name__ == "__main__":
+    import argparse
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Measure metadata memory per record")
+    parser.add_argument("--records", type=int, default=200_000)
+    args = parser.parse_args()
+    for key, value in benchmark_memory(args.records).items():
+        logger.info(f"{key}: {value:.3f}")
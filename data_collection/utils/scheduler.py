@@ -0,0 +1,276 @@
+"""
+Fair-share crawl scheduler across sources and search terms
+Collectors expose their work as streams of download jobs; the scheduler interleaves them by weighted fair
+queuing, enforces per-source quotas and retires a category's streams once its target is collected
+"""
+
+import threading
+import time
+import logging
+from typing import Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# A job performs one download and returns the number of bytes it stored, 0 when nothing was kept
+Job = Callable[[], int]
+
+
+class SourceQuota:
+    """Share and budget of one source
+
+    weight is the source's share of dispatches relative to the others;
+    max_images and max_bytes end the source once reached, and
+    requests_per_minute paces its jobs with a token bucket (one second of
+    burst). None means unlimited.
+    """
+
+    def __init__(self, weight: float = 1.0, max_images: Optional[int] = None, max_bytes: Optional[int] = None,
+                 requests_per_minute: Optional[float] = None):
+        if weight <= 0:
+            raise ValueError(f"weight must be positive, got {weight}")
+        self.weight = weight
+        self.max_images = max_images
+        self.max_bytes = max_bytes
+        self.requests_per_minute = requests_per_minute
+
+
+class _Stream:
+    def __init__(self, source: '_Source', name: str, jobs: Iterable[Job], weight: float, category: Optional[str],
+                 max_images: Optional[int]):
+        self.source = source
+        self.name = name
+        self.jobs = iter(jobs)
+        self.weight = weight
+        self.category = category
+        self.max_images = max_images
+        self.vtime = source.min_stream_vtime()
+        self.images = 0
+        self.requests = 0
+        self.busy = False  # a generator cannot be advanced from two threads
+        self.ended: Optional[str] = None
+
+
+class _Source:
+    def __init__(self, name: str, quota: SourceQuota, vtime: float):
+        self.name = name
+        self.quota = quota
+        self.vtime = vtime
+        self.streams: List[_Stream] = []
+        self.images = 0
+        self.bytes = 0
+        self.requests = 0
+        self.errors = 0
+        self.ended: Optional[str] = None
+        rate = quota.requests_per_minute
+        self.capacity = max(1.0, rate / 60.0) if rate else None
+        self.tokens = self.capacity
+        self.refilled = time.monotonic()
+
+    def min_stream_vtime(self) -> float:
+        live = [s.vtime for s in self.streams if s.ended is None]
+        return min(live) if live else 0.0
+
+    def token_wait(self, now: float) -> float:
+        """Seconds until a request may be sent, refilling the bucket first"""
+        if self.capacity is None:
+            return 0.0
+        rate = self.quota.requests_per_minute / 60.0
+        self.tokens = min(self.capacity, self.tokens + (now - self.refilled) * rate)
+        self.refilled = now
+        return 0.0 if self.tokens >= 1.0 else (1.0 - self.tokens) / rate
+
+
+class CrawlScheduler:
+    """Weighted fair queuing over (source, stream) with quotas and category targets
+
+    Each dispatch advances the chosen source's virtual time by 1 / weight and
+    the stream's by 1 / stream weight; the next job comes from the eligible
+    source with the smallest virtual time, and from its stream with the
+    smallest one. Streams and sources that join late start at the current
+    virtual time instead of zero, so they get their share from then on
+    rather than a burst to catch up.
+
+    A source ends when its images or bytes quota is used, a stream when it
+    runs out of jobs or reaches its own max_images, and every stream of a
+    category when category_targets[category] images are collected, so the
+    remaining budget flows to the sources and classes still short. Jobs
+    already running when a limit is hit still finish, so counts can exceed a
+    limit by at most workers - 1.
+    """
+
+    def __init__(self, quotas: Optional[Dict[str, SourceQuota]] = None,
+                 category_targets: Optional[Dict[str, int]] = None, default_quota: Optional[SourceQuota] = None):
+        self.quotas = dict(quotas or {})
+        self.default_quota = default_quota or SourceQuota()
+        self.category_targets = dict(category_targets or {})
+        self.category_counts: Dict[str, int] = {}
+        self.sources: Dict[str, _Source] = {}
+        self._vtime = 0.0
+        self._cond = threading.Condition()
+        self._running = 0
+
+    def add_stream(self, source: str, name: str, jobs: Iterable[Job], weight: float = 1.0,
+                   category: Optional[str] = None, max_images: Optional[int] = None):
+        """Register a lazy iterable of jobs, e.g. one search term of one source
+
+        `jobs` is only advanced when the stream is scheduled, so a generator
+        can fetch its next search page inside the iteration.
+        """
+        with self._cond:
+            src = self.sources.get(source)
+            if src is None:
+                src = self.sources[source] = _Source(source, self.quotas.get(source, self.default_quota), self._vtime)
+            elif src.ended is None and not self._live_streams(src):
+                src.vtime = max(src.vtime, self._vtime)
+            src.streams.append(_Stream(src, name, jobs, weight, category, max_images))
+            if category is not None and self._target_met(category):
+                src.streams[-1].ended = 'category_target'
+            self._cond.notify_all()
+
+    def _target_met(self, category: str) -> bool:
+        target = self.category_targets.get(category)
+        return target is not None and self.category_counts.get(category, 0) >= target
+
+    @staticmethod
+    def _live_streams(src: _Source) -> List[_Stream]:
+        return [s for s in src.streams if s.ended is None]
+
+    def _next(self) -> Optional[_Stream]:
+        """Block until a stream may run, mark it busy and charge it; None when all work is done"""
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                ready, wait = [], None
+                for src in self.sources.values():
+                    if src.ended is not None:
+                        continue
+                    streams = [s for s in self._live_streams(src) if not s.busy]
+                    if not streams:
+                        continue
+                    delay = src.token_wait(now)
+                    if delay > 0:
+                        wait = delay if wait is None else min(wait, delay)
+                        continue
+                    ready.append((src, streams))
+                if ready:
+                    src, streams = min(ready, key=lambda r: r[0].vtime)
+                    stream = min(streams, key=lambda s: s.vtime)
+                    self._vtime = src.vtime
+                    src.vtime += 1.0 / src.quota.weight
+                    stream.vtime += 1.0 / stream.weight
+                    if src.capacity is not None:
+                        src.tokens -= 1.0
+                    src.requests += 1
+                    stream.requests += 1
+                    stream.busy = True
+                    self._running += 1
+                    return stream
+                if wait is None and self._running == 0:
+                    return None  # nothing runnable and nothing in flight that could change that
+                self._cond.wait(wait)
+
+    def _finish(self, stream: _Stream, stored: Optional[int], failed: bool = False):
+        """Account one dispatch; stored None means the stream had no more jobs"""
+        with self._cond:
+            self._running -= 1
+            stream.busy = False
+            src = stream.source
+            if stored is None:
+                stream.ended = stream.ended or 'exhausted'
+                # pulling from an empty stream is not a request
+                src.requests -= 1
+                stream.requests -= 1
+            elif failed:
+                src.errors += 1
+            elif stored > 0:
+                src.images += 1
+                src.bytes += stored
+                stream.images += 1
+                if stream.max_images is not None and stream.images >= stream.max_images:
+                    stream.ended = stream.ended or 'max_images'
+                category = stream.category
+                if category is not None:
+                    self.category_counts[category] = self.category_counts.get(category, 0) + 1
+                    if self._target_met(category):
+                        self._end_category(category)
+            quota = src.quota
+            if src.ended is None:
+                if quota.max_images is not None and src.images >= quota.max_images:
+                    src.ended = 'max_images'
+                elif quota.max_bytes is not None and src.bytes >= quota.max_bytes:
+                    src.ended = 'max_bytes'
+                elif not self._live_streams(src):
+                    src.ended = 'exhausted'
+                if src.ended is not None:
+                    logger.info(f"Source {src.name} done ({src.ended}): {src.images} images, "
+                                f"{src.bytes / 1024 ** 2:.1f} MB, {src.requests} requests")
+            self._cond.notify_all()
+
+    def _end_category(self, category: str):
+        ended = 0
+        for src in self.sources.values():
+            for stream in src.streams:
+                if stream.category == category and stream.ended is None:
+                    stream.ended = 'category_target'
+                    ended += 1
+            if src.ended is None and not self._live_streams(src):
+                src.ended = 'category_target'
+        if ended:
+            logger.info(f"Category {category} reached its target of {self.category_targets[category]}, "
+                        f"stopped {ended} streams")
+
+    def _work(self):
+        while True:
+            stream = self._next()
+            if stream is None:
+                return
+            try:
+                job = next(stream.jobs, None)
+            except Exception as e:
+                logger.error(f"Stream {stream.source.name}/{stream.name} failed: {e}")
+                job = None
+            if job is None:
+                self._finish(stream, None)
+                continue
+            try:
+                stored = job() or 0
+            except Exception as e:
+                logger.error(f"Job of {stream.source.name}/{stream.name} failed: {e}")
+                self._finish(stream, 0, failed=True)
+                continue
+            self._finish(stream, int(stored))
+
+    def run(self, workers: int = 4) -> Dict[str, Dict]:
+        """Run every stream to completion or quota on `workers` threads; returns stats()"""
+        start = time.perf_counter()
+        threads = [threading.Thread(target=self._work, name=f'crawl-{i}', daemon=True) for i in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        stats = self.stats()
+        elapsed = time.perf_counter() - start
+        logger.info(f"Crawl finished in {elapsed:.1f}s: " + ", ".join(
+            f"{name} {s['images']} images / {s['requests']} requests" for name, s in stats['sources'].items()))
+        return stats
+
+    def stats(self) -> Dict[str, Dict]:
+        with self._cond:
+            total = sum(src.requests for src in self.sources.values()) or 1
+            return {
+                'sources': {
+                    name: {
+                        'images': src.images,
+                        'mb': src.bytes / 1024 ** 2,
+                        'requests': src.requests,
+                        'errors': src.errors,
+                        'share': src.requests / total,
+                        'ended': src.ended,
+                        'streams': {s.name: {'images': s.images, 'requests': s.requests, 'ended': s.ended}
+                                    for s in src.streams},
+                    }
+                    for name, src in self.sources.items()
+                },
+                'categories': {category: {'images': self.category_counts.get(category, 0), 'target': target}
+                               for category, target in self.category_targets.items()},
+            }
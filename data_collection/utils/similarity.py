@@ -0,0 +1,412 @@
+"""
+Query-by-example similarity search over the collected dataset
+Colour / layout / texture descriptors are computed at ingest, kept in a memory-mapped float16 matrix
+and searched through an inverted-file (IVF) index in pure NumPy
+"""
+
+import os
+import time
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from utils.appendlog import NameLog
+
+logger = logging.getLogger(__name__)
+
+DESC_SIZE = 128  # descriptors are computed on a DESC_SIZE x DESC_SIZE BGR thumbnail
+
+HSV_BINS = (8, 4, 4)   # hue x saturation x value colour histogram
+LAYOUT_GRID = 4        # mean Lab colour of each cell of a LAYOUT_GRID x LAYOUT_GRID grid
+TEXTURE_GRID = 4       # gradient orientation histogram per cell of this grid
+ORIENT_BINS = 8
+
+# Relative weight of each block in the cosine similarity
+BLOCK_WEIGHTS = {'color': 1.0, 'layout': 0.6, 'texture': 1.0}
+
+DIM = int(np.prod(HSV_BINS)) + LAYOUT_GRID * LAYOUT_GRID * 3 + TEXTURE_GRID * TEXTURE_GRID * ORIENT_BINS
+
+# Below this many images exact search is fast enough and an IVF index is not trained
+MIN_TRAIN = 2048
+
+
+def load_descriptor_thumbnail(path, out: np.ndarray) -> bool:
+    """Decode `path` at reduced resolution into the DESC_SIZE uint8 BGR slot `out`"""
+    data = np.fromfile(str(path), dtype=np.uint8)
+    if data.size == 0:
+        return False
+    img = cv2.imdecode(data, cv2.IMREAD_REDUCED_COLOR_4)
+    if img is None:
+        return False
+    if min(img.shape[:2]) < DESC_SIZE:
+        img = cv2.imdecode(data, cv2.IMREAD_COLOR)
+    cv2.resize(img, (DESC_SIZE, DESC_SIZE), dst=out, interpolation=cv2.INTER_AREA)
+    return True
+
+
+def _normalize_rows(x: np.ndarray) -> np.ndarray:
+    return x / np.maximum(np.linalg.norm(x, axis=1, keepdims=True), 1e-12)
+
+
+def describe_batch(batch: np.ndarray) -> np.ndarray:
+    """(N, DIM) float32 unit descriptors of a (N, DESC_SIZE, DESC_SIZE, 3) uint8 BGR batch
+
+    Histogram blocks are square-rooted (Hellinger kernel) so a dot product
+    compares distributions rather than being dominated by the largest bin.
+    """
+    n, size = batch.shape[0], batch.shape[1]
+    tall = batch.reshape(n * size, size, 3)
+    pixels = size * size
+    offsets = np.arange(n, dtype=np.int64)[:, None]
+
+    # Colour: joint HSV histogram, one bincount for the whole batch
+    hsv = cv2.cvtColor(tall, cv2.COLOR_BGR2HSV).reshape(n, pixels, 3).astype(np.int64)
+    hb, sb, vb = HSV_BINS
+    bins = (hsv[..., 0] * hb // 180) * (sb * vb) + (hsv[..., 1] * sb // 256) * vb + hsv[..., 2] * vb // 256
+    color_bins = hb * sb * vb
+    color = np.bincount((bins + offsets * color_bins).ravel(), minlength=n * color_bins)
+    color = np.sqrt(color.reshape(n, color_bins) / pixels)
+
+    # Layout: coarse spatial colour in Lab, centred so cosine similarity sees differences
+    lab = cv2.cvtColor(tall, cv2.COLOR_BGR2Lab).reshape(n, size, size, 3).astype(np.float32)
+    cell = size // LAYOUT_GRID
+    layout = lab.reshape(n, LAYOUT_GRID, cell, LAYOUT_GRID, cell, 3).mean(axis=(2, 4)).reshape(n, -1)
+    layout = (layout - 128.0) / 128.0
+
+    # Texture: magnitude-weighted gradient orientation histogram per cell
+    gray = lab[..., 0]
+    gx = np.zeros_like(gray)
+    gy = np.zeros_like(gray)
+    gx[:, :, 1:-1] = gray[:, :, 2:] - gray[:, :, :-2]
+    gy[:, 1:-1, :] = gray[:, 2:, :] - gray[:, :-2, :]
+    magnitude = np.hypot(gx, gy)
+    orientation = ((np.arctan2(gy, gx) % np.pi) * (ORIENT_BINS / np.pi)).astype(np.int64) % ORIENT_BINS
+    grid = np.arange(size) * TEXTURE_GRID // size
+    cells = (grid[:, None] * TEXTURE_GRID + grid[None, :])[None]
+    texture_bins = TEXTURE_GRID * TEXTURE_GRID * ORIENT_BINS
+    index = (offsets[:, :, None] * texture_bins + cells * ORIENT_BINS + orientation.reshape(n, size, size)).ravel()
+    texture = np.bincount(index, weights=magnitude.ravel(), minlength=n * texture_bins)
+    texture = np.sqrt(texture.reshape(n, texture_bins) / (pixels * 255.0))
+
+    blocks = [(color, 'color'), (layout, 'layout'), (texture, 'texture')]
+    return _normalize_rows(np.concatenate([_normalize_rows(b) * BLOCK_WEIGHTS[name] for b, name in blocks],
+                                          axis=1)).astype(np.float32)
+
+
+def _describe_paths(paths: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """Worker entry point: (float16 descriptors, decoded mask) of one batch of files"""
+    batch = np.empty((len(paths), DESC_SIZE, DESC_SIZE, 3), dtype=np.uint8)
+    ok = np.zeros(len(paths), dtype=bool)
+    for i, path in enumerate(paths):
+        try:
+            ok[i] = load_descriptor_thumbnail(path, batch[i])
+        except Exception as e:
+            logger.warning(f"Could not decode {path} for indexing: {e}")
+    descriptors = np.zeros((len(paths), DIM), dtype=np.float16)
+    if ok.any():
+        descriptors[ok] = describe_batch(batch[ok])
+    return descriptors, ok
+
+
+def describe_files(paths: Sequence, batch_size: int = 128,
+                   workers: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Descriptors of image files on a process pool; rows of undecodable files are zero and ok is False"""
+    paths = [str(p) for p in paths]
+    if not paths:
+        return np.zeros((0, DIM), dtype=np.float16), np.zeros(0, dtype=bool)
+    chunks = [paths[i:i + batch_size] for i in range(0, len(paths), batch_size)]
+    if len(chunks) == 1:
+        return _describe_paths(chunks[0])
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        parts = list(pool.map(_describe_paths, chunks))
+    return np.concatenate([p[0] for p in parts]), np.concatenate([p[1] for p in parts])
+
+
+class EmbeddingStore:
+    """Append-only float16 descriptor matrix on disk with its row -> filename log
+
+    Rows are appended to descriptors.f16 before their names are appended to
+    filenames.jsonl, so the name log's length is the commit point: rows past
+    it after a crash are dropped on the next append. Neither file is ever
+    rewritten, so an append costs only its own rows. An append first picks
+    up rows another store on the same directory committed meanwhile (e.g.
+    the ingest stage and a DatasetManager backfill), so neither truncates
+    the other's rows.
+    """
+
+    def __init__(self, index_dir):
+        self.index_dir = Path(index_dir)
+        self.matrix_path = self.index_dir / "descriptors.f16"
+        self.names = NameLog(self.index_dir / "filenames.jsonl")
+        self._matrix = None
+
+    @property
+    def filenames(self) -> List[str]:
+        return self.names.names
+
+    @property
+    def rows(self) -> Dict[str, int]:
+        return self.names.rows
+
+    def _reload(self):
+        """Pick up rows committed by another store since this one last read or wrote"""
+        if self.names.refresh():
+            self._matrix = None
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    @property
+    def matrix(self) -> np.ndarray:
+        """(N, DIM) read-only float16 memmap"""
+        if self._matrix is None or len(self._matrix) != len(self):
+            if not len(self):
+                return np.zeros((0, DIM), dtype=np.float16)
+            self._matrix = np.memmap(self.matrix_path, dtype=np.float16, mode='r', shape=(len(self), DIM))
+        return self._matrix
+
+    def append(self, filenames: Sequence[str], descriptors: np.ndarray):
+        if not len(filenames):
+            return
+        self._reload()
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        committed = len(self) * DIM * 2
+        with open(self.matrix_path, 'ab') as f:
+            if f.tell() != committed:
+                f.truncate(committed)
+            f.write(np.ascontiguousarray(descriptors, dtype=np.float16).tobytes())
+        self.names.append(filenames)
+        self._matrix = None
+
+
+def _rows_float32(matrix: np.ndarray, chunk: int = 65536) -> Iterable[Tuple[int, np.ndarray]]:
+    for start in range(0, len(matrix), chunk):
+        yield start, np.asarray(matrix[start:start + chunk], dtype=np.float32)
+
+
+def spherical_kmeans(x: np.ndarray, k: int, iters: int = 12, seed: int = 0) -> np.ndarray:
+    """(k, DIM) unit centroids of unit rows `x` by cosine k-means"""
+    rng = np.random.default_rng(seed)
+    centroids = x[rng.choice(len(x), k, replace=False)].copy()
+    for _ in range(iters):
+        sims = x @ centroids.T
+        assign = sims.argmax(axis=1)
+        order = np.argsort(assign, kind='stable')
+        counts = np.bincount(assign, minlength=k)
+        filled = np.flatnonzero(counts)
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])[filled]
+        centroids[filled] = np.add.reduceat(x[order], starts, axis=0)
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            # reseed empty lists with the rows worst served by their centroid
+            worst = np.argsort(sims[np.arange(len(x)), assign])[:len(empty)]
+            centroids[empty] = x[worst]
+        centroids = _normalize_rows(centroids)
+    return centroids
+
+
+class IVFIndex:
+    """Inverted-file index: rows bucketed by nearest centroid, queries scan the nprobe closest buckets"""
+
+    def __init__(self, centroids: np.ndarray, assign: Optional[np.ndarray] = None, trained_on: int = 0):
+        self.centroids = centroids.astype(np.float32)
+        self.assign = np.zeros(0, dtype=np.int32) if assign is None else assign.astype(np.int32)
+        self.trained_on = trained_on
+        self._build_lists()
+
+    @classmethod
+    def train(cls, matrix: np.ndarray, n_lists: Optional[int] = None, sample: int = 50000,
+              seed: int = 0) -> 'IVFIndex':
+        n_lists = n_lists or max(1, int(np.sqrt(len(matrix))))
+        rng = np.random.default_rng(seed)
+        rows = np.sort(rng.choice(len(matrix), min(sample, len(matrix)), replace=False))
+        start = time.perf_counter()
+        index = cls(spherical_kmeans(np.asarray(matrix[rows], dtype=np.float32), n_lists, seed=seed),
+                    trained_on=len(matrix))
+        index.add(matrix)
+        logger.info(f"Trained IVF index with {n_lists} lists over {len(matrix)} images "
+                    f"in {time.perf_counter() - start:.1f}s")
+        return index
+
+    def _build_lists(self):
+        self.order = np.argsort(self.assign, kind='stable').astype(np.int64)
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(self.assign, minlength=len(self.centroids)))])
+
+    def add(self, matrix: np.ndarray, start: Optional[int] = None):
+        """Assign rows start.. of `matrix` (default: every row not yet indexed)"""
+        start = len(self.assign) if start is None else start
+        parts = [self.assign[:start]]
+        for _, chunk in _rows_float32(matrix[start:]):
+            parts.append((chunk @ self.centroids.T).argmax(axis=1).astype(np.int32))
+        self.assign = np.concatenate(parts)
+        self._build_lists()
+
+    def candidates(self, query: np.ndarray, nprobe: int) -> np.ndarray:
+        lists = np.argsort(-(self.centroids @ query))[:nprobe]
+        rows = np.concatenate([self.order[self.offsets[l]:self.offsets[l + 1]] for l in lists])
+        # sorted rows turn the memmap gather into a forward scan
+        return np.sort(rows)
+
+    def save(self, path):
+        tmp = Path(path).with_suffix('.tmp.npz')
+        np.savez(tmp, centroids=self.centroids, assign=self.assign, trained_on=self.trained_on)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path) -> 'IVFIndex':
+        with np.load(path) as data:
+            return cls(data['centroids'], data['assign'], int(data['trained_on']))
+
+
+def _top_k(sims: np.ndarray, rows: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    if len(sims) > k:
+        best = np.argpartition(-sims, k)[:k]
+        rows, sims = rows[best], sims[best]
+    order = np.argsort(-sims, kind='stable')
+    return rows[order], sims[order]
+
+
+class SimilarityIndex:
+    """Descriptor store plus IVF index under one directory, e.g. <dataset>/index
+
+    Exact search is used until the store holds MIN_TRAIN images; the IVF
+    index is (re)trained whenever the store has doubled since the last
+    training so the lists stay balanced as the dataset grows.
+    """
+
+    def __init__(self, index_dir, nprobe: int = 8):
+        self.store = EmbeddingStore(index_dir)
+        self.ivf_path = self.store.index_dir / "ivf.npz"
+        self.nprobe = nprobe
+        self.ivf = IVFIndex.load(self.ivf_path) if self.ivf_path.exists() else None
+
+    def __len__(self) -> int:
+        return len(self.store)
+
+    def add_files(self, images_dir, filenames: Iterable[str], workers: Optional[int] = None) -> int:
+        """Describe and index the files not indexed yet; returns how many were added"""
+        images_dir = Path(images_dir)
+        self.store._reload()
+        new = [name for name in dict.fromkeys(filenames) if name not in self.store.rows]
+        if not new:
+            return 0
+        start = time.perf_counter()
+        descriptors, ok = describe_files([images_dir / name for name in new], workers=workers)
+        added = self.add_descriptors([name for name, good in zip(new, ok) if good], descriptors[ok])
+        logger.info(f"Indexed {added} images in {time.perf_counter() - start:.2f}s "
+                    f"({len(new) - int(ok.sum())} undecodable)")
+        return added
+
+    def add_descriptors(self, filenames: Sequence[str], descriptors: np.ndarray, update_ivf: bool = True) -> int:
+        """Index descriptors computed elsewhere (the ingest stage); names already indexed are skipped
+
+        With update_ivf False the new rows are only searched exactly until
+        the next update_ivf(), so batches can be appended cheaply.
+        """
+        self.store._reload()
+        keep = {}
+        for i, name in enumerate(filenames):
+            if name not in self.store.rows:
+                keep.setdefault(name, i)
+        if not keep:
+            return 0
+        self.store.append(list(keep), np.asarray(descriptors)[list(keep.values())])
+        if update_ivf:
+            self._update_ivf()
+        return len(keep)
+
+    def unassigned(self) -> int:
+        """Rows not in the IVF lists yet, searched exactly"""
+        return len(self.store) - (len(self.ivf.assign) if self.ivf is not None else 0)
+
+    def update_ivf(self, min_new: int = 1):
+        """Train or extend the IVF index once at least min_new rows are unassigned"""
+        if self.unassigned() >= min_new:
+            self._update_ivf()
+
+    def _update_ivf(self):
+        matrix = self.store.matrix
+        if len(matrix) < MIN_TRAIN:
+            return
+        if self.ivf is None or len(matrix) >= 2 * self.ivf.trained_on:
+            self.ivf = IVFIndex.train(matrix)
+        else:
+            self.ivf.add(matrix)
+        self.ivf.save(self.ivf_path)
+
+    def _query_vector(self, query) -> np.ndarray:
+        if isinstance(query, np.ndarray):
+            return _normalize_rows(query.reshape(1, -1).astype(np.float32))[0]
+        name = Path(query).name
+        if name in self.store.rows and not Path(query).is_file():
+            return np.asarray(self.store.matrix[self.store.rows[name]], dtype=np.float32)
+        descriptors, ok = describe_files([query])
+        if not ok[0]:
+            raise ValueError(f"Could not decode query image {query}")
+        return descriptors[0].astype(np.float32)
+
+    def search(self, query, k: int = 20, exact: bool = False,
+               nprobe: Optional[int] = None) -> List[Tuple[str, float]]:
+        """Top-k (filename, cosine similarity) for an image path, an indexed filename or a descriptor"""
+        q = self._query_vector(query)
+        matrix = self.store.matrix
+        if exact or self.ivf is None:
+            sims = np.concatenate([chunk @ q for _, chunk in _rows_float32(matrix)]) if len(matrix) else np.zeros(0)
+            rows = np.arange(len(sims))
+        else:
+            rows = self.ivf.candidates(q, nprobe or self.nprobe)
+            # rows appended since the last IVF update are scanned exactly
+            rows = np.concatenate([rows, np.arange(len(self.ivf.assign), len(matrix))])
+            sims = np.asarray(matrix[rows], dtype=np.float32) @ q
+        rows, sims = _top_k(sims, rows, k)
+        return [(self.store.filenames[r], round(float(s), 4)) for r, s in zip(rows, sims)]
+
+    def benchmark(self, queries: int = 100, k: int = 20, nprobes: Sequence[int] = (1, 4, 8, 16, 32),
+                  seed: int = 0) -> List[Dict]:
+        """ms per query and recall@k against exact search for each nprobe, using indexed images as queries"""
+        matrix = self.store.matrix
+        rng = np.random.default_rng(seed)
+        rows = rng.choice(len(matrix), min(queries, len(matrix)), replace=False)
+        vectors = np.asarray(matrix[np.sort(rows)], dtype=np.float32)
+
+        start = time.perf_counter()
+        truth = [{name for name, _ in self.search(v, k, exact=True)} for v in vectors]
+        exact_ms = (time.perf_counter() - start) * 1000 / len(vectors)
+        results = [{'nprobe': None, 'ms_per_query': exact_ms, 'recall_at_k': 1.0}]
+        if self.ivf is None:
+            return results
+        for nprobe in nprobes:
+            start = time.perf_counter()
+            found = [{name for name, _ in self.search(v, k, nprobe=nprobe)} for v in vectors]
+            elapsed = (time.perf_counter() - start) * 1000 / len(vectors)
+            recall = float(np.mean([len(f & t) / max(len(t), 1) for f, t in zip(found, truth)]))
+            results.append({'nprobe': nprobe, 'ms_per_query': elapsed, 'recall_at_k': recall})
+        return results
+
+
+if __name__ == "__main__":
+    import argparse
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Build, query and benchmark the dataset similarity index")
+    parser.add_argument("--images", required=True, help="directory of collected images")
+    parser.add_argument("--index", help="index directory (default: <images>/../index)")
+    parser.add_argument("--query", help="image path or indexed filename to search for")
+    parser.add_argument("-k", type=int, default=20)
+    parser.add_argument("--benchmark", action="store_true")
+    args = parser.parse_args()
+
+    images = Path(args.images)
+    index = SimilarityIndex(args.index or images.parent / "index")
+    index.add_files(images, sorted(p.name for p in images.iterdir()
+                                   if p.suffix.lower() in ('.jpg', '.jpeg', '.png', '.webp')))
+    if args.query:
+        for filename, similarity in index.search(args.query, args.k):
+            print(f"{similarity:.4f}  {filename}")
+    if args.benchmark:
+        for row in index.benchmark(k=args.k):
+            logger.info(f"nprobe {row['nprobe'] or 'exact':>5}: {row['ms_per_query']:.2f} ms/query, "
+                        f"recall@{args.k} {row['recall_at_k']:.3f}")
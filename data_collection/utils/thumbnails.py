@@ -0,0 +1,298 @@
+"""
+Thumbnail pyramid cache for annotation review
+Every image is decoded once at reduced resolution at ingest; its 512 / 128 px JPEG thumbnails are appended
+to one packed file with an offset index, so browsing and contact sheets never touch the full-size files
+"""
+
+import json
+import os
+import time
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from utils.appendlog import NameLog
+
+logger = logging.getLogger(__name__)
+
+SIZES = (512, 128)  # long side in pixels, largest first: each level is resized from the previous one
+JPEG_QUALITY = 85
+
+# One row per (image, size level); offsets point into thumbs.pack
+INDEX_DTYPE = np.dtype([('offset', '<u8'), ('length', '<u4'), ('width', '<u2'), ('height', '<u2')])
+
+_REDUCED = ((4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2))
+
+
+def decode_for_thumbnail(data: np.ndarray, long_side: int) -> Optional[np.ndarray]:
+    """Decode at the strongest JPEG DCT reduction whose long side still covers `long_side`
+
+    The 1/8 decode costs a small fraction of a full one and tells the source
+    size, so at most one more decode picks the right reduction.
+    """
+    img = cv2.imdecode(data, cv2.IMREAD_REDUCED_COLOR_8)
+    if img is None:
+        return None
+    long8 = max(img.shape[:2])
+    if long8 >= long_side:
+        return img
+    for factor, flag in _REDUCED:
+        if long8 * 8 // factor >= long_side:
+            return cv2.imdecode(data, flag)
+    return cv2.imdecode(data, cv2.IMREAD_COLOR)
+
+
+def _fit(img: np.ndarray, long_side: int) -> np.ndarray:
+    height, width = img.shape[:2]
+    scale = long_side / max(width, height)
+    if scale >= 1:
+        return img
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    return cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+
+
+def _render_paths(paths: List[str]) -> List[Optional[List[Tuple[bytes, int, int]]]]:
+    """Worker entry point: per file the encoded thumbnails of every SIZES level, or None"""
+    results = []
+    for path in paths:
+        try:
+            data = np.fromfile(path, dtype=np.uint8)
+            img = decode_for_thumbnail(data, SIZES[0]) if data.size else None
+        except Exception as e:
+            logger.warning(f"Could not decode {path} for thumbnails: {e}")
+            img = None
+        if img is None:
+            results.append(None)
+            continue
+        levels = []
+        for size in SIZES:
+            img = _fit(img, size)
+            ok, encoded = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+            levels.append((encoded.tobytes(), img.shape[1], img.shape[0]))
+        results.append(levels)
+    return results
+
+
+class ThumbnailStore:
+    """Packed thumbnails under one directory, e.g. <dataset>/thumbnails
+
+    thumbs.pack is append-only JPEG bytes; thumbs.idx holds an INDEX_DTYPE
+    row per image and size level, filenames.jsonl the image order. The pack
+    and index rows are appended before the names, so the name log's length
+    is the commit point and a crash leaves at most unreferenced bytes that
+    the next append drops. Nothing is rewritten, so an append costs only its
+    own thumbnails. An append first picks up thumbnails another store on the
+    same directory committed meanwhile (the ingest stage, a DatasetManager
+    backfill).
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = Path(cache_dir)
+        self.pack_path = self.cache_dir / "thumbs.pack"
+        self.index_path = self.cache_dir / "thumbs.idx"
+        self.names = NameLog(self.cache_dir / "filenames.jsonl")
+        self._index = None
+        self._pack = None
+
+    @property
+    def filenames(self) -> List[str]:
+        return self.names.names
+
+    @property
+    def rows(self) -> Dict[str, int]:
+        return self.names.rows
+
+    @property
+    def index(self) -> np.ndarray:
+        """(N, len(SIZES)) read-only INDEX_DTYPE memmap of the committed images"""
+        if self._index is None or len(self._index) != len(self):
+            if not len(self):
+                return np.zeros((0, len(SIZES)), dtype=INDEX_DTYPE)
+            self._index = np.memmap(self.index_path, dtype=INDEX_DTYPE, mode='r', shape=(len(self), len(SIZES)))
+        return self._index
+
+    def _reload(self):
+        """Pick up thumbnails committed by another store since this one last read or wrote"""
+        self.names.refresh()
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __contains__(self, filename: str) -> bool:
+        return filename in self.rows
+
+    def _packed(self) -> np.ndarray:
+        end = int(self.index['offset'][-1, -1] + self.index['length'][-1, -1]) if len(self) else 0
+        if self._pack is None or len(self._pack) < end:
+            self._pack = np.memmap(self.pack_path, dtype=np.uint8, mode='r') if end else np.zeros(0, np.uint8)
+        return self._pack
+
+    def add_files(self, images_dir, filenames: Iterable[str], batch_size: int = 64,
+                  workers: Optional[int] = None) -> int:
+        """Render and pack thumbnails of the files not cached yet; returns how many were added"""
+        images_dir = Path(images_dir)
+        self._reload()
+        new = [name for name in dict.fromkeys(filenames) if name not in self.rows]
+        if not new:
+            return 0
+        start = time.perf_counter()
+        chunks = [[str(images_dir / name) for name in new[i:i + batch_size]] for i in range(0, len(new), batch_size)]
+        if len(chunks) == 1:
+            rendered = _render_paths(chunks[0])
+        else:
+            with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+                rendered = [r for part in pool.map(_render_paths, chunks) for r in part]
+        added = self.add_rendered(new, rendered)
+        elapsed = time.perf_counter() - start
+        logger.info(f"Packed thumbnails of {added} images in {elapsed:.2f}s "
+                    f"({len(new) - added} undecodable)")
+        return added
+
+    def add_rendered(self, filenames: Sequence[str], rendered: Sequence[Optional[List[Tuple[bytes, int, int]]]]) -> int:
+        """Pack thumbnails rendered elsewhere (_render_paths output, e.g. by the ingest stage)
+
+        None entries and names already packed are skipped; returns how many were added.
+        """
+        self._reload()
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        committed = int(self.index['offset'][-1, -1] + self.index['length'][-1, -1]) if len(self) else 0
+        added, seen, rows = [], set(), []
+        with open(self.pack_path, 'ab') as f:
+            if f.tell() != committed:
+                f.truncate(committed)
+            offset = committed
+            for name, levels in zip(filenames, rendered):
+                if levels is None or name in self.rows or name in seen:
+                    continue
+                row = np.zeros(len(SIZES), dtype=INDEX_DTYPE)
+                for j, (data, width, height) in enumerate(levels):
+                    f.write(data)
+                    row[j] = (offset, len(data), width, height)
+                    offset += len(data)
+                added.append(name)
+                seen.add(name)
+                rows.append(row)
+        if not added:
+            return 0
+
+        committed_rows = len(self) * len(SIZES) * INDEX_DTYPE.itemsize
+        with open(self.index_path, 'ab') as f:
+            if f.tell() != committed_rows:
+                f.truncate(committed_rows)
+            f.write(np.stack(rows).tobytes())
+        self.names.append(added)
+        return len(added)
+
+    def _level(self, size: int) -> int:
+        """Smallest level that is at least `size`, else the largest"""
+        fitting = [j for j, s in enumerate(SIZES) if s >= size]
+        return fitting[-1] if fitting else 0
+
+    def get(self, filename: str, size: int = 128) -> Optional[memoryview]:
+        """Encoded JPEG bytes of a thumbnail, straight from the mapped pack (None when not cached)"""
+        row = self.rows.get(filename)
+        if row is None:
+            return None
+        entry = self.index[row, self._level(size)]
+        offset = int(entry['offset'])
+        return memoryview(self._packed()[offset:offset + int(entry['length'])])
+
+    def image(self, filename: str, size: int = 128) -> Optional[np.ndarray]:
+        """Decoded BGR thumbnail"""
+        data = self.get(filename, size)
+        return None if data is None else cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+    def contact_sheet(self, filenames: Sequence[str], cell: int = 128, columns: int = 10,
+                      labels: Optional[Sequence[str]] = None) -> np.ndarray:
+        """Mosaic of thumbnails, `columns` wide, each centred in a cell x cell tile; uncached files stay blank"""
+        count = max(len(filenames), 1)
+        rows = (count + columns - 1) // columns
+        sheet = np.full((rows * cell, min(count, columns) * cell, 3), 32, dtype=np.uint8)
+        for i, name in enumerate(filenames):
+            img = self.image(name, cell)
+            if img is None:
+                continue
+            img = _fit(img, cell)
+            height, width = img.shape[:2]
+            y = (i // columns) * cell + (cell - height) // 2
+            x = (i % columns) * cell + (cell - width) // 2
+            sheet[y:y + height, x:x + width] = img
+            if labels is not None:
+                cv2.putText(sheet, str(labels[i])[:24], ((i % columns) * cell + 3, (i // columns + 1) * cell - 5),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.3, (255, 255, 255), 1, cv2.LINE_AA)
+        return sheet
+
+
+def contact_sheets(store: ThumbnailStore, metadata: List[Dict], group_by: str = 'source', out_dir=None,
+                   per_sheet: int = 100, cell: int = 128, columns: int = 10) -> Dict[str, List[Path]]:
+    """Write one or more contact sheet JPEGs per value of a metadata field (source, search_term, ...)"""
+    groups: Dict[str, List[Dict]] = {}
+    for item in metadata:
+        if item.get('filename') in store:
+            groups.setdefault(str(item.get(group_by) or 'unknown'), []).append(item)
+    out_dir = Path(out_dir or store.cache_dir / "sheets")
+    out_dir.mkdir(parents=True, exist_ok=True)
+    written = {}
+    for value, items in groups.items():
+        # best images first, so the first sheet of a group is the most useful one
+        items = sorted(items, key=lambda item: -(item.get('quality_score') or 0))
+        slug = "".join(c if c.isalnum() else '_' for c in value)[:60]
+        paths = []
+        for page, start in enumerate(range(0, len(items), per_sheet)):
+            chunk = items[start:start + per_sheet]
+            sheet = store.contact_sheet([item['filename'] for item in chunk], cell, columns,
+                                        labels=[item['filename'] for item in chunk])
+            path = out_dir / f"{group_by}_{slug}_{page:03d}.jpg"
+            cv2.imwrite(str(path), sheet, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+            paths.append(path)
+        written[value] = paths
+    logger.info(f"Wrote contact sheets for {len(written)} {group_by} groups to {out_dir}")
+    return written
+
+
+def benchmark_browse(store: ThumbnailStore, images_dir, count: int = 1000, size: int = 128) -> Dict[str, float]:
+    """ms per image to show a thumbnail from the pack vs decoding and resizing the full-size file"""
+    names = store.filenames[:count]
+    start = time.perf_counter()
+    for name in names:
+        store.image(name, size)
+    packed = (time.perf_counter() - start) * 1000 / max(len(names), 1)
+    sample = names[:max(1, min(len(names), 50))]
+    start = time.perf_counter()
+    for name in sample:
+        img = cv2.imread(str(Path(images_dir) / name))
+        if img is not None:
+            _fit(img, size)
+    full = (time.perf_counter() - start) * 1000 / max(len(sample), 1)
+    return {'packed_ms_per_image': packed, 'full_decode_ms_per_image': full}
+
+
+if __name__ == "__main__":
+    import argparse
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Build the thumbnail pack and render contact sheets")
+    parser.add_argument("--images", required=True, help="directory of collected images")
+    parser.add_argument("--cache", help="thumbnail directory (default: <images>/../thumbnails)")
+    parser.add_argument("--metadata", help="metadata JSON or CSV to group contact sheets by")
+    parser.add_argument("--group-by", default="source")
+    parser.add_argument("--benchmark", action="store_true")
+    args = parser.parse_args()
+
+    images = Path(args.images)
+    thumbs = ThumbnailStore(args.cache or images.parent / "thumbnails")
+    thumbs.add_files(images, sorted(p.name for p in images.iterdir()
+                                    if p.suffix.lower() in ('.jpg', '.jpeg', '.png', '.webp')))
+    if args.metadata:
+        if args.metadata.endswith('.csv'):
+            import pandas as pd
+            records = pd.read_csv(args.metadata).to_dict('records')
+        else:
+            with open(args.metadata) as f:
+                records = json.load(f)
+        contact_sheets(thumbs, records, args.group_by)
+    if args.benchmark:
+        logger.info(f"Browse cost: {benchmark_browse(thumbs, images)}")
@@ -0,0 +1,230 @@
+"""
+Dedicated writer stage for downloaded images
+Download threads hand validated buffers to a queue; one writer thread writes them to temp files, fsyncs in
+batches, renames them into place and only then commits their metadata records
+"""
+
+import atexit
+import itertools
+import os
+import queue
+import threading
+import time
+import logging
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+PART_SUFFIX = '.part'
+# a live writer renames its temp files within fsync_interval_ms; older ones are abandoned whoever wrote them
+STALE_PART_S = 3600.0
+
+_writer_ids = itertools.count()
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OSError):
+        return True  # exists but belongs to someone else, or the platform cannot tell
+    return True
+
+
+def _fsync_dir(path: Path):
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return  # directories cannot be opened on every platform
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class ImageWriter:
+    """Background writer with atomic renames and batched fsync
+
+    Each file is written to a hidden `.<name>.<pid>-<writer>.part` next to its destination.
+    A batch is made durable when fsync_every files are pending or the oldest
+    has waited fsync_interval_ms: every temp file is fsynced, renamed into
+    place and the directory fsynced once, after which the batch's
+    on_commit callbacks run. A crash therefore leaves only .part files and
+    never a record pointing at a partial image. A new writer removes the
+    .part files of processes that are gone, or older than STALE_PART_S; the
+    in-flight files of other writers on the same directory are left alone.
+
+    The queue is bounded so a slow disk pushes back on the downloaders
+    instead of buffering without limit.
+    """
+
+    def __init__(self, directory, fsync_every: int = 32, fsync_interval_ms: float = 200.0, max_queue: int = 256):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.fsync_every = fsync_every
+        self.fsync_interval_s = fsync_interval_ms / 1000.0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._stats = {'files': 0, 'bytes': 0, 'batches': 0, 'errors': 0, 'fsync_s': 0.0, 'write_s': 0.0,
+                       'max_queue_depth': 0, 'queue_depth_sum': 0, 'submitted': 0}
+        self._started = time.perf_counter()
+        self._closed = False
+        self._tag = f"{os.getpid()}-{next(_writer_ids)}"
+        removed = self.remove_partials()
+        if removed:
+            logger.warning(f"Removed {removed} partial files left in {self.directory} by an interrupted run")
+        self._thread = threading.Thread(target=self._run, name='image-writer', daemon=True)
+        self._thread.start()
+        # the thread is a daemon so a forgotten close() cannot hang the interpreter; still drain at exit
+        atexit.register(self.close)
+
+    def remove_partials(self, max_age_s: float = STALE_PART_S) -> int:
+        """Remove abandoned .part files: their process is gone or they are older than max_age_s"""
+        now = time.time()
+        removed = 0
+        for path in self.directory.glob(f".*{PART_SUFFIX}"):
+            tag = path.name[:-len(PART_SUFFIX)].rsplit('.', 1)[-1]
+            pid = tag.split('-', 1)[0]
+            try:
+                age = now - path.stat().st_mtime
+            except FileNotFoundError:
+                continue  # committed or cleaned up meanwhile
+            if pid.isdigit() and _pid_alive(int(pid)) and age < max_age_s:
+                continue
+            path.unlink(missing_ok=True)
+            removed += 1
+        return removed
+
+    def submit(self, filename: str, content: bytes, on_commit: Optional[Callable[[], None]] = None):
+        """Queue a validated buffer; blocks while the queue is full"""
+        if self._closed:
+            raise RuntimeError("ImageWriter is closed")
+        depth = self._queue.qsize()
+        with self._lock:
+            self._stats['submitted'] += 1
+            self._stats['queue_depth_sum'] += depth
+            self._stats['max_queue_depth'] = max(self._stats['max_queue_depth'], depth)
+        self._queue.put((filename, content, on_commit))
+
+    def _run(self):
+        pending = []
+        deadline = None
+        while True:
+            timeout = None if not pending else max(0.0, deadline - time.perf_counter())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = ()
+            if item is None:
+                self._commit(pending)
+                self._queue.task_done()
+                return
+            if item:
+                written = self._write(*item)
+                if written is not None:
+                    pending.append(written)
+                    if deadline is None:
+                        deadline = time.perf_counter() + self.fsync_interval_s
+                else:
+                    self._queue.task_done()
+            if pending and (len(pending) >= self.fsync_every or time.perf_counter() >= deadline):
+                self._commit(pending)
+                pending, deadline = [], None
+
+    def _write(self, filename: str, content: bytes, on_commit):
+        final = self.directory / filename
+        part = final.with_name(f".{final.name}.{self._tag}{PART_SUFFIX}")
+        start = time.perf_counter()
+        f = None
+        try:
+            f = open(part, 'wb')
+            f.write(content)
+            f.flush()
+        except OSError as e:
+            logger.error(f"Could not write {final}: {e}")
+            if f is not None:
+                f.close()
+            with self._lock:
+                self._stats['errors'] += 1
+            part.unlink(missing_ok=True)
+            return None
+        with self._lock:
+            self._stats['write_s'] += time.perf_counter() - start
+        return f, part, final, len(content), on_commit
+
+    def _commit(self, pending):
+        """fsync, rename and directory fsync for a batch, then run its callbacks"""
+        if not pending:
+            return
+        start = time.perf_counter()
+        durable = []
+        for f, part, final, size, on_commit in pending:
+            try:
+                os.fsync(f.fileno())
+                f.close()
+                os.replace(part, final)
+                durable.append((size, on_commit))
+            except OSError as e:
+                logger.error(f"Could not commit {final}: {e}")
+                f.close()
+                part.unlink(missing_ok=True)
+                with self._lock:
+                    self._stats['errors'] += 1
+        _fsync_dir(self.directory)
+        with self._lock:
+            self._stats['fsync_s'] += time.perf_counter() - start
+            self._stats['batches'] += 1
+            self._stats['files'] += len(durable)
+            self._stats['bytes'] += sum(size for size, _ in durable)
+        for _, on_commit in durable:
+            if on_commit is not None:
+                try:
+                    on_commit()
+                except Exception as e:
+                    logger.error(f"Commit callback failed: {e}")
+        for _ in pending:
+            self._queue.task_done()
+
+    def flush(self):
+        """Wait until everything submitted so far is durable and committed"""
+        # a partial batch is committed within fsync_interval_ms, so this returns shortly after the last write
+        self._queue.join()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            s = dict(self._stats)
+        elapsed = time.perf_counter() - self._started
+        return {
+            'files': s['files'],
+            'mb': s['bytes'] / 1024 ** 2,
+            'errors': s['errors'],
+            'fsync_batches': s['batches'],
+            'files_per_batch': s['files'] / s['batches'] if s['batches'] else 0.0,
+            'write_mb_per_s': s['bytes'] / 1024 ** 2 / s['write_s'] if s['write_s'] else 0.0,
+            'fsync_ms_per_batch': s['fsync_s'] * 1000 / s['batches'] if s['batches'] else 0.0,
+            'files_per_s': s['files'] / elapsed if elapsed else 0.0,
+            'queue_depth': self._queue.qsize(),
+            'mean_queue_depth': s['queue_depth_sum'] / s['submitted'] if s['submitted'] else 0.0,
+            'max_queue_depth': s['max_queue_depth'],
+        }
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+        atexit.unregister(self.close)
+        stats = self.stats()
+        if stats['files']:
+            logger.info(f"Writer: {stats['files']} files ({stats['mb']:.1f} MB) in {stats['fsync_batches']} fsync "
+                        f"batches, {stats['files_per_batch']:.1f} files/batch, "
+                        f"max queue depth {stats['max_queue_depth']}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,210 @@
+"""
+Structured-data extraction for Zillow pages
+Search and listing pages embed their state as JSON (__NEXT_DATA__, or HTML-comment wrapped script data);
+reading listing ids and full photo galleries from it beats scraping whichever thumbnails happen to render
+"""
+
+import json
+import re
+import time
+import logging
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+from urllib.parse import urljoin, urlsplit, urlunsplit
+
+from utils.html_extract import extract_image_urls, page_path
+
+logger = logging.getLogger(__name__)
+
+BASE_URL = "https://www.zillow.com"
+
+# <script id="__NEXT_DATA__" type="application/json">{...}</script>, and the older
+# <script type="application/json" data-zrr-shared-data-key="..."><!--{...}--></script>
+_JSON_SCRIPT = re.compile(
+    r'<script\b(?=[^>]*(?:id="__NEXT_DATA__"|data-zrr-shared-data-key))[^>]*>\s*(?:<!--)?(.*?)(?:-->)?\s*</script>',
+    re.S | re.I)
+_ZPID = re.compile(r'(\d+)_zpid')
+_DETAIL_HREF = re.compile(r'href="([^"]*/homedetails/[^"]*?\d+_zpid/?)"')
+# photos.zillowstatic.com/fp/<key>-<size>.<ext>; the size suffix picks the rendition
+_PHOTO = re.compile(r'^(https?://photos\.zillowstatic\.com/fp/)([0-9a-f]+)-[A-Za-z0-9_]+\.(jpg|jpeg|webp)$')
+LARGE_PHOTO = 'uncropped_scaled_within_1536_1152'
+
+
+def search_url(location: str, page: int = 1, base_url: str = BASE_URL) -> str:
+    return f"{base_url}/homes/{location.replace(' ', '-')}_rb/{page}_p/"
+
+
+def embedded_json(html) -> List:
+    """Every JSON document embedded in the page's state scripts"""
+    if isinstance(html, bytes):
+        html = html.decode('utf-8', errors='replace')
+    documents = []
+    for match in _JSON_SCRIPT.finditer(html):
+        try:
+            documents.append(json.loads(match.group(1)))
+        except ValueError:
+            continue
+    return documents
+
+
+def _walk(node) -> Iterator[Dict]:
+    """Every dict nested in `node`, depth-first in document order
+
+    Some caches (e.g. gdpClientCache on listing pages) are JSON documents
+    stored as strings, so string values that look like JSON are parsed too.
+    """
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, str):
+            if len(node) > 1 and node[0] in '{[' and node[-1] in '}]':
+                try:
+                    stack.append(json.loads(node))
+                except ValueError:
+                    pass
+            continue
+        if isinstance(node, dict):
+            yield node
+            children = node.values()
+        elif isinstance(node, list):
+            children = node
+        else:
+            continue
+        stack.extend(reversed(list(children)))
+
+
+def zpid_from_url(url: str) -> Optional[str]:
+    match = _ZPID.search(url or '')
+    return match.group(1) if match else None
+
+
+def canonical_url(url: str, base_url: str = BASE_URL) -> str:
+    """Absolute URL without query or fragment, so one listing reached from two searches is one URL"""
+    parts = urlsplit(urljoin(base_url, url))
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, '', ''))
+
+
+def large_photo_url(url: str, size: str = LARGE_PHOTO) -> str:
+    """Same zillowstatic photo at a larger rendition; other URLs are returned unchanged"""
+    match = _PHOTO.match(url)
+    return f"{match.group(1)}{match.group(2)}-{size}.{match.group(3)}" if match else url
+
+
+def photo_key(url: str) -> str:
+    """Identity of a photo across renditions"""
+    match = _PHOTO.match(url)
+    return match.group(2) if match else url
+
+
+def _best_source(sources: Dict) -> Optional[str]:
+    """Widest jpeg (else webp) rendition of a mixedSources block"""
+    for fmt in ('jpeg', 'webp'):
+        candidates = [s for s in sources.get(fmt) or [] if isinstance(s, dict) and s.get('url')]
+        if candidates:
+            return max(candidates, key=lambda s: s.get('width') or 0)['url']
+    return None
+
+
+def _photos(listing: Dict) -> List[str]:
+    """Photo URLs carried by a search result card"""
+    urls = []
+    for photo in listing.get('carouselPhotos') or []:
+        if isinstance(photo, dict) and photo.get('url'):
+            urls.append(large_photo_url(photo['url']))
+    composable = listing.get('carouselPhotosComposable')
+    if isinstance(composable, dict) and composable.get('baseUrl'):
+        for photo in composable.get('photoData') or []:
+            if isinstance(photo, dict) and photo.get('photoKey'):
+                urls.append(large_photo_url(composable['baseUrl'].replace('{photoKey}', photo['photoKey'])))
+    if not urls and listing.get('imgSrc'):
+        urls.append(large_photo_url(listing['imgSrc']))
+    return list(dict.fromkeys(urls))
+
+
+def extract_listings(html, base_url: str = BASE_URL) -> List[Dict]:
+    """Listings of a search results page: [{'zpid', 'url', 'photos'}], deduped by zpid
+
+    Reads the embedded search state; pages without it (blocked, or a
+    layout change) fall back to the /homedetails/ links in the markup,
+    without photos.
+    """
+    listings: Dict[str, Dict] = {}
+    for document in embedded_json(html):
+        for node in _walk(document):
+            url = node.get('detailUrl') or node.get('hdpUrl')
+            if not isinstance(url, str) or '/homedetails/' not in url:
+                continue
+            zpid = str(node.get('zpid') or zpid_from_url(url) or '')
+            if not zpid:
+                continue
+            listing = listings.setdefault(zpid, {'zpid': zpid, 'url': canonical_url(url, base_url), 'photos': []})
+            listing['photos'] = list(dict.fromkeys(listing['photos'] + _photos(node)))
+    if listings:
+        return list(listings.values())
+
+    if isinstance(html, bytes):
+        html = html.decode('utf-8', errors='replace')
+    for href in _DETAIL_HREF.findall(html):
+        zpid = zpid_from_url(href)
+        listings.setdefault(zpid, {'zpid': zpid, 'url': canonical_url(href, base_url), 'photos': []})
+    return list(listings.values())
+
+
+def extract_gallery(html) -> List[str]:
+    """Full-size URLs of every photo of a listing page, in gallery order, one per photo
+
+    Uses the mixedSources renditions of the embedded property data and falls
+    back to the photo <img> nodes when the page has none.
+    """
+    urls = {}
+    for document in embedded_json(html):
+        for node in _walk(document):
+            sources = node.get('mixedSources')
+            if isinstance(sources, dict):
+                url = _best_source(sources)
+                if url:
+                    urls.setdefault(photo_key(url), url)
+    if urls:
+        return list(urls.values())
+    for url in extract_image_urls(html, class_contains='photo'):
+        urls.setdefault(photo_key(url), large_photo_url(url))
+    return list(urls.values())
+
+
+def fixture_fetcher(pages_dir) -> Callable[[str], bytes]:
+    """fetch(url) over pages saved with save_page(pages_dir, url, html), for offline runs and tests"""
+    pages_dir = Path(pages_dir)
+
+    def fetch(url: str) -> bytes:
+        return page_path(pages_dir, url).read_bytes()
+
+    return fetch
+
+
+def merge_listings(pages: Iterable[List[Dict]]) -> List[Dict]:
+    """Listings of many search pages deduped by zpid, first occurrence first; galleries are merged"""
+    merged: Dict[str, Dict] = {}
+    for listings in pages:
+        for listing in listings:
+            known = merged.get(listing['zpid'])
+            if known is None:
+                merged[listing['zpid']] = dict(listing, photos=list(listing['photos']))
+            else:
+                known['photos'] = list(dict.fromkeys(known['photos'] + listing['photos']))
+    return list(merged.values())
+
+
+if __name__ == "__main__":
+    import argparse
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Extract listings and galleries from saved Zillow pages")
+    parser.add_argument("pages", nargs='+', help="saved search or listing pages")
+    args = parser.parse_args()
+    for path in args.pages:
+        html = Path(path).read_bytes()
+        start = time.perf_counter()
+        listings = extract_listings(html)
+        gallery = extract_gallery(html)
+        elapsed = (time.perf_counter() - start) * 1000
+        logger.info(f"{path}: {len(listings)} listings, {sum(len(l['photos']) for l in listings)} card photos, "
+                    f"{len(gallery)} gallery photos ({elapsed:.1f} ms)")
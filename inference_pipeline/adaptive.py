@@ -0,0 +1,194 @@
+"""
+Resolution-adaptive two-pass inference
+Every photo goes through the detector at a small input size; only photos whose detections are unsure or
+tiny are re-run at a larger size (and tiled from there if still unsure). Costs are counted in model
+input megapixels so a policy can be compared with single-pass high resolution at equal recall
+    python -m inference_pipeline.adaptive --model small.onnx --input-size 320 --refine-model large.onnx
+        --refine-size 640 --images <dir> --labels <dir>
+"""
+
+import itertools
+import json
+import logging
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .boxes import box_area
+from .evaluation import _match, load_ground_truth
+from .tiling import detections_to_arrays
+
+logger = logging.getLogger(__name__)
+
+
+def pass_cost(input_size: int, passes: int = 1) -> float:
+    """Model input megapixels of `passes` square inputs, the unit every decision is charged in"""
+    return passes * input_size * input_size / 1e6
+
+
+class TwoPassPolicy:
+    """Decides from the small-input pass whether a photo needs the large one
+
+    The small pass runs with its confidence threshold at the bottom of the
+    uncertainty band so weak detections are visible to the policy. A photo is
+    refined when a detection scores inside the band, or when a confident one
+    covers less than small_box_fraction of the frame. Otherwise the small
+    pass is final and is cut at conf_threshold.
+    """
+
+    def __init__(self, conf_threshold: float = 0.25, uncertain_band: Tuple[float, float] = (0.1, 0.5),
+                 small_box_fraction: float = 0.002):
+        lo, hi = uncertain_band
+        if not lo <= conf_threshold <= hi:
+            raise ValueError(f"conf_threshold {conf_threshold} must lie inside the uncertainty band {uncertain_band}")
+        self.conf_threshold = conf_threshold
+        self.uncertain_band = (float(lo), float(hi))
+        self.small_box_fraction = small_box_fraction
+
+    @property
+    def first_pass_conf(self) -> float:
+        return self.uncertain_band[0]
+
+    @property
+    def config(self) -> Dict:
+        return {'two_pass': {'conf_threshold': self.conf_threshold, 'uncertain_band': list(self.uncertain_band),
+                             'small_box_fraction': self.small_box_fraction}}
+
+    def refine_reason(self, width: int, height: int, detections: List[Dict]) -> Optional[str]:
+        """Why this photo should get the large pass, or None"""
+        if not detections:
+            return None
+        boxes, scores, _ = detections_to_arrays(detections)
+        lo, hi = self.uncertain_band
+        if np.any((scores >= lo) & (scores < hi)):
+            return 'uncertain'
+        if np.any(box_area(boxes) < self.small_box_fraction * width * height):
+            return 'small_boxes'
+        return None
+
+    def accept(self, detections: List[Dict]) -> List[Dict]:
+        """Final detections of a photo the small pass settled"""
+        return [d for d in detections if d['score'] >= self.conf_threshold]
+
+
+def collect_passes(model: str, input_size: int, refine_model: str, refine_size: int, image_paths: Sequence,
+                   labels_dir, class_names: Optional[Sequence[str]] = None, first_pass_conf: float = 0.05,
+                   conf_threshold: float = 0.25, max_batch: int = 8) -> Dict:
+    """Small-pass detections (at a low threshold), large-pass detections and ground truth of every photo
+
+    Policies only differ in which photos take the large-pass result, so one
+    collection serves any number of simulate() calls.
+    """
+    from .engine import CLASS_NAMES, DetectionEngine
+    from .preprocess import decode_image
+
+    class_names = class_names or CLASS_NAMES
+    small = DetectionEngine(model, input_size, class_names, max_batch, conf_threshold=first_pass_conf)
+    large = DetectionEngine(refine_model, refine_size, class_names, max_batch, conf_threshold=conf_threshold)
+    collected = {'small': [], 'large': [], 'sizes': [], 'ground_truth': [],
+                 'input_size': input_size, 'refine_size': refine_size, 'first_pass_conf': first_pass_conf}
+    for start in range(0, len(image_paths), max_batch):
+        small_images, large_images, sizes = [], [], []
+        for path in image_paths[start:start + max_batch]:
+            data = Path(path).read_bytes()
+            img, size = decode_image(data, input_size)
+            if img is None:
+                logger.warning(f"Could not decode {path}")
+                continue
+            small_images.append(img)
+            large_images.append(decode_image(data, refine_size)[0])
+            sizes.append(size)
+            collected['ground_truth'].append(load_ground_truth(labels_dir, path, *size))
+        collected['small'].extend(small.infer(small_images, sizes))
+        collected['large'].extend(large.infer(large_images, sizes))
+        collected['sizes'].extend(sizes)
+    return collected
+
+
+def recall_precision(predictions: List[List[Dict]], ground_truth: List[Tuple[np.ndarray, np.ndarray]],
+                     iou_threshold: float = 0.5) -> Tuple[float, float]:
+    """Recall and precision of final (already thresholded) detections, matched per class"""
+    tp = n_pred = n_gt = 0
+    for detections, (gt_classes, gt_boxes) in zip(predictions, ground_truth):
+        n_gt += len(gt_classes)
+        n_pred += len(detections)
+        if not detections or not len(gt_classes):
+            continue
+        boxes, scores, classes = detections_to_arrays(detections)
+        for c in np.unique(classes):
+            mask = classes == c
+            order = np.argsort(-scores[mask], kind='stable')
+            tp += int(_match(boxes[mask][order], gt_boxes[gt_classes == c], [iou_threshold]).sum())
+    return (tp / n_gt if n_gt else 1.0), (tp / n_pred if n_pred else 1.0)
+
+
+def simulate(collected: Dict, policy: TwoPassPolicy) -> Dict:
+    """Recall, precision, refine rate and mean cost per photo of a policy over collected passes"""
+    final, refined = [], []
+    for small, large, (width, height) in zip(collected['small'], collected['large'], collected['sizes']):
+        reason = policy.refine_reason(width, height, small)
+        refined.append(reason is not None)
+        final.append(large if reason else policy.accept(small))
+    recall, precision = recall_precision(final, collected['ground_truth'])
+    refined = np.array(refined, dtype=bool)
+    small_cost, large_cost = pass_cost(collected['input_size']), pass_cost(collected['refine_size'])
+    return {
+        'recall': recall,
+        'precision': precision,
+        'refine_rate': float(refined.mean()) if len(refined) else 0.0,
+        'cost_mpx_per_image': small_cost + large_cost * float(refined.mean()) if len(refined) else 0.0,
+        'single_pass_cost_mpx': large_cost,
+    }
+
+
+def tune_policy(collected: Dict, conf_threshold: float = 0.25, max_recall_drop: float = 0.0,
+                band_lows: Optional[Iterable[float]] = None, band_highs: Optional[Iterable[float]] = None,
+                small_box_fractions: Iterable[float] = (0.0, 0.001, 0.002, 0.005)) -> Dict:
+    """Cheapest policy whose recall is within max_recall_drop of single-pass large input
+
+    Ties go to the wider band, which refines more and leaves margin for
+    photos unlike the evaluation set.
+    """
+    single_recall, single_precision = recall_precision(collected['large'], collected['ground_truth'])
+    lows = band_lows if band_lows is not None else np.round(np.linspace(0.05, conf_threshold, 5), 3)
+    highs = band_highs if band_highs is not None else np.round(np.linspace(conf_threshold, 0.9, 6), 3)
+    best, best_key = None, None
+    for lo, hi, small in itertools.product(lows, highs, small_box_fractions):
+        if lo < collected['first_pass_conf'] - 1e-6:
+            continue  # the collected small pass never saw scores that low
+        policy = TwoPassPolicy(conf_threshold, (float(lo), float(hi)), float(small))
+        result = simulate(collected, policy)
+        if result['recall'] < single_recall - max_recall_drop:
+            continue
+        key = (-result['cost_mpx_per_image'], hi - lo, -small)
+        if best_key is None or key > best_key:
+            best, best_key = dict(result, policy=policy.config['two_pass']), key
+    return {'single_pass': {'recall': single_recall, 'precision': single_precision,
+                            'cost_mpx_per_image': pass_cost(collected['refine_size'])},
+            'two_pass': best}
+
+
+if __name__ == "__main__":
+    import argparse
+    from model_training.data_loader import list_images
+
+    parser = argparse.ArgumentParser(description="Compare two-pass inference with single-pass large input")
+    parser.add_argument("--model", required=True, help="small-input detector")
+    parser.add_argument("--input-size", type=int, default=320)
+    parser.add_argument("--refine-model", help="large-input detector (default --model, needs dynamic input size)")
+    parser.add_argument("--refine-size", type=int, default=640)
+    parser.add_argument("--images", required=True)
+    parser.add_argument("--labels", required=True, help="YOLO label files of the photos")
+    parser.add_argument("--conf", type=float, default=0.25)
+    parser.add_argument("--max-recall-drop", type=float, default=0.0)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    passes = collect_passes(args.model, args.input_size, args.refine_model or args.model, args.refine_size,
+                            list_images(args.images), args.labels, first_pass_conf=0.05, conf_threshold=args.conf)
+    default = simulate(passes, TwoPassPolicy(args.conf))
+    logger.info(f"Default policy: recall {default['recall']:.3f}, refined {default['refine_rate']:.1%}, "
+                f"{default['cost_mpx_per_image']:.3f} vs {default['single_pass_cost_mpx']:.3f} Mpx per image")
+    tuned = tune_policy(passes, args.conf, args.max_recall_drop)
+    logger.info(json.dumps(tuned, indent=2))
@@ -0,0 +1,324 @@
+"""
+Inference benchmark harness
+Replays a directory of photos (or synthetic ones) through the pipeline for every engine configuration
+and writes machine-readable results tagged with the git commit, so runs can be compared across commits
+    python -m inference_pipeline.main bench --model model.onnx --images <dir> --batch-sizes 1 8 --tile-modes 0 1
+"""
+
+import argparse
+import itertools
+import json
+import logging
+import multiprocessing as mp
+import os
+import platform
+import queue as queue_module
+import resource
+import subprocess
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Engine settings a benchmark grid may vary, mapped to their argparse names in main.add_engine_args
+GRID_KEYS = ('max_batch', 'threads', 'workers', 'tile', 'cache', 'prefilter', 'variant', 'refine_size')
+
+# Metrics compared by compare_runs, and whether higher is better
+COMPARED = {'images_per_s': True, 'p50_ms': False, 'p95_ms': False, 'p99_ms': False, 'peak_rss_mb': False}
+
+
+def git_commit(repo_dir: Optional[Path] = None) -> Dict:
+    repo_dir = repo_dir or Path(__file__).resolve().parent.parent
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=repo_dir, capture_output=True, text=True,
+                                check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=repo_dir,
+                                    capture_output=True, text=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return {'commit': None, 'dirty': None}
+    return {'commit': commit, 'dirty': dirty}
+
+
+def synthetic_images(n: int, sizes: Sequence[Sequence[int]] = ((1600, 1067), (4000, 3000), (1024, 768)),
+                     seed: int = 0) -> List[bytes]:
+    """JPEG bytes of smooth random scenes at listing-photo resolutions"""
+    rng = np.random.default_rng(seed)
+    payloads = []
+    for i in range(n):
+        width, height = sizes[i % len(sizes)]
+        low = rng.integers(0, 255, (9, 12, 3), dtype=np.uint8)
+        img = cv2.resize(low, (width, height), interpolation=cv2.INTER_CUBIC)
+        img = cv2.add(img, rng.integers(0, 8, img.shape, dtype=np.uint8))
+        payloads.append(cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, 90])[1].tobytes())
+    return payloads
+
+
+def load_payloads(images_dir: Optional[str] = None, synthetic: int = 0, limit: Optional[int] = None) -> List[bytes]:
+    if images_dir:
+        from model_training.data_loader import list_images
+        return [p.read_bytes() for p in list_images(images_dir)[:limit]]
+    return synthetic_images(synthetic or 32)
+
+
+def expand_grid(**axes) -> List[Dict]:
+    """Cartesian product of the given axes, e.g. expand_grid(max_batch=[1, 8], tile=[False, True])"""
+    keys = [k for k in GRID_KEYS if k in axes]
+    return [dict(zip(keys, values)) for values in itertools.product(*(axes[k] for k in keys))]
+
+
+def config_name(config: Dict) -> str:
+    short = {'max_batch': 'b', 'threads': 't', 'workers': 'w', 'tile': 'tile', 'cache': 'cache', 'prefilter': 'pf',
+             'variant': '', 'refine_size': 'r'}
+    return '-'.join(f"{short[k]}{int(v) if isinstance(v, bool) else v}" for k, v in config.items())
+
+
+def _replay(pipeline, payloads: List[bytes], requests: int, concurrency: int, rate: Optional[float]):
+    """Submit `requests` images cycling over payloads; returns (latencies ms, errors, elapsed s)
+
+    Closed loop keeps `concurrency` images in flight. With a rate, arrivals
+    follow a fixed schedule (still capped at `concurrency` in flight, like a
+    client connection limit) and latency counts from the scheduled time, so
+    queueing behind a saturated engine shows up in the tail.
+    """
+    latencies = np.full(requests, np.nan)
+    errors = 0
+    lock = threading.Lock()
+    inflight = threading.Semaphore(concurrency)
+    done = threading.Event()
+    remaining = requests
+
+    def complete(failed: bool):
+        nonlocal errors, remaining
+        inflight.release()
+        with lock:
+            errors += failed
+            remaining -= 1
+            if remaining == 0:
+                done.set()
+
+    def finish(i, started, future):
+        failed = future.exception() is not None
+        if not failed:
+            latencies[i] = (time.perf_counter() - started) * 1000
+        complete(failed)
+
+    start = time.perf_counter()
+    for i in range(requests):
+        if rate:
+            started = start + i / rate
+            delay = started - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        else:
+            started = None
+        inflight.acquire()
+        started = started or time.perf_counter()
+        try:
+            future = pipeline.submit_bytes(payloads[i % len(payloads)])
+        except Exception:
+            complete(True)
+            continue
+        future.add_done_callback(lambda f, i=i, started=started: finish(i, started, f))
+    if requests:
+        done.wait()
+    return latencies[~np.isnan(latencies)], errors, time.perf_counter() - start
+
+
+def _cpu_seconds() -> float:
+    usage = [resource.getrusage(who) for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN)]
+    return sum(u.ru_utime + u.ru_stime for u in usage)
+
+
+def run_config(engine_args: Dict, config: Dict, source: Dict, requests: int, concurrency: int = 16,
+               rate: Optional[float] = None, warmup: int = 8) -> Dict:
+    """Benchmark one configuration in the current process"""
+    from .main import build_pipeline
+
+    payloads = load_payloads(**source)
+    args = dict(engine_args, **config)
+    # never touch the real result cache, a cached config gets a fresh one
+    use_cache = config.get('cache', not engine_args.get('no_cache', False))
+    cache_dir = None
+    if use_cache:
+        cache_dir = tempfile.TemporaryDirectory(prefix='bench-cache-')
+        args['cache'], args['no_cache'] = os.path.join(cache_dir.name, 'cache.sqlite'), False
+    else:
+        args['cache'], args['no_cache'] = None, True
+    args['workers'] = args.get('workers') or 0
+    pipeline = build_pipeline(argparse.Namespace(**args))
+    model_version = pipeline.batcher.engine.model_version
+
+    try:
+        # warm-up goes through the engine only, a warm cache would flatter the first round
+        if warmup:
+            cache, pipeline.cache = pipeline.cache, None
+            _replay(pipeline, payloads, min(warmup, len(payloads)), concurrency, None)
+            pipeline.cache = cache
+        pipeline.metrics.reset()
+        cpu_start = _cpu_seconds()
+        latencies, errors, elapsed = _replay(pipeline, payloads, requests, concurrency, rate)
+        snapshot = pipeline.metrics.snapshot()
+        batch_sizes = pipeline.metrics.values('batch_size').astype(np.int64)
+    finally:
+        pipeline.close()
+        if cache_dir is not None:
+            cache_dir.cleanup()
+    cpu = _cpu_seconds() - cpu_start
+
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) if len(latencies) else (np.nan,) * 3
+    counters = snapshot['counters']
+    return {
+        'config': config,
+        'model_version': model_version,
+        'requests': requests,
+        'completed': int(len(latencies)),
+        'errors': errors,
+        'elapsed_s': elapsed,
+        'images_per_s': len(latencies) / elapsed if elapsed else 0.0,
+        'p50_ms': float(p50), 'p95_ms': float(p95), 'p99_ms': float(p99),
+        'mean_ms': float(latencies.mean()) if len(latencies) else float('nan'),
+        'batch_size_hist': {int(k): int(v) for k, v in enumerate(np.bincount(batch_sizes)) if v},
+        'mean_batch_fill': snapshot['series'].get('batch_fill', {}).get('mean'),
+        # worker processes are reaped by pipeline.close(), so their CPU time is in RUSAGE_CHILDREN
+        'cpu_utilization': cpu / elapsed / os.cpu_count() if elapsed else 0.0,
+        'cpu_seconds_per_image': cpu / max(len(latencies), 1),
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'peak_child_rss_mb': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+        'cache_hit_rate': snapshot.get('cache_hit_rate'),
+        'tiled_images': int(counters.get('tiled_images', 0)),
+        'prefilter_skipped': int(counters.get('prefilter_skipped', 0)),
+        'refined_images': int(counters.get('refined_images', 0)),
+        # model input megapixels per photo; two-pass records it, single pass is one input
+        'cost_mpx_per_image': snapshot['series'].get('cost_mpx', {}).get('mean',
+                                                                          args['input_size'] ** 2 / 1e6),
+    }
+
+
+def variant_speedups(results: List[Dict]) -> Dict[str, Dict]:
+    """Throughput and median latency of each int8 result relative to the same configuration on fp32"""
+    def without_variant(config):
+        return tuple((k, v) for k, v in config.items() if k != 'variant')
+
+    fp32 = {without_variant(r['config']): r for r in results
+            if 'error' not in r and r['config'].get('variant', 'fp32') == 'fp32'}
+    speedups = {}
+    for result in results:
+        if 'error' in result or result['config'].get('variant') != 'int8':
+            continue
+        base = fp32.get(without_variant(result['config']))
+        if base is None or not base['images_per_s']:
+            continue
+        speedups[result['name']] = {
+            'baseline': base['name'],
+            'throughput': result['images_per_s'] / base['images_per_s'],
+            'p50_latency': base['p50_ms'] / result['p50_ms'] if result['p50_ms'] else float('nan'),
+        }
+        result['speedup_vs_fp32'] = speedups[result['name']]['throughput']
+    return speedups
+
+
+def _run_isolated(queue, *args):
+    logging.basicConfig(level=logging.WARNING)
+    try:
+        queue.put(run_config(*args))
+    except Exception as e:
+        queue.put({'error': f"{type(e).__name__}: {e}"})
+
+
+def _wait_isolated(queue, proc, poll_s: float = 1.0) -> Dict:
+    """The child's result, or a failed row once it has exited without one (OOM-kill, crash)"""
+    while True:
+        try:
+            return queue.get(timeout=poll_s)
+        except queue_module.Empty:
+            if proc.is_alive():
+                continue
+        # it may have put its result just before exiting
+        try:
+            return queue.get(timeout=poll_s)
+        except queue_module.Empty:
+            proc.join()
+            return {'error': f"benchmark process died with exit code {proc.exitcode}", 'exitcode': proc.exitcode}
+
+
+def run_benchmark(engine_args: Dict, configs: List[Dict], source: Dict, requests: Optional[int] = None,
+                  concurrency: int = 16, rate: Optional[float] = None, output: Optional[str] = None,
+                  isolate: bool = True) -> Dict:
+    """Run every configuration and write one JSON document with all of them
+
+    Each configuration runs in a fresh spawned process so peak RSS and CPU
+    time belong to that configuration alone.
+    """
+    requests = requests or 2 * len(load_payloads(**source))
+    run = {
+        'git': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'host': {'platform': platform.platform(), 'python': platform.python_version(),
+                 'cpu_count': os.cpu_count(), 'cores_usable': len(os.sched_getaffinity(0))},
+        'model': engine_args.get('model'),
+        'source': source,
+        'mode': {'requests': requests, 'concurrency': concurrency, 'rate': rate},
+        'results': [],
+    }
+    ctx = mp.get_context('spawn')
+    for config in configs:
+        if isolate:
+            queue = ctx.Queue()
+            proc = ctx.Process(target=_run_isolated, args=(queue, engine_args, config, source, requests,
+                                                           concurrency, rate))
+            proc.start()
+            result = _wait_isolated(queue, proc)
+            proc.join()
+        else:
+            result = run_config(engine_args, config, source, requests, concurrency, rate)
+        result['name'] = config_name(config)
+        run['results'].append(result)
+        if 'error' in result:
+            logger.error(f"{result['name']}: {result['error']}")
+            continue
+        logger.info(f"{result['name']:28s} {result['images_per_s']:8.1f} img/s | p50 {result['p50_ms']:7.1f} "
+                    f"p95 {result['p95_ms']:7.1f} p99 {result['p99_ms']:7.1f} ms | cpu {result['cpu_utilization']:.0%} "
+                    f"| rss {result['peak_rss_mb']:.0f} MB | batches {result['batch_size_hist']}")
+
+    run['variant_speedups'] = variant_speedups(run['results'])
+    for name, speedup in run['variant_speedups'].items():
+        logger.info(f"{name}: {speedup['throughput']:.2f}x throughput, {speedup['p50_latency']:.2f}x p50 latency "
+                    f"vs {speedup['baseline']}")
+
+    if output:
+        output = Path(output)
+        if output.suffix != '.json':
+            commit = (run['git']['commit'] or 'nogit')[:10]
+            output = output / f"bench-{commit}-{time.strftime('%Y%m%d-%H%M%S')}.json"
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(json.dumps(run, indent=2))
+        logger.info(f"Wrote {output}")
+        run['path'] = str(output)
+    return run
+
+
+def compare_runs(baseline: Dict, current: Dict, tolerance: float = 0.1) -> List[Dict]:
+    """Per-configuration relative change of the COMPARED metrics; flags regressions beyond tolerance"""
+    base = {r['name']: r for r in baseline['results'] if 'error' not in r}
+    rows = []
+    for result in current['results']:
+        old = base.get(result.get('name'))
+        if old is None or 'error' in result:
+            continue
+        for metric, higher_is_better in COMPARED.items():
+            before, after = old.get(metric), result.get(metric)
+            if not before or after is None:
+                continue
+            change = (after - before) / before
+            regressed = change < -tolerance if higher_is_better else change > tolerance
+            rows.append({'name': result['name'], 'metric': metric, 'before': before, 'after': after,
+                         'change': change, 'regressed': regressed})
+            if regressed:
+                logger.warning(f"{result['name']} {metric}: {before:.2f} -> {after:.2f} ({change:+.1%})")
+    return rows
@@ -0,0 +1,281 @@
+"""
+Vectorized box operations shared by the data tooling, training labels and the detector
+Boxes are (N, 4) float arrays; formats are xyxy, xywh (COCO / annotation template), cxcywh (YOLO)
+"""
+
+import logging
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# ---- format conversion ---------------------------------------------------
+
+def _out(boxes: np.ndarray, out: Optional[np.ndarray]) -> np.ndarray:
+    return np.empty_like(boxes) if out is None else out
+
+
+def xywh_to_xyxy(boxes: np.ndarray, out: Optional[np.ndarray] = None) -> np.ndarray:
+    out = _out(boxes, out)
+    np.add(boxes[:, :2], boxes[:, 2:], out=out[:, 2:])
+    out[:, :2] = boxes[:, :2]
+    return out
+
+
+def xyxy_to_xywh(boxes: np.ndarray, out: Optional[np.ndarray] = None) -> np.ndarray:
+    out = _out(boxes, out)
+    np.subtract(boxes[:, 2:], boxes[:, :2], out=out[:, 2:])
+    out[:, :2] = boxes[:, :2]
+    return out
+
+
+def cxcywh_to_xyxy(boxes: np.ndarray, out: Optional[np.ndarray] = None) -> np.ndarray:
+    out = _out(boxes, out)
+    half = boxes[:, 2:] * 0.5
+    centre = boxes[:, :2].copy()  # `out` may alias `boxes`
+    np.subtract(centre, half, out=out[:, :2])
+    np.add(centre, half, out=out[:, 2:])
+    return out
+
+
+def xyxy_to_cxcywh(boxes: np.ndarray, out: Optional[np.ndarray] = None) -> np.ndarray:
+    out = _out(boxes, out)
+    wh = boxes[:, 2:] - boxes[:, :2]
+    np.add(boxes[:, :2], wh * 0.5, out=out[:, :2])
+    out[:, 2:] = wh
+    return out
+
+
+def yolo_to_xyxy(rows: np.ndarray, width: float, height: float) -> Tuple[np.ndarray, np.ndarray]:
+    """YOLO label rows [class, cx, cy, w, h] (normalized) -> (classes, xyxy pixel boxes)"""
+    boxes = cxcywh_to_xyxy(rows[:, 1:5])
+    boxes *= np.array([width, height, width, height], dtype=boxes.dtype)
+    return rows[:, 0].astype(np.int64), boxes
+
+
+def xyxy_to_yolo(classes: np.ndarray, boxes: np.ndarray, width: float, height: float) -> np.ndarray:
+    """(classes, xyxy pixel boxes) -> YOLO label rows [class, cx, cy, w, h] (normalized)"""
+    rows = np.empty((len(boxes), 5), dtype=np.float64)
+    rows[:, 0] = classes
+    xyxy_to_cxcywh(boxes, out=rows[:, 1:5])
+    rows[:, 1:5] /= np.array([width, height, width, height])
+    return rows
+
+
+def parse_bbox_strings(values: Sequence[str]) -> np.ndarray:
+    """Annotation-template "x,y,w,h" strings -> (N, 4) xywh, NaN rows for blanks"""
+    out = np.full((len(values), 4), np.nan, dtype=np.float64)
+    for i, value in enumerate(values):
+        if isinstance(value, str) and value.strip():
+            out[i] = [float(v) for v in value.split(',')]
+    return out
+
+
+def format_bbox_strings(boxes: np.ndarray) -> List[str]:
+    """(N, 4) xywh -> annotation-template "x,y,w,h" strings"""
+    return ['' if np.isnan(b).any() else ','.join(f"{v:.1f}" for v in b) for b in boxes]
+
+
+# ---- geometry ------------------------------------------------------------
+
+def box_area(boxes: np.ndarray) -> np.ndarray:
+    return (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+
+
+def clip_boxes(boxes: np.ndarray, width: float, height: float, out: Optional[np.ndarray] = None) -> np.ndarray:
+    out = _out(boxes, out)
+    np.clip(boxes[:, 0::2], 0, width, out=out[:, 0::2])
+    np.clip(boxes[:, 1::2], 0, height, out=out[:, 1::2])
+    return out
+
+
+def scale_boxes(boxes: np.ndarray, sx: float, sy: Optional[float] = None, offset: Sequence[float] = (0, 0),
+                out: Optional[np.ndarray] = None) -> np.ndarray:
+    """boxes * (sx, sy) + offset, e.g. to undo a letterbox: scale_boxes(b, 1/s, offset=(-l/s, -t/s))"""
+    sy = sx if sy is None else sy
+    out = _out(boxes, out)
+    np.multiply(boxes, np.array([sx, sy, sx, sy], dtype=boxes.dtype), out=out)
+    if offset[0] or offset[1]:
+        out += np.array([offset[0], offset[1], offset[0], offset[1]], dtype=boxes.dtype)
+    return out
+
+
+def pairwise_iou(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """(N, M) IoU between two sets of xyxy boxes"""
+    inter_w = np.minimum(a[:, None, 2], b[None, :, 2]) - np.maximum(a[:, None, 0], b[None, :, 0])
+    inter_h = np.minimum(a[:, None, 3], b[None, :, 3]) - np.maximum(a[:, None, 1], b[None, :, 1])
+    np.clip(inter_w, 0, None, out=inter_w)
+    np.clip(inter_h, 0, None, out=inter_h)
+    inter = np.multiply(inter_w, inter_h, out=inter_w)
+    union = box_area(a)[:, None] + box_area(b)[None, :] - inter
+    return np.divide(inter, np.maximum(union, 1e-9, out=union), out=inter)
+
+
+# ---- suppression / fusion -----------------------------------------------
+
+def nms(boxes: np.ndarray, scores: np.ndarray, iou_threshold: float) -> np.ndarray:
+    """Greedy NMS over xyxy boxes, returns kept indices by descending score
+
+    Each iteration is one vectorized IoU of the current best box against the
+    survivors, so the Python loop runs once per *kept* box. That is fast when
+    boxes cluster (raw detector output keeps a few per object) but quadratic
+    when few are suppressed: 30k scattered boxes take ~2 s here, where
+    torchvision.ops.nms is the better tool.
+    """
+    order = np.argsort(-scores, kind='stable')
+    x1, y1, x2, y2 = (np.ascontiguousarray(boxes[order, i]) for i in range(4))
+    areas = (x2 - x1) * (y2 - y1)
+    alive = np.arange(len(order))
+    keep = []
+    while alive.size:
+        i = alive[0]
+        keep.append(i)
+        rest = alive[1:]
+        w = np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest])
+        h = np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest])
+        inter = np.clip(w, 0, None) * np.clip(h, 0, None)
+        alive = rest[inter <= iou_threshold * (areas[i] + areas[rest] - inter)]
+    return order[np.array(keep, dtype=np.int64)]
+
+
+def _class_offsets(boxes: np.ndarray, classes: np.ndarray) -> np.ndarray:
+    # shifting each class into its own coordinate range makes one NMS pass class-aware
+    span = float(boxes.max() - min(boxes.min(), 0)) + 1 if len(boxes) else 1
+    return boxes + (classes.astype(boxes.dtype) * span)[:, None]
+
+
+def batched_nms(boxes: np.ndarray, scores: np.ndarray, classes: np.ndarray, iou_threshold: float) -> np.ndarray:
+    """Class-aware NMS: boxes of different classes never suppress each other"""
+    if len(boxes) == 0:
+        return np.zeros(0, dtype=np.int64)
+    return nms(_class_offsets(boxes, classes), scores, iou_threshold)
+
+
+def soft_nms(boxes: np.ndarray, scores: np.ndarray, sigma: float = 0.5, score_threshold: float = 0.001,
+             iou_threshold: float = 0.3, method: str = 'gaussian') -> Tuple[np.ndarray, np.ndarray]:
+    """Soft-NMS: decay overlapping scores instead of dropping boxes
+
+    Returns (kept indices, decayed scores) in pick order.
+    """
+    scores = scores.astype(np.float64).copy()
+    x1, y1, x2, y2 = (np.ascontiguousarray(boxes[:, i], dtype=np.float64) for i in range(4))
+    areas = (x2 - x1) * (y2 - y1)
+    alive = np.flatnonzero(scores >= score_threshold)
+    keep, kept_scores = [], []
+    while alive.size:
+        best = alive[np.argmax(scores[alive])]
+        keep.append(best)
+        kept_scores.append(scores[best])
+        alive = alive[alive != best]
+        if not alive.size:
+            break
+        w = np.clip(np.minimum(x2[best], x2[alive]) - np.maximum(x1[best], x1[alive]), 0, None)
+        h = np.clip(np.minimum(y2[best], y2[alive]) - np.maximum(y1[best], y1[alive]), 0, None)
+        inter = w * h
+        iou = inter / (areas[best] + areas[alive] - inter + 1e-9)
+        if method == 'gaussian':
+            scores[alive] *= np.exp(-(iou * iou) / sigma)
+        else:
+            scores[alive] *= np.where(iou > iou_threshold, 1 - iou, 1.0)
+        alive = alive[scores[alive] >= score_threshold]
+    return np.array(keep, dtype=np.int64), np.array(kept_scores)
+
+
+def weighted_box_fusion(boxes: np.ndarray, scores: np.ndarray, classes: np.ndarray,
+                        iou_threshold: float = 0.55) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Fuse overlapping same-class boxes into their score-weighted average
+
+    Clusters are seeded by class-aware NMS; every box joins the seed it
+    overlaps most. Returns (boxes, scores, classes) of the seeds.
+    """
+    if len(boxes) == 0:
+        return boxes, scores, classes
+    keep = batched_nms(boxes, scores, classes, iou_threshold)
+    ious = pairwise_iou(boxes, boxes[keep])
+    ious[classes[:, None] != classes[keep][None, :]] = -1
+    cluster = ious.argmax(axis=1)
+    member = ious[np.arange(len(boxes)), cluster] >= iou_threshold
+    # a zero-area seed has IoU 0 with itself; every seed still belongs to its own cluster
+    cluster[keep] = np.arange(len(keep))
+    member[keep] = True
+    weights = scores[member].astype(np.float64)
+    fused = np.zeros((len(keep), 4), dtype=np.float64)
+    np.add.at(fused, cluster[member], boxes[member] * weights[:, None])
+    fused /= np.bincount(cluster[member], weights, minlength=len(keep))[:, None]
+    return fused.astype(boxes.dtype), scores[keep], classes[keep]
+
+
+# ---- benchmark -------------------------------------------------------------
+
+def random_boxes(n: int, size: float = 1000.0, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    xy = rng.uniform(0, size, (n, 2))
+    wh = rng.uniform(4, size / 8, (n, 2))
+    return np.concatenate([xy, xy + wh], axis=1).astype(np.float32)
+
+
+def candidate_boxes(n: int, objects: int, size: float = 1000.0, seed: int = 0) -> np.ndarray:
+    """Detector-like candidates: jittered copies of a few object boxes"""
+    rng = np.random.default_rng(seed)
+    centres = random_boxes(objects, size, seed)
+    picked = centres[rng.integers(0, objects, n)]
+    wh = np.tile(picked[:, 2:] - picked[:, :2], 2)
+    return (picked + rng.normal(0, 0.08, (n, 4)) * wh).astype(np.float32)
+
+
+def benchmark(sizes: Sequence[int] = (1000, 10000, 30000), repeat: int = 5) -> List[Dict]:
+    """ms per call of IoU / NMS / batched NMS for each size, plus torchvision's CPU ops when installed
+
+    'candidates' looks like raw detector output (many boxes per object) and is
+    the case the pipeline sees; 'uniform' barely suppresses anything and is
+    the worst case for greedy NMS, which is then far slower than torchvision.
+    """
+    import time
+    try:
+        import torch
+        import torchvision
+    except ImportError:
+        torch = torchvision = None
+
+    def timeit(fn):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            fn()
+        return (time.perf_counter() - start) * 1000 / repeat
+
+    results = []
+    for n, kind in ((n, kind) for kind in ('candidates', 'uniform') for n in sizes):
+        if kind == 'candidates':
+            boxes = candidate_boxes(n, max(n // 50, 1), size=4000)
+        else:
+            boxes = random_boxes(n, size=4000)
+        scores = np.random.default_rng(1).random(n).astype(np.float32)
+        classes = np.random.default_rng(2).integers(0, 3, n)
+        row = {'kind': kind, 'n': n,
+               'nms_ms': timeit(lambda: nms(boxes, scores, 0.5)),
+               'batched_nms_ms': timeit(lambda: batched_nms(boxes, scores, classes, 0.5)),
+               'iou_ms': timeit(lambda: pairwise_iou(boxes[:1000], boxes))}
+        if torchvision is not None:
+            tb, ts, tc = torch.from_numpy(boxes), torch.from_numpy(scores), torch.from_numpy(classes)
+            row.update(torchvision_nms_ms=timeit(lambda: torchvision.ops.nms(tb, ts, 0.5)),
+                       torchvision_batched_nms_ms=timeit(lambda: torchvision.ops.batched_nms(tb, ts, tc, 0.5)),
+                       torchvision_iou_ms=timeit(lambda: torchvision.ops.box_iou(tb[:1000], tb)))
+        results.append(row)
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Benchmark the box ops")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 30000])
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    for row in benchmark(args.sizes):
+        line = (f"{row['kind']:10s} n={row['n']:6d} | nms {row['nms_ms']:8.2f} ms"
+                f" | batched_nms {row['batched_nms_ms']:8.2f} ms | iou 1000x{row['n']} {row['iou_ms']:8.2f} ms")
+        if 'torchvision_nms_ms' in row:
+            line += (f" || torchvision nms {row['torchvision_nms_ms']:8.2f} ms"
+                     f" | batched_nms {row['torchvision_batched_nms_ms']:8.2f} ms"
+                     f" | box_iou {row['torchvision_iou_ms']:8.2f} ms")
+        logger.info(line)
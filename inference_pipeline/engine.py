@@ -0,0 +1,234 @@
+"""
+CPU detection engine for TV / fireplace / camera detection
+ONNX Runtime (or OpenCV DNN) behind a dynamic batcher that trades a few ms of latency for throughput
+"""
+
+import hashlib
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from .metrics import PipelineMetrics
+from .postprocess import decode_detections
+from .preprocess import BatchBuffer
+
+logger = logging.getLogger(__name__)
+
+CLASS_NAMES = ('tv', 'fireplace', 'camera')
+
+
+def model_version(model_path) -> str:
+    with open(model_path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()[:12]
+
+
+def engine_config(input_size: int, class_names: Sequence[str], conf_threshold: float, iou_threshold: float) -> Dict:
+    """Everything besides the weights that changes what an engine returns"""
+    return {'input_size': input_size, 'class_names': list(class_names),
+            'conf_threshold': conf_threshold, 'iou_threshold': iou_threshold}
+
+
+class DetectionEngine:
+    """Runs a YOLO-style ONNX detector on BGR images with preallocated input buffers"""
+
+    def __init__(self, model_path, input_size: int = 640, class_names: Sequence[str] = CLASS_NAMES,
+                 max_batch: int = 8, backend: str = 'onnxruntime', threads: Optional[int] = None,
+                 conf_threshold: float = 0.25, iou_threshold: float = 0.45):
+        self.model_path = str(model_path)
+        self.input_size = input_size
+        self.class_names = tuple(class_names)
+        self.max_batch = max_batch
+        self.backend = backend
+        self.conf_threshold = conf_threshold
+        self.iou_threshold = iou_threshold
+        self.fixed_batch = None
+        self.model_version = model_version(self.model_path)
+
+        if backend == 'onnxruntime':
+            import onnxruntime as ort
+            options = ort.SessionOptions()
+            options.intra_op_num_threads = threads or os.cpu_count()
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            self.session = ort.InferenceSession(self.model_path, options, providers=['CPUExecutionProvider'])
+            model_input = self.session.get_inputs()[0]
+            self.input_name = model_input.name
+            if isinstance(model_input.shape[0], int):
+                self.fixed_batch = model_input.shape[0]
+                self.max_batch = min(max_batch, self.fixed_batch)
+        elif backend == 'opencv':
+            self.net = cv2.dnn.readNetFromONNX(self.model_path)
+            self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+            self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+            if threads:
+                cv2.setNumThreads(threads)
+        else:
+            raise ValueError(f"Unknown backend: {backend}")
+
+        # Reused across batches: uint8 letterbox staging and the float32 NCHW model input
+        self._buffer = BatchBuffer(max(max_batch, self.fixed_batch or 0), input_size)
+        self._lock = threading.Lock()
+
+    @property
+    def config(self) -> Dict:
+        return engine_config(self.input_size, self.class_names, self.conf_threshold, self.iou_threshold)
+
+    def _prepare(self, images: List[np.ndarray], sizes: List[Tuple[int, int]]):
+        for i, (img, size) in enumerate(zip(images, sizes)):
+            self._buffer.load(i, img, size)
+        self._buffer.normalize(len(images))
+
+    def _run(self, n: int) -> np.ndarray:
+        rows = self.fixed_batch or n
+        if self.backend == 'onnxruntime':
+            return self.session.run(None, {self.input_name: self._buffer.input[:rows]})[0][:n]
+        self.net.setInput(self._buffer.input[:rows])
+        return self.net.forward()[:n]
+
+    def infer(self, images: List[np.ndarray],
+              sizes: Optional[Sequence[Optional[Tuple[int, int]]]] = None) -> List[List[Dict]]:
+        """Detect on a list of BGR images, chunked to max_batch
+
+        sizes gives the (width, height) boxes should be reported in, for images
+        decoded at reduced resolution; None entries mean the image's own size.
+        """
+        if sizes is None:
+            sizes = [None] * len(images)
+        sizes = [size or (img.shape[1], img.shape[0]) for img, size in zip(images, sizes)]
+        results = []
+        for start in range(0, len(images), self.max_batch):
+            chunk = images[start:start + self.max_batch]
+            chunk_sizes = sizes[start:start + self.max_batch]
+            with self._lock:
+                self._prepare(chunk, chunk_sizes)
+                output = self._run(len(chunk))
+                letterbox = self._buffer.letterbox[:len(chunk)].copy()
+            results.extend(decode_detections(output, letterbox, chunk_sizes, self.class_names,
+                                             self.conf_threshold, self.iou_threshold))
+        return results
+
+
+    def infer_letterboxed(self, staging: np.ndarray, letterbox: np.ndarray,
+                          sizes: Sequence[Tuple[int, int]]) -> List[List[Dict]]:
+        """Detect on images already letterboxed elsewhere, e.g. into a shared-memory slab
+
+        staging is (n, S, S, 3) uint8 BGR with n <= max_batch, letterbox the
+        matching (n, 3) [scale, left, top] and sizes the source (width, height).
+        """
+        n = len(staging)
+        with self._lock:
+            self._buffer.normalize(n, staging)
+            output = self._run(n)
+        return decode_detections(output, np.array(letterbox, dtype=np.float32), sizes, self.class_names,
+                                 self.conf_threshold, self.iou_threshold)
+
+
+class DynamicBatcher:
+    """Collects single-image requests into batches of up to max_batch or max_wait_ms
+
+    submit() returns a Future resolving to that image's detections.
+    """
+
+    def __init__(self, engine: DetectionEngine, max_batch: Optional[int] = None, max_wait_ms: float = 5.0,
+                 max_queue: int = 1024, metrics: Optional[PipelineMetrics] = None):
+        self.engine = engine
+        self.max_batch = min(max_batch or engine.max_batch, engine.max_batch)
+        self.max_wait = max_wait_ms / 1000.0
+        self.metrics = metrics or PipelineMetrics()
+        self.queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name='dynamic-batcher', daemon=True)
+        self._thread.start()
+
+    def submit(self, image: np.ndarray, block: bool = True, source_size: Optional[Tuple[int, int]] = None) -> Future:
+        """Queue one BGR image; raises queue.Full when not blocking and saturated
+
+        source_size is the full-resolution (width, height) when the image was
+        decoded reduced, so its boxes come back in source pixels. Raises
+        RuntimeError once the batcher is closed.
+        """
+        if self._stop.is_set():
+            raise RuntimeError("Batcher closed")
+        future = Future()
+        self.queue.put((image, source_size, future, time.perf_counter()), block=block)
+        if self._stop.is_set():
+            self._fail_queued()  # closed while this was being queued, after close() drained
+        self.metrics.incr('requests')
+        return future
+
+    def detect(self, image: np.ndarray) -> List[Dict]:
+        return self.submit(image).result()
+
+    def detect_many(self, images: List[np.ndarray]) -> List[List[Dict]]:
+        futures = [self.submit(img) for img in images]
+        return [f.result() for f in futures]
+
+    def _collect(self) -> list:
+        try:
+            first = self.queue.get(timeout=0.1)
+        except queue.Empty:
+            return []
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self):
+        while not self._stop.is_set():
+            batch = self._collect()
+            if not batch:
+                continue
+            start = time.perf_counter()
+            try:
+                results = self.engine.infer([item[0] for item in batch], [item[1] for item in batch])
+            except Exception as e:
+                logger.error(f"Batch of {len(batch)} failed: {e}")
+                for _, _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            done = time.perf_counter()
+
+            self.metrics.incr('batches')
+            self.metrics.incr('images', len(batch))
+            self.metrics.observe('batch_size', len(batch))
+            self.metrics.observe('batch_fill', len(batch) / self.max_batch)
+            self.metrics.observe('infer_ms', (done - start) * 1000)
+            for (_, _, future, queued_at), result in zip(batch, results):
+                self.metrics.observe('latency_ms', (done - queued_at) * 1000)
+                future.set_result(result)
+
+    def queue_depth(self) -> int:
+        return self.queue.qsize()
+
+    def close(self):
+        self._stop.set()
+        self._thread.join(timeout=5)
+        self._fail_queued()
+
+    def _fail_queued(self, error: Optional[Exception] = None):
+        """Fail whatever is still queued instead of leaving callers hanging"""
+        while True:
+            try:
+                _, _, future, _ = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            future.set_exception(error or RuntimeError("Batcher closed"))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,139 @@
+"""
+Detection accuracy on an annotated hold-out set
+mAP@0.5 and mAP@0.5:0.95 against YOLO label files (see data_collection/utils/coco_export.py)
+"""
+
+import logging
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .boxes import pairwise_iou, yolo_to_xyxy
+
+logger = logging.getLogger(__name__)
+
+COCO_IOU_THRESHOLDS = tuple(np.round(np.arange(0.5, 0.96, 0.05), 2))
+
+# mAP is measured over the whole score range, not at the serving threshold
+EVAL_CONF_THRESHOLD = 0.001
+
+
+def load_ground_truth(labels_dir, image_path, width: int, height: int) -> Tuple[np.ndarray, np.ndarray]:
+    """(classes, xyxy boxes in source pixels) of one image; empty when it has no label file"""
+    label_file = Path(labels_dir) / f"{Path(image_path).stem}.txt"
+    if not label_file.exists() or label_file.stat().st_size == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros((0, 4), dtype=np.float64)
+    rows = np.loadtxt(label_file, dtype=np.float64, ndmin=2)
+    return yolo_to_xyxy(rows, width, height)
+
+
+def _match(pred_boxes: np.ndarray, gt_boxes: np.ndarray, thresholds: Sequence[float]) -> np.ndarray:
+    """(P, T) true-positive flags for score-sorted predictions of one class in one image"""
+    tp = np.zeros((len(pred_boxes), len(thresholds)), dtype=bool)
+    if len(pred_boxes) == 0 or len(gt_boxes) == 0:
+        return tp
+    ious = pairwise_iou(pred_boxes, gt_boxes)
+    for t, threshold in enumerate(thresholds):
+        taken = np.zeros(len(gt_boxes), dtype=bool)
+        for p in range(len(pred_boxes)):
+            candidates = np.where(~taken & (ious[p] >= threshold), ious[p], -1)
+            best = candidates.argmax()
+            if candidates[best] >= 0:
+                taken[best] = True
+                tp[p, t] = True
+    return tp
+
+
+def average_precision(tp: np.ndarray, scores: np.ndarray, n_gt: int) -> np.ndarray:
+    """All-point interpolated AP per IoU threshold column of `tp`"""
+    if n_gt == 0:
+        return np.full(tp.shape[1], np.nan)
+    if len(scores) == 0:
+        return np.zeros(tp.shape[1])
+    order = np.argsort(-scores, kind='stable')
+    tp = tp[order].astype(np.float64)
+    ctp = np.cumsum(tp, axis=0)
+    cfp = np.cumsum(1 - tp, axis=0)
+    recall = ctp / n_gt
+    precision = ctp / np.maximum(ctp + cfp, 1e-9)
+    # precision envelope, then area under the stepwise curve
+    precision = np.maximum.accumulate(precision[::-1], axis=0)[::-1]
+    recall = np.vstack([np.zeros((1, tp.shape[1])), recall])
+    return (np.diff(recall, axis=0) * precision).sum(axis=0)
+
+
+def mean_average_precision(predictions: List[List[Dict]], ground_truth: List[Tuple[np.ndarray, np.ndarray]],
+                           class_names: Sequence[str],
+                           iou_thresholds: Sequence[float] = COCO_IOU_THRESHOLDS) -> Dict:
+    """mAP over images; predictions are detection dicts as returned by the engine
+
+    Returns map50, map (averaged over iou_thresholds) and per-class AP@0.5.
+    Classes without any ground truth are left out of the mean.
+    """
+    thresholds = list(iou_thresholds)
+    per_class_tp = {c: [] for c in range(len(class_names))}
+    per_class_scores = {c: [] for c in range(len(class_names))}
+    n_gt = np.zeros(len(class_names), dtype=np.int64)
+    for detections, (gt_classes, gt_boxes) in zip(predictions, ground_truth):
+        n_gt += np.bincount(gt_classes, minlength=len(class_names))[:len(class_names)]
+        if not detections:
+            continue
+        classes = np.array([d['class_id'] for d in detections])
+        scores = np.array([d['score'] for d in detections], dtype=np.float64)
+        boxes = np.array([d['box'] for d in detections], dtype=np.float64)
+        for c in np.unique(classes):
+            mask = classes == c
+            order = np.argsort(-scores[mask], kind='stable')
+            per_class_tp[c].append(_match(boxes[mask][order], gt_boxes[gt_classes == c], thresholds))
+            per_class_scores[c].append(scores[mask][order])
+
+    ap = np.full((len(class_names), len(thresholds)), np.nan)
+    for c in range(len(class_names)):
+        tp = np.concatenate(per_class_tp[c]) if per_class_tp[c] else np.zeros((0, len(thresholds)), dtype=bool)
+        scores = np.concatenate(per_class_scores[c]) if per_class_scores[c] else np.zeros(0)
+        ap[c] = average_precision(tp, scores, int(n_gt[c]))
+
+    has_gt = n_gt > 0
+    at50 = thresholds.index(0.5) if 0.5 in thresholds else 0
+    return {
+        'map50': float(np.nanmean(ap[has_gt, at50])) if has_gt.any() else float('nan'),
+        'map': float(np.nanmean(ap[has_gt])) if has_gt.any() else float('nan'),
+        'per_class_ap50': {name: (None if np.isnan(ap[c, at50]) else float(ap[c, at50]))
+                           for c, name in enumerate(class_names)},
+        'ground_truth': {name: int(n) for name, n in zip(class_names, n_gt)},
+        'images': len(predictions),
+    }
+
+
+def evaluate_model(model_path, image_paths: Sequence, labels_dir, input_size: int = 640,
+                   class_names: Optional[Sequence[str]] = None, max_batch: int = 8,
+                   threads: Optional[int] = None) -> Dict:
+    """mAP of an ONNX detector on annotated images, plus its mean batch latency"""
+    import time
+    from .engine import CLASS_NAMES, DetectionEngine
+    from .preprocess import decode_image
+
+    engine = DetectionEngine(model_path, input_size, class_names or CLASS_NAMES, max_batch,
+                             threads=threads, conf_threshold=EVAL_CONF_THRESHOLD)
+    predictions, ground_truth = [], []
+    infer_s = 0.0
+    for start in range(0, len(image_paths), max_batch):
+        chunk = image_paths[start:start + max_batch]
+        images, sizes = [], []
+        for path in chunk:
+            img, size = decode_image(Path(path).read_bytes(), input_size)
+            if img is None:
+                logger.warning(f"Could not decode {path}, skipped from evaluation")
+                continue
+            images.append(img)
+            sizes.append(size)
+            ground_truth.append(load_ground_truth(labels_dir, path, *size))
+        t0 = time.perf_counter()
+        predictions.extend(engine.infer(images, sizes))
+        infer_s += time.perf_counter() - t0
+
+    result = mean_average_precision(predictions, ground_truth, engine.class_names)
+    result['infer_ms_per_image'] = infer_s * 1000 / max(len(predictions), 1)
+    result['model_version'] = engine.model_version
+    return result
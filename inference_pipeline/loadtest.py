@@ -0,0 +1,88 @@
+"""
+Closed-loop load generator for the detection service
+    python -m inference_pipeline.loadtest --url http://127.0.0.1:8080 --images data_collection/real_estate_photos/images
+"""
+
+import asyncio
+import logging
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+from aiohttp import ClientSession, ClientTimeout, FormData
+
+logger = logging.getLogger(__name__)
+
+
+async def _worker(session: ClientSession, url: str, payloads: List[bytes], listing_size: int, deadline: float,
+                  latencies: List[float], statuses: Dict[int, int], offset: int):
+    i = offset
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        if listing_size > 1:
+            form = FormData()
+            for k in range(listing_size):
+                form.add_field('images', payloads[(i + k) % len(payloads)], filename=f'{k}.jpg',
+                               content_type='image/jpeg')
+            request = session.post(f"{url}/detect/listing", data=form)
+        else:
+            request = session.post(f"{url}/detect", data=payloads[i % len(payloads)],
+                                   headers={'Content-Type': 'image/jpeg'})
+        async with request as response:
+            await response.read()
+            statuses[response.status] = statuses.get(response.status, 0) + 1
+            if response.status == 200:
+                latencies.append((time.perf_counter() - start) * 1000)
+            elif response.status == 503:
+                await asyncio.sleep(float(response.headers.get('Retry-After', 1)) / 10)
+        i += listing_size
+
+
+async def load_test(url: str, paths: List, concurrency: int = 16, duration_s: float = 10.0,
+                    listing_size: int = 1) -> Dict:
+    """Keep `concurrency` requests in flight for `duration_s` and summarize the responses
+
+    Requests answered 503 back off briefly and do not count toward latency;
+    their share shows how much of the offered load admission control shed.
+    """
+    payloads = [Path(p).read_bytes() for p in paths]
+    latencies: List[float] = []
+    statuses: Dict[int, int] = {}
+    start = time.perf_counter()
+    deadline = start + duration_s
+    async with ClientSession(timeout=ClientTimeout(total=120)) as session:
+        await asyncio.gather(*(_worker(session, url.rstrip('/'), payloads, listing_size, deadline, latencies,
+                                       statuses, offset=w * 7) for w in range(concurrency)))
+        async with session.get(f"{url.rstrip('/')}/health") as response:
+            health = await response.json()
+    elapsed = time.perf_counter() - start
+
+    values = np.array(latencies) if latencies else np.zeros(1)
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    summary = {
+        'requests': sum(statuses.values()),
+        'statuses': statuses,
+        'images_per_s': len(latencies) * listing_size / elapsed,
+        'p50_ms': float(p50), 'p95_ms': float(p95), 'p99_ms': float(p99),
+        'rejected_fraction': statuses.get(503, 0) / max(sum(statuses.values()), 1),
+        'health': health,
+    }
+    logger.info(f"{summary['images_per_s']:.1f} images/s | p50 {p50:.1f} ms | p95 {p95:.1f} ms | p99 {p99:.1f} ms "
+                f"| statuses {statuses} | batch fill {health.get('batch_fill')}")
+    return summary
+
+
+if __name__ == "__main__":
+    import argparse
+    from model_training.data_loader import list_images
+
+    parser = argparse.ArgumentParser(description="Load test the detection service")
+    parser.add_argument("--url", default="http://127.0.0.1:8080")
+    parser.add_argument("--images", required=True, help="directory of sample photos")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--listing-size", type=int, default=1, help=">1 posts multi-photo listings")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    asyncio.run(load_test(args.url, list_images(args.images), args.concurrency, args.duration, args.listing_size))
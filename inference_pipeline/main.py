@@ -0,0 +1,248 @@
+"""
+Inference pipeline entry point
+    python -m inference_pipeline.main watch --model model.onnx
+    python -m inference_pipeline.main serve --model model.onnx --port 8080
+    python -m inference_pipeline.main bench --model model.onnx --synthetic 32 --batch-sizes 1 8
+    python -m inference_pipeline.main --profile sample watch --model model.onnx --once
+    python -m inference_pipeline.main quantize --model model.onnx --calibration <dirs> --eval-images <dir> --labels <dir>
+"""
+
+import argparse
+import json
+import logging
+
+from data_collection.utils.profiling import MODES, maybe_profile
+
+from .adaptive import TwoPassPolicy
+from .engine import CLASS_NAMES, DetectionEngine, DynamicBatcher
+from .pipeline import DetectionPipeline
+from .prefilter import CascadeFilter
+from .registry import DEFAULT_REGISTRY, resolve_model
+from .result_cache import ResultCache, namespace_key
+from .tiling import TiledDetector
+from .watcher import DEFAULT_WATCH_DIRS, DirectoryWatcher, ResultsStore
+
+logger = logging.getLogger(__name__)
+
+
+def add_engine_args(parser: argparse.ArgumentParser):
+    parser.add_argument("--model", required=True, help="ONNX detector, or a model name in the registry")
+    parser.add_argument("--variant", choices=["fp32", "int8"], default="fp32",
+                        help="int8 runs the quantized variant registered for --model")
+    parser.add_argument("--registry", default=DEFAULT_REGISTRY)
+    parser.add_argument("--allow-rejected", action="store_true", help="use an int8 variant that failed its gate")
+    parser.add_argument("--input-size", type=int, default=640)
+    parser.add_argument("--classes", nargs="+", default=list(CLASS_NAMES))
+    parser.add_argument("--backend", choices=["onnxruntime", "opencv"], default="onnxruntime")
+    parser.add_argument("--max-batch", type=int, default=8)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    parser.add_argument("--threads", type=int)
+    parser.add_argument("--workers", type=int, default=0,
+                        help="model worker processes pinned to core sets (0 runs the model in-process)")
+    parser.add_argument("--conf", type=float, default=0.25)
+    parser.add_argument("--cache", default="inference_pipeline/results/cache.sqlite",
+                        help="result cache keyed by image content, model and config")
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--cache-mb", type=int, default=256)
+    parser.add_argument("--tile", action="store_true", help="tiled second pass for large, unsure images")
+    parser.add_argument("--tile-size", type=int, help="tile side in source pixels (default 2x input size)")
+    parser.add_argument("--tile-min-side", type=int, help="never tile images smaller than this")
+    parser.add_argument("--prefilter", action="store_true", help="skip the detector on floor plans and exteriors")
+    parser.add_argument("--prefilter-thresholds", type=json.loads,
+                        help='JSON overrides, e.g. \'{"floor_plan": 0.6, "exterior": null}\'')
+    parser.add_argument("--refine-size", type=int,
+                        help="two-pass: run --input-size first and re-run unsure photos at this input size")
+    parser.add_argument("--refine-model", help="detector for the refine pass (default --model, same variant)")
+    parser.add_argument("--refine-band", type=float, nargs=2, default=[0.1, 0.5], metavar=("LO", "HI"),
+                        help="first-pass scores in [LO, HI) send a photo to the refine pass")
+    parser.add_argument("--refine-small-box", type=float, default=0.002,
+                        help="also refine when a box covers less than this fraction of the photo")
+
+
+def _batcher(args, model: str, input_size: int, conf: float) -> DynamicBatcher:
+    if args.workers > 0:
+        from .workers import ProcessBatcher
+        return ProcessBatcher(model, args.workers, input_size, args.classes, args.max_batch,
+                              args.max_wait_ms, backend=args.backend, conf_threshold=conf)
+    engine = DetectionEngine(model, input_size, args.classes, args.max_batch, args.backend, args.threads, conf)
+    return DynamicBatcher(engine, args.max_batch, args.max_wait_ms)
+
+
+def build_pipeline(args) -> DetectionPipeline:
+    model = resolve_model(args.model, args.variant, args.registry, args.allow_rejected)
+    refiner = policy = None
+    if args.refine_size:
+        policy = TwoPassPolicy(args.conf, tuple(args.refine_band), args.refine_small_box)
+        # the first pass reports down to the bottom of the band so the policy sees weak detections
+        batcher = _batcher(args, model, args.input_size, policy.first_pass_conf)
+        refine_model = resolve_model(args.refine_model or args.model, args.variant, args.registry,
+                                     args.allow_rejected)
+        refiner = _batcher(args, refine_model, args.refine_size, args.conf)
+    else:
+        batcher = _batcher(args, model, args.input_size, args.conf)
+    # ProcessBatcher.engine only describes the model, which is all the cache and tiler need
+    engine = batcher.engine
+    prefilter = CascadeFilter(args.prefilter_thresholds) if args.prefilter else None
+    tiler = None
+    if args.tile:
+        # tiles are cut for whichever pass decides about tiling
+        tiled_engine = (refiner or batcher).engine
+        tiler = TiledDetector(tiled_engine.class_names, tiled_engine.input_size, args.tile_size,
+                              min_side=args.tile_min_side)
+    cache = None
+    if not args.no_cache:
+        # skipped and tiled photos are cached too, so the pre-filter and tiling settings are part of the namespace
+        config = dict(engine.config, **(prefilter.config if prefilter else {}), **(tiler.config if tiler else {}))
+        if refiner is not None:
+            config.update(policy.config, refine=dict(refiner.engine.config, model=refiner.engine.model_version))
+        cache = ResultCache(args.cache, namespace_key(engine.model_version, config),
+                            max_disk_bytes=args.cache_mb * 1024 ** 2)
+    return DetectionPipeline(batcher, cache=cache, tiler=tiler, prefilter=prefilter, refiner=refiner, policy=policy)
+
+
+def watch(args):
+    pipeline = build_pipeline(args)
+    store = ResultsStore(args.results)
+    # a one-shot run has no next poll to wait for, so score files regardless of age
+    watcher = DirectoryWatcher(pipeline, store, args.dirs, args.interval, settle_s=0 if args.once else 1.0)
+    try:
+        if args.once:
+            watcher.run_once()
+        else:
+            watcher.run()
+    except KeyboardInterrupt:
+        logger.info("Stopping watcher")
+    finally:
+        pipeline.close()
+        snapshot = pipeline.metrics.snapshot()
+        logger.info(f"Metrics: {snapshot['counters']}")
+        if 'cache_hit_rate' in snapshot:
+            logger.info(f"Cache hit rate {snapshot['cache_hit_rate']:.1%}, "
+                        f"saved {snapshot['counters'].get('cache_saved_ms', 0) / 1000:.1f}s of compute")
+
+
+def serve(args):
+    # aiohttp is only needed for the HTTP front end
+    from .service import DetectionService, serve as run_service
+
+    service = DetectionService(build_pipeline(args), max_pending=args.max_pending, retry_after_s=args.retry_after)
+    run_service(service, args.host, args.port)
+
+
+def bench(args):
+    from .bench import compare_runs, expand_grid, run_benchmark
+
+    engine_args = {k: v for k, v in vars(args).items() if k not in ('func', 'command')}
+    axes = {'max_batch': args.batch_sizes or [args.max_batch]}
+    if args.threads_grid:
+        axes['threads'] = args.threads_grid
+    if args.workers_grid:
+        axes['workers'] = args.workers_grid
+    axes['tile'] = [bool(t) for t in args.tile_modes]
+    axes['cache'] = [bool(c) for c in args.cache_modes]
+    axes['prefilter'] = [bool(p) for p in args.prefilter_modes]
+    axes['variant'] = args.variants or [args.variant]
+    if args.refine_sizes:
+        axes['refine_size'] = args.refine_sizes
+    source = {'images_dir': args.images, 'synthetic': args.synthetic, 'limit': args.limit}
+    run = run_benchmark(engine_args, expand_grid(**axes), source, args.requests, args.concurrency, args.rate,
+                        args.output)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = [row for row in compare_runs(json.load(f), run, args.tolerance) if row['regressed']]
+        logger.info(f"{len(regressions)} regressions against {args.compare}")
+        if regressions:
+            raise SystemExit(1)
+
+
+def quantize(args):
+    from pathlib import Path
+    from model_training.data_loader import list_images
+    from .quantize import quantize_and_gate, sample_calibration_images
+
+    name = args.name or Path(args.model).stem
+    calibration = sample_calibration_images(args.calibration, args.calibration_count, args.seed)
+    if not calibration:
+        raise SystemExit(f"No calibration images in {args.calibration}")
+    entry = quantize_and_gate(name, args.model, calibration, list_images(args.eval_images), args.labels,
+                              args.input_size, args.classes, args.max_map_drop, args.method,
+                              not args.per_tensor, args.registry, args.output)
+    if not entry['accepted']:
+        raise SystemExit(1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Real estate photo detection pipeline")
+    parser.add_argument("--profile", choices=MODES, help="profile the command: cprofile (main thread, exact "
+                        "counts) or sample (all threads, low overhead); both add tracemalloc")
+    parser.add_argument("--profile-dir", default="inference_pipeline/results/profile")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    watch_parser = sub.add_parser("watch", help="detect on new collector images as they arrive")
+    add_engine_args(watch_parser)
+    watch_parser.add_argument("--dirs", nargs="+", default=list(DEFAULT_WATCH_DIRS))
+    watch_parser.add_argument("--results", default="inference_pipeline/results/detections.jsonl")
+    watch_parser.add_argument("--interval", type=float, default=2.0)
+    watch_parser.add_argument("--once", action="store_true", help="process what is there and exit")
+    watch_parser.set_defaults(func=watch)
+
+    serve_parser = sub.add_parser("serve", help="HTTP detection service for the photo editor")
+    add_engine_args(serve_parser)
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8080)
+    serve_parser.add_argument("--max-pending", type=int, default=256,
+                              help="images in flight before answering 503")
+    serve_parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds on 503")
+    serve_parser.set_defaults(func=serve)
+
+    bench_parser = sub.add_parser("bench", help="latency / throughput benchmark over engine configurations")
+    add_engine_args(bench_parser)
+    bench_parser.add_argument("--images", help="directory of photos to replay")
+    bench_parser.add_argument("--synthetic", type=int, default=32, help="synthetic photos when --images is not set")
+    bench_parser.add_argument("--limit", type=int)
+    bench_parser.add_argument("--batch-sizes", type=int, nargs="+")
+    bench_parser.add_argument("--threads-grid", type=int, nargs="+")
+    bench_parser.add_argument("--workers-grid", type=int, nargs="+")
+    bench_parser.add_argument("--tile-modes", type=int, nargs="+", default=[0], choices=[0, 1])
+    bench_parser.add_argument("--cache-modes", type=int, nargs="+", default=[0], choices=[0, 1])
+    bench_parser.add_argument("--prefilter-modes", type=int, nargs="+", default=[0], choices=[0, 1])
+    bench_parser.add_argument("--variants", nargs="+", choices=["fp32", "int8"],
+                              help="model variants to compare; int8 results report their speedup over fp32")
+    bench_parser.add_argument("--refine-sizes", type=int, nargs="+",
+                              help="two-pass refine input sizes to compare, 0 for single pass")
+    bench_parser.add_argument("--requests", type=int, help="images per configuration (default 2 passes)")
+    bench_parser.add_argument("--concurrency", type=int, default=16)
+    bench_parser.add_argument("--rate", type=float, help="fixed arrival rate in images/s instead of closed loop")
+    bench_parser.add_argument("--output", default="inference_pipeline/results/bench",
+                              help="JSON file or directory for bench-<commit>-<time>.json")
+    bench_parser.add_argument("--compare", help="earlier results JSON; exit 1 on regressions")
+    bench_parser.add_argument("--tolerance", type=float, default=0.1)
+    bench_parser.set_defaults(func=bench)
+
+    quantize_parser = sub.add_parser("quantize", help="INT8 static quantization with an accuracy gate")
+    quantize_parser.add_argument("--model", required=True, help="FP32 ONNX detector")
+    quantize_parser.add_argument("--name", help="registry name (default: model file stem)")
+    quantize_parser.add_argument("--input-size", type=int, default=640)
+    quantize_parser.add_argument("--classes", nargs="+", default=list(CLASS_NAMES))
+    quantize_parser.add_argument("--calibration", nargs="+", default=list(DEFAULT_WATCH_DIRS),
+                                 help="directories of collected photos to calibrate on")
+    quantize_parser.add_argument("--calibration-count", type=int, default=200)
+    quantize_parser.add_argument("--seed", type=int, default=0)
+    quantize_parser.add_argument("--method", choices=["minmax", "entropy", "percentile"], default="minmax")
+    quantize_parser.add_argument("--per-tensor", action="store_true", help="per-tensor instead of per-channel weights")
+    quantize_parser.add_argument("--eval-images", required=True, help="annotated hold-out photos")
+    quantize_parser.add_argument("--labels", required=True, help="YOLO label files of the hold-out photos")
+    quantize_parser.add_argument("--max-map-drop", type=float, default=0.01,
+                                 help="largest accepted absolute mAP@0.5 drop of int8 vs fp32")
+    quantize_parser.add_argument("--output", help="int8 model path (default: <model>.int8.onnx)")
+    quantize_parser.add_argument("--registry", default=DEFAULT_REGISTRY)
+    quantize_parser.set_defaults(func=quantize)
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    with maybe_profile(args.profile, args.profile_dir):
+        args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+Thread-safe counters and latency histograms shared by the inference pipeline stages
+"""
+
+import threading
+from collections import defaultdict, deque
+from typing import Dict
+
+import numpy as np
+
+
+class PipelineMetrics:
+    """Counters plus rolling-window observations with percentile snapshots"""
+
+    def __init__(self, window: int = 10000):
+        self._lock = threading.Lock()
+        self._window = window
+        self.counters = defaultdict(float)
+        self.observations = defaultdict(lambda: deque(maxlen=self._window))
+
+    def incr(self, name: str, value: float = 1.0):
+        with self._lock:
+            self.counters[name] += value
+
+    def observe(self, name: str, value: float):
+        with self._lock:
+            self.observations[name].append(value)
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.observations.clear()
+
+    def values(self, name: str) -> np.ndarray:
+        with self._lock:
+            return np.array(self.observations.get(name, ()), dtype=np.float64)
+
+    def snapshot(self) -> Dict:
+        """Counters and p50/p95/p99/mean of every observed series"""
+        with self._lock:
+            counters = dict(self.counters)
+            series = {name: np.array(values, dtype=np.float64) for name, values in self.observations.items()}
+        summary = {}
+        for name, values in series.items():
+            if len(values) == 0:
+                continue
+            p50, p95, p99 = np.percentile(values, [50, 95, 99])
+            summary[name] = {'count': int(len(values)), 'mean': float(values.mean()),
+                             'p50': float(p50), 'p95': float(p95), 'p99': float(p99)}
+        snapshot = {'counters': counters, 'series': summary}
+        lookups = counters.get('cache_hits', 0) + counters.get('cache_misses', 0)
+        if lookups:
+            snapshot['cache_hit_rate'] = counters.get('cache_hits', 0) / lookups
+        return snapshot
@@ -0,0 +1,246 @@
+"""
+Detection pipeline: image bytes -> decoded image -> dynamic batcher -> detections
+"""
+
+import logging
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .adaptive import TwoPassPolicy, pass_cost
+from .engine import DynamicBatcher
+from .metrics import PipelineMetrics
+from .prefilter import CascadeFilter
+from .preprocess import decode_image
+from .result_cache import ResultCache, content_key
+from .tiling import TiledDetector
+
+logger = logging.getLogger(__name__)
+
+
+def _chain(future: Future, transform) -> Future:
+    """Future resolving to transform(result of `future`)"""
+    out = Future()
+
+    def done(f):
+        try:
+            out.set_result(transform(f.result()))
+        except Exception as e:
+            out.set_exception(e)
+
+    future.add_done_callback(done)
+    return out
+
+
+def _resolved(value) -> Future:
+    future = Future()
+    future.set_result(value)
+    return future
+
+
+class DetectionPipeline:
+    """Front of the inference path used by the watcher and the service
+
+    With a ResultCache the image bytes are hashed first and a hit skips
+    decoding and inference entirely. With a TiledDetector, images whose first
+    pass warrants it get a second, tiled pass whose crops share the batcher
+    with regular traffic.
+
+    JPEGs are decoded at the smallest DCT scale that still covers the model
+    input; only a tiled pass goes back to the full-resolution pixels. With a
+    CascadeFilter, photos it rules out (floor plans, exteriors) never reach
+    the detector and come back with no detections and a 'skipped' reason.
+
+    With a refiner (a batcher on a larger input size) and a TwoPassPolicy,
+    `batcher` is the cheap small-input pass and only photos the policy finds
+    unsure are re-run on the refiner; the tiler then applies to the refined
+    pass instead of the first one. Results carry the refine reason and the
+    model input megapixels they cost.
+    """
+
+    def __init__(self, batcher: DynamicBatcher, metrics: Optional[PipelineMetrics] = None,
+                 cache: Optional[ResultCache] = None, tiler: Optional[TiledDetector] = None,
+                 prefilter: Optional[CascadeFilter] = None, refiner: Optional[DynamicBatcher] = None,
+                 policy: Optional[TwoPassPolicy] = None):
+        if (refiner is None) != (policy is None):
+            raise ValueError("Two-pass inference needs both a refiner and a policy")
+        self.batcher = batcher
+        self.metrics = metrics or batcher.metrics
+        self.cache = cache
+        self.tiler = tiler
+        self.prefilter = prefilter
+        self.refiner = refiner
+        self.policy = policy
+        # second passes wait on a batcher, so they must not run on a batcher thread
+        second_pass = tiler is not None or refiner is not None
+        self._pass_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix='second-pass') if second_pass else None
+
+    def decode(self, data: bytes, full: bool = False) -> Tuple[Optional[np.ndarray], Tuple[int, int]]:
+        """(image, source (width, height)), reduced to the model input size unless `full`"""
+        start = time.perf_counter()
+        img, size = decode_image(data, None if full else self.batcher.engine.input_size)
+        self.metrics.observe('decode_ms', (time.perf_counter() - start) * 1000)
+        return img, size
+
+    def submit_bytes(self, data: bytes, block: bool = True) -> Future:
+        """Queue encoded image bytes, the Future resolves to a result dict"""
+        if self.cache is None:
+            return self._submit_uncached(data, block)
+
+        key = content_key(data)
+        hit = self.cache.get(key)
+        if hit is not None:
+            result, compute_ms = hit
+            self.metrics.incr('cache_hits')
+            self.metrics.incr('cache_saved_ms', compute_ms)
+            return _resolved(dict(result, cached=True))
+        self.metrics.incr('cache_misses')
+
+        start = time.perf_counter()
+
+        def store(result):
+            self.cache.put(key, result, (time.perf_counter() - start) * 1000)
+            return result
+
+        return _chain(self._submit_uncached(data, block), store)
+
+    def _submit_uncached(self, data: bytes, block: bool) -> Future:
+        img, (width, height) = self.decode(data)
+        if img is None:
+            self.metrics.incr('decode_errors')
+            failed = Future()
+            failed.set_exception(ValueError("Could not decode image"))
+            return failed
+        if self.prefilter is not None:
+            start = time.perf_counter()
+            reason = self.prefilter.skip_reason(img)
+            self.metrics.observe('prefilter_ms', (time.perf_counter() - start) * 1000)
+            if reason is not None:
+                self.metrics.incr('prefilter_skipped')
+                self.metrics.incr(f'prefilter_{reason}')
+                return _resolved({'width': width, 'height': height, 'detections': [], 'skipped': reason})
+        first_pass = self.batcher.submit(img, block=block, source_size=(width, height))
+        if self.refiner is not None:
+            return self._two_pass(data, width, height, first_pass)
+        if self.tiler is None:
+            return _chain(first_pass, lambda detections: {'width': width, 'height': height, 'detections': detections})
+
+        out = Future()
+
+        def on_first_pass(f):
+            try:
+                detections = f.result()
+            except Exception as e:
+                out.set_exception(e)
+                return
+            reason = self.tiler.tile_reason(width, height, detections)
+            if reason is None:
+                out.set_result({'width': width, 'height': height, 'detections': detections})
+                return
+            self.metrics.incr('tiled_images')
+            self.metrics.incr(f'tiled_{reason}')
+            self._pass_pool.submit(self._tile_pass, data, img, width, height, detections, reason, out)
+
+        first_pass.add_done_callback(on_first_pass)
+        return out
+
+    def _tiles(self, data: bytes, img: np.ndarray, width: int, first_pass: List[Dict],
+               batcher: DynamicBatcher) -> Tuple[List[Dict], int]:
+        """Tiled pass through `batcher` merged with `first_pass`; (detections, tile count)"""
+        start = time.perf_counter()
+        if img.shape[1] != width:
+            # the first pass saw a reduced decode, tiles need the real pixels
+            img, _ = self.decode(data, full=True)
+        detections = self.tiler.detect_tiles(img, first_pass, batcher.detect_many)
+        self.metrics.observe('tile_pass_ms', (time.perf_counter() - start) * 1000)
+        return detections, self.tiler.tile_count(img.shape[1], img.shape[0])
+
+    def _tile_pass(self, data: bytes, img: np.ndarray, width: int, height: int, first_pass: List[Dict],
+                   reason: str, out: Future):
+        try:
+            detections, _ = self._tiles(data, img, width, first_pass, self.batcher)
+            out.set_result({'width': width, 'height': height, 'detections': detections, 'tiled': reason})
+        except Exception as e:
+            out.set_exception(e)
+
+    def _two_pass(self, data: bytes, width: int, height: int, first_pass: Future) -> Future:
+        out = Future()
+        first_cost = pass_cost(self.batcher.engine.input_size)
+
+        def on_first_pass(f):
+            try:
+                detections = f.result()
+            except Exception as e:
+                out.set_exception(e)
+                return
+            reason = self.policy.refine_reason(width, height, detections)
+            if reason is None:
+                self.metrics.observe('cost_mpx', first_cost)
+                out.set_result({'width': width, 'height': height, 'detections': self.policy.accept(detections),
+                                'refined': None, 'cost_mpx': first_cost})
+                return
+            self.metrics.incr('refined_images')
+            self.metrics.incr(f'refined_{reason}')
+            self._pass_pool.submit(self._refine_pass, data, width, height, reason, first_cost, out)
+
+        first_pass.add_done_callback(on_first_pass)
+        return out
+
+    def _refine_pass(self, data: bytes, width: int, height: int, reason: str, cost: float, out: Future):
+        """Large-input pass replacing the small one, tiled on top when it is still unsure"""
+        try:
+            start = time.perf_counter()
+            refine_size = self.refiner.engine.input_size
+            img, _ = decode_image(data, refine_size)
+            detections = self.refiner.submit(img, source_size=(width, height)).result()
+            self.metrics.observe('refine_pass_ms', (time.perf_counter() - start) * 1000)
+            cost += pass_cost(refine_size)
+            result = {'width': width, 'height': height, 'refined': reason}
+            tile_reason = self.tiler.tile_reason(width, height, detections) if self.tiler is not None else None
+            if tile_reason is not None:
+                self.metrics.incr('tiled_images')
+                self.metrics.incr(f'tiled_{tile_reason}')
+                detections, tiles = self._tiles(data, img, width, detections, self.refiner)
+                cost += pass_cost(refine_size, tiles)
+                result['tiled'] = tile_reason
+            self.metrics.observe('cost_mpx', cost)
+            out.set_result(dict(result, detections=detections, cost_mpx=cost))
+        except Exception as e:
+            out.set_exception(e)
+
+    def submit_file(self, path, block: bool = True) -> Future:
+        return self.submit_bytes(Path(path).read_bytes(), block=block)
+
+    def detect_bytes(self, data: bytes) -> Dict:
+        return self.submit_bytes(data).result()
+
+    def detect_files(self, paths: List) -> List[Optional[Dict]]:
+        """Detect on many files at once so the batcher can fill batches; None for failures"""
+        futures = []
+        for path in paths:
+            try:
+                futures.append(self.submit_file(path))
+            except OSError as e:
+                logger.warning(f"Could not read {path}: {e}")
+                futures.append(None)
+        results = []
+        for path, future in zip(paths, futures):
+            try:
+                results.append(future.result() if future is not None else None)
+            except Exception as e:
+                logger.warning(f"Detection failed for {path}: {e}")
+                results.append(None)
+        return results
+
+    def close(self):
+        # tile and refine passes in flight still need both batchers, so they finish first
+        if self._pass_pool is not None:
+            self._pass_pool.shutdown(wait=True)
+        if self.refiner is not None:
+            self.refiner.close()
+        self.batcher.close()
+        if self.cache is not None:
+            self.cache.close()
@@ -0,0 +1,60 @@
+"""
+Detector output decoding: raw YOLO-style predictions -> per-image detections in source pixels
+"""
+
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+from .boxes import batched_nms, clip_boxes, cxcywh_to_xyxy, scale_boxes
+
+
+def normalize_output(output: np.ndarray, num_classes: int) -> np.ndarray:
+    """Bring detector output to (N, P, 4 + num_classes) [cx, cy, w, h, class scores...]
+
+    Accepts the YOLOv8 export layout (N, 4 + nc, P) and YOLOv5 outputs with an
+    objectness column (N, P, 5 + nc), whose class scores get multiplied by it.
+    """
+    if output.ndim == 2:
+        output = output[None]
+    width = 4 + num_classes
+    if output.shape[-1] not in (width, width + 1) and output.shape[1] in (width, width + 1):
+        output = output.transpose(0, 2, 1)
+    if output.shape[-1] == width + 1:
+        output = np.concatenate([output[..., :4], output[..., 5:] * output[..., 4:5]], axis=-1)
+    return output
+
+
+def decode_detections(output: np.ndarray, letterbox: np.ndarray, sizes: Sequence, class_names: Sequence[str],
+                      conf_threshold: float = 0.25, iou_threshold: float = 0.45,
+                      max_detections: int = 100) -> List[List[Dict]]:
+    """Turn one batch of raw predictions into detections
+
+    letterbox is (N, 3) [scale, left, top] from preprocessing and sizes the
+    (width, height) of every source image, so boxes come back in source pixels.
+    """
+    output = normalize_output(np.asarray(output, dtype=np.float32), len(class_names))
+    results = []
+    for i in range(len(sizes)):
+        pred = output[i]
+        class_ids = pred[:, 4:].argmax(axis=1)
+        scores = pred[np.arange(len(pred)), 4 + class_ids]
+        mask = scores >= conf_threshold
+        if not mask.any():
+            results.append([])
+            continue
+        pred, class_ids, scores = pred[mask], class_ids[mask], scores[mask]
+
+        scale, left, top = letterbox[i]
+        width, height = sizes[i]
+        boxes = cxcywh_to_xyxy(pred[:, :4])
+        scale_boxes(boxes, 1 / scale, offset=(-left / scale, -top / scale), out=boxes)
+        clip_boxes(boxes, width, height, out=boxes)
+
+        keep = batched_nms(boxes, scores, class_ids, iou_threshold)[:max_detections]
+        results.append([
+            {'label': class_names[c], 'class_id': int(c), 'score': round(float(s), 4),
+             'box': [round(float(v), 1) for v in b]}
+            for b, s, c in zip(boxes[keep], scores[keep], class_ids[keep])
+        ])
+    return results
@@ -0,0 +1,218 @@
+"""
+Cascade pre-filter in front of the detector
+A few colour / texture statistics of a small thumbnail decide whether a photo can hold a TV,
+fireplace or camera at all; floor plans and exterior / aerial shots skip the detector
+"""
+
+import itertools
+import json
+import logging
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Sequence, Set
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+THUMB_SIZE = 96  # features are computed on a THUMB_SIZE x THUMB_SIZE BGR thumbnail
+
+# A photo is skipped when a score reaches its threshold; None disables that rule
+DEFAULT_THRESHOLDS = {
+    'floor_plan': 0.55,  # white, unsaturated drawing or text page
+    'exterior': 0.45,    # sky across the top or vegetation over much of the frame
+}
+
+
+def thumbnail(img: np.ndarray, out: Optional[np.ndarray] = None) -> np.ndarray:
+    if out is None:
+        out = np.empty((THUMB_SIZE, THUMB_SIZE, 3), dtype=np.uint8)
+    cv2.resize(img, (THUMB_SIZE, THUMB_SIZE), dst=out, interpolation=cv2.INTER_AREA)
+    return out
+
+
+def compute_features(batch: np.ndarray) -> Dict[str, np.ndarray]:
+    """Vectorized cascade features for a (N, THUMB_SIZE, THUMB_SIZE, 3) uint8 BGR batch"""
+    n, size = batch.shape[0], batch.shape[1]
+    # colour conversion is per pixel, so the batch can go through as one tall image
+    hsv = cv2.cvtColor(batch.reshape(n * size, size, 3), cv2.COLOR_BGR2HSV).reshape(batch.shape)
+    h, s, v = (hsv[..., i].astype(np.int16) for i in range(3))
+
+    white = (v > 215) & (s < 30)
+    low_sat = s < 30
+    blue_sky = (h >= 90) & (h <= 130) & (s > 35) & (v > 110)
+    green = (h >= 35) & (h <= 85) & (s > 60) & (v > 40)
+
+    gray = v.astype(np.float32)
+    grad = np.abs(np.diff(gray, axis=1))[:, :, :-1] + np.abs(np.diff(gray, axis=2))[:, :-1, :]
+    top = size // 3
+
+    features = {
+        'white_frac': white.mean(axis=(1, 2)),
+        'low_sat_frac': low_sat.mean(axis=(1, 2)),
+        'edge_frac': (grad > 60).mean(axis=(1, 2)),
+        'sky_top_frac': blue_sky[:, :top].mean(axis=(1, 2)),
+        'green_frac': green.mean(axis=(1, 2)),
+        'sat_mean': s.mean(axis=(1, 2)) / 255.0,
+    }
+    # Floor plans and text pages: mostly white paper and almost no colour anywhere
+    features['floor_plan'] = features['white_frac'] * features['low_sat_frac']
+    # Exteriors: sky over the top third, or an aerial / garden frame full of vegetation
+    features['exterior'] = np.maximum(features['sky_top_frac'], features['green_frac'] * 1.2).clip(0, 1)
+    return features
+
+
+def skip_reasons(features: Dict[str, np.ndarray], thresholds: Dict[str, Optional[float]]) -> np.ndarray:
+    """Per image the first rule that fires, '' where the detector must run"""
+    n = len(next(iter(features.values())))
+    reasons = np.full(n, '', dtype=object)
+    for rule, threshold in thresholds.items():
+        if threshold is None:
+            continue
+        reasons[(reasons == '') & (features[rule] >= threshold)] = rule
+    return reasons
+
+
+class CascadeFilter:
+    """Decides per decoded image whether the detector should run"""
+
+    def __init__(self, thresholds: Optional[Dict[str, Optional[float]]] = None):
+        self.thresholds = dict(DEFAULT_THRESHOLDS, **(thresholds or {}))
+        unknown = set(self.thresholds) - set(DEFAULT_THRESHOLDS)
+        if unknown:
+            raise ValueError(f"Unknown pre-filter rules: {sorted(unknown)}")
+
+    @property
+    def config(self) -> Dict:
+        return {'prefilter': self.thresholds}
+
+    def skip_reason(self, img: np.ndarray) -> Optional[str]:
+        reason = skip_reasons(compute_features(thumbnail(img)[None]), self.thresholds)[0]
+        return reason or None
+
+
+def features_for_paths(paths: Sequence, batch_size: int = 256) -> Dict[str, np.ndarray]:
+    """Cascade features of image files, thumbnails decoded at 1/8 resolution where possible"""
+    from model_training.transforms import decode_reduced
+
+    chunks = []
+    batch = np.zeros((batch_size, THUMB_SIZE, THUMB_SIZE, 3), dtype=np.uint8)
+    for start in range(0, len(paths), batch_size):
+        chunk = paths[start:start + batch_size]
+        for i, path in enumerate(chunk):
+            img, _ = decode_reduced(Path(path).read_bytes(), THUMB_SIZE)
+            if img is None:
+                batch[i] = 0
+                logger.warning(f"Could not decode {path}")
+                continue
+            thumbnail(img, batch[i])
+        chunks.append(compute_features(batch[:len(chunk)]))
+    return {k: np.concatenate([c[k] for c in chunks]) for k in chunks[0]} if chunks else {}
+
+
+def evaluate(features: Dict[str, np.ndarray], positives: np.ndarray, thresholds: Dict[str, Optional[float]],
+             groups: Optional[Sequence] = None) -> Dict:
+    """Recall on photos that really contain a target, and the share of detector calls saved
+
+    positives is a boolean array (photo has at least one TV / fireplace /
+    camera). groups, e.g. listing ids, adds detector calls per listing.
+    """
+    skipped = skip_reasons(features, thresholds) != ''
+    positives = np.asarray(positives, dtype=bool)
+    result = {
+        'images': int(len(skipped)),
+        'positives': int(positives.sum()),
+        'recall': float((~skipped[positives]).mean()) if positives.any() else 1.0,
+        'skip_rate': float(skipped.mean()) if len(skipped) else 0.0,
+        'missed': int((skipped & positives).sum()),
+    }
+    if groups is not None:
+        _, group_index = np.unique(np.asarray(groups), return_inverse=True)
+        per_listing = np.bincount(group_index)
+        run = np.bincount(group_index, weights=~skipped)
+        result['detector_calls_per_listing'] = float(run.mean())
+        result['photos_per_listing'] = float(per_listing.mean())
+    return result
+
+
+def tune_thresholds(features: Dict[str, np.ndarray], positives: np.ndarray, min_recall: float = 0.99,
+                    grid: Optional[Iterable[float]] = None) -> Dict:
+    """Grid search for the thresholds that skip the most photos while keeping recall >= min_recall
+
+    Among equally good settings the most conservative (highest thresholds)
+    wins, leaving margin for photos unlike the evaluation set.
+    """
+    grid = [float(g) for g in (grid if grid is not None else np.round(np.linspace(0.1, 1.0, 19), 3))] + [None]
+    rules = list(DEFAULT_THRESHOLDS)
+    best, best_key = None, None
+    for values in itertools.product(grid, repeat=len(rules)):
+        thresholds = dict(zip(rules, values))
+        result = evaluate(features, positives, thresholds)
+        if result['recall'] < min_recall:
+            continue
+        key = (result['skip_rate'], sum(2.0 if v is None else v for v in values))
+        if best_key is None or key > best_key:
+            best, best_key = dict(result, thresholds=thresholds), key
+    return best
+
+
+def load_positives(paths: Sequence[Path], labels_dir=None, results_path=None, min_score: float = 0.5) -> np.ndarray:
+    """Ground truth per image from YOLO label files, or from a watcher results JSONL"""
+    if labels_dir is not None:
+        labels_dir = Path(labels_dir)
+        return np.array([(labels_dir / f"{Path(p).stem}.txt").exists()
+                         and (labels_dir / f"{Path(p).stem}.txt").stat().st_size > 0 for p in paths])
+    found: Set[str] = set()
+    with open(results_path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if any(d['score'] >= min_score for d in record.get('detections', ())):
+                found.add(Path(record['path']).name)
+    return np.array([Path(p).name in found for p in paths])
+
+
+def load_listings(paths: Sequence[Path], metadata_path, field: str = 'property_url') -> np.ndarray:
+    """Listing id per image from the collectors' metadata.json; photos without one count as their own listing"""
+    with open(metadata_path) as f:
+        listing = {record['filename']: record[field] for record in json.load(f)
+                   if record.get('filename') and record.get(field) is not None}
+    missing = sum(Path(p).name not in listing for p in paths)
+    if missing:
+        logger.warning(f"{missing} of {len(paths)} images have no '{field}' in {metadata_path}")
+    return np.array([str(listing.get(Path(p).name, Path(p).name)) for p in paths])
+
+
+if __name__ == "__main__":
+    import argparse
+    from model_training.data_loader import list_images
+
+    parser = argparse.ArgumentParser(description="Measure and tune the cascade pre-filter")
+    parser.add_argument("--images", required=True)
+    truth = parser.add_mutually_exclusive_group(required=True)
+    truth.add_argument("--labels-dir", help="YOLO labels; a non-empty file marks a positive photo")
+    truth.add_argument("--results", help="watcher detections JSONL of the full detector")
+    parser.add_argument("--min-score", type=float, default=0.5)
+    parser.add_argument("--min-recall", type=float, default=0.99)
+    parser.add_argument("--metadata", help="collector metadata.json, to report detector calls per listing")
+    parser.add_argument("--listing-field", default="property_url", help="metadata field identifying the listing")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    image_paths = list_images(args.images)
+    feats = features_for_paths(image_paths)
+    truth_mask = load_positives(image_paths, args.labels_dir, args.results, args.min_score)
+    listings = load_listings(image_paths, args.metadata, args.listing_field) if args.metadata else None
+    current = evaluate(feats, truth_mask, DEFAULT_THRESHOLDS, listings)
+    logger.info(f"Default thresholds: recall {current['recall']:.3f}, skip rate {current['skip_rate']:.1%}, "
+                f"{current['missed']} positives skipped")
+    tuned = tune_thresholds(feats, truth_mask, args.min_recall)
+    logger.info(f"Tuned for recall >= {args.min_recall}: recall {tuned['recall']:.3f}, "
+                f"skip rate {tuned['skip_rate']:.1%} with {json.dumps(tuned['thresholds'])}")
+    if listings is not None:
+        tuned = evaluate(feats, truth_mask, tuned['thresholds'], listings)
+        logger.info(f"Detector calls per listing ({current['photos_per_listing']:.1f} photos): "
+                    f"{current['detector_calls_per_listing']:.2f} default, "
+                    f"{tuned['detector_calls_per_listing']:.2f} tuned")
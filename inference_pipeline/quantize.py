@@ -0,0 +1,138 @@
+"""
+Post-training static INT8 quantization of the detector
+Calibration runs on collected photos through the exact serving preprocessing; the INT8 model is only
+accepted into the registry if its mAP@0.5 on the annotated hold-out set stays within the allowed drop
+"""
+
+import logging
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from .evaluation import evaluate_model
+from .preprocess import BatchBuffer, decode_image
+from .registry import DEFAULT_REGISTRY, ModelRegistry
+
+logger = logging.getLogger(__name__)
+
+try:
+    from onnxruntime.quantization import (CalibrationDataReader, CalibrationMethod, QuantFormat, QuantType,
+                                          quantize_static)
+except ImportError:  # keeps the module importable for the registry helpers
+    CalibrationDataReader = object
+    quantize_static = None
+
+CALIBRATION_METHODS = ('minmax', 'entropy', 'percentile')
+
+
+def sample_calibration_images(image_dirs: Sequence, count: int = 200, seed: int = 0) -> List[Path]:
+    """Random sample across the collector output directories"""
+    from model_training.data_loader import list_images
+    paths = [p for d in image_dirs if Path(d).is_dir() for p in list_images(d)]
+    if len(paths) > count:
+        rng = np.random.default_rng(seed)
+        paths = [paths[i] for i in sorted(rng.choice(len(paths), count, replace=False))]
+    return paths
+
+
+class ImageCalibrationReader(CalibrationDataReader):
+    """Feeds calibration batches letterboxed and normalized exactly like DetectionEngine does"""
+
+    def __init__(self, paths: Sequence, input_name: str, input_size: int, batch_size: int = 1):
+        self.paths = list(paths)
+        self.input_name = input_name
+        self.batch_size = batch_size
+        self.buffer = BatchBuffer(batch_size, input_size)
+        self._next = 0
+
+    def get_next(self) -> Optional[Dict[str, np.ndarray]]:
+        while self._next < len(self.paths):
+            chunk = self.paths[self._next:self._next + self.batch_size]
+            self._next += self.batch_size
+            n = 0
+            for path in chunk:
+                img, size = decode_image(Path(path).read_bytes(), self.buffer.input_size)
+                if img is None:
+                    continue
+                self.buffer.load(n, img, size)
+                n += 1
+            if n == self.batch_size:
+                # the quantizer keeps references to every batch, so hand out copies
+                return {self.input_name: self.buffer.normalize(n)[:n].copy()}
+        return None
+
+    def rewind(self):
+        self._next = 0
+
+
+def quantize_model(fp32_path, int8_path, calibration_paths: Sequence, input_size: int = 640,
+                   method: str = 'minmax', per_channel: bool = True, exclude_nodes: Sequence[str] = ()) -> Path:
+    """Static QDQ quantization: INT8 weights, UINT8 activations calibrated on `calibration_paths`"""
+    if quantize_static is None:
+        raise ImportError("onnxruntime with quantization support is required: pip install onnxruntime")
+    import onnx
+
+    model = onnx.load(str(fp32_path))
+    model_input = model.graph.input[0]
+    batch_dim = model_input.type.tensor_type.shape.dim[0]
+    # dynamic-batch models calibrate one image at a time, fixed-batch ones at their batch size
+    batch_size = batch_dim.dim_value if batch_dim.HasField('dim_value') else 1
+
+    int8_path = Path(int8_path)
+    int8_path.parent.mkdir(parents=True, exist_ok=True)
+    source = str(fp32_path)
+    try:
+        from onnxruntime.quantization.shape_inference import quant_pre_process
+        prepared = int8_path.with_suffix('.prep.onnx')
+        quant_pre_process(source, str(prepared), skip_symbolic_shape=True)
+        source = str(prepared)
+    except Exception as e:
+        prepared = None
+        logger.info(f"Skipping quantization pre-processing: {e}")
+
+    reader = ImageCalibrationReader(calibration_paths, model_input.name, input_size, batch_size)
+    methods = {'minmax': CalibrationMethod.MinMax, 'entropy': CalibrationMethod.Entropy,
+               'percentile': CalibrationMethod.Percentile}
+    quantize_static(source, str(int8_path), reader, quant_format=QuantFormat.QDQ,
+                    activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8, per_channel=per_channel,
+                    calibrate_method=methods[method], nodes_to_exclude=list(exclude_nodes))
+    if prepared is not None:
+        prepared.unlink(missing_ok=True)
+    logger.info(f"Quantized {fp32_path} -> {int8_path} with {len(calibration_paths)} calibration images ({method})")
+    return int8_path
+
+
+def quantize_and_gate(name: str, fp32_path, calibration_paths: Sequence, eval_paths: Sequence, labels_dir,
+                      input_size: int = 640, class_names: Optional[Sequence[str]] = None,
+                      max_map_drop: float = 0.01, method: str = 'minmax', per_channel: bool = True,
+                      registry_path=DEFAULT_REGISTRY, int8_path=None) -> Dict:
+    """Quantize, evaluate both variants on the hold-out set and register them
+
+    The INT8 variant is registered as rejected when its mAP@0.5 is more than
+    `max_map_drop` (absolute) below FP32.
+    """
+    registry = ModelRegistry(registry_path)
+    fp32_path = Path(fp32_path)
+    int8_path = Path(int8_path) if int8_path else fp32_path.with_name(f"{fp32_path.stem}.int8.onnx")
+
+    fp32_eval = evaluate_model(fp32_path, eval_paths, labels_dir, input_size, class_names)
+    registry.register(name, 'fp32', fp32_path, map50=fp32_eval['map50'], map=fp32_eval['map'],
+                      infer_ms_per_image=fp32_eval['infer_ms_per_image'], input_size=input_size,
+                      eval_images=len(eval_paths))
+
+    quantize_model(fp32_path, int8_path, calibration_paths, input_size, method, per_channel)
+    int8_eval = evaluate_model(int8_path, eval_paths, labels_dir, input_size, class_names)
+    delta = int8_eval['map50'] - fp32_eval['map50']
+    accepted = bool(delta >= -max_map_drop)
+    speedup = fp32_eval['infer_ms_per_image'] / max(int8_eval['infer_ms_per_image'], 1e-9)
+    entry = registry.register(
+        name, 'int8', int8_path, accepted=accepted, parent=fp32_eval['model_version'],
+        map50=int8_eval['map50'], map=int8_eval['map'], map50_delta=delta, max_map_drop=max_map_drop,
+        infer_ms_per_image=int8_eval['infer_ms_per_image'], speedup=speedup, input_size=input_size,
+        calibration={'images': len(calibration_paths), 'method': method, 'per_channel': per_channel},
+        eval_images=len(eval_paths))
+    logger.info(f"{name}: mAP@0.5 fp32 {fp32_eval['map50']:.4f} int8 {int8_eval['map50']:.4f} "
+                f"(delta {delta:+.4f}, allowed -{max_map_drop}) -> {'ACCEPTED' if accepted else 'REJECTED'}, "
+                f"{speedup:.2f}x faster")
+    return entry
@@ -0,0 +1,88 @@
+"""
+Local model registry: named detectors with their FP32 / INT8 variants and evaluation results
+Kept as one JSON file next to the weights in inference_pipeline/models/
+"""
+
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+from .engine import model_version
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REGISTRY = "inference_pipeline/models/registry.json"
+
+VARIANTS = ('fp32', 'int8')
+
+
+class ModelRegistry:
+    """{name: {variant: entry}} where an entry records path, version, accuracy and the gate outcome
+
+    Variants with accepted=False (failed the accuracy gate) stay listed for
+    reference but resolve() refuses them unless explicitly allowed.
+    """
+
+    def __init__(self, path=DEFAULT_REGISTRY):
+        self.path = Path(path)
+        self.models: Dict[str, Dict[str, Dict]] = {}
+        if self.path.exists():
+            with open(self.path) as f:
+                self.models = json.load(f).get('models', {})
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix('.tmp')
+        with open(tmp, 'w') as f:
+            json.dump({'models': self.models}, f, indent=2)
+        os.replace(tmp, self.path)
+
+    def register(self, name: str, variant: str, path, accepted: bool = True, **info) -> Dict:
+        if variant not in VARIANTS:
+            raise ValueError(f"Unknown variant {variant}, expected one of {VARIANTS}")
+        entry = {'path': str(path), 'model_version': model_version(path), 'accepted': accepted,
+                 'registered_at': time.strftime('%Y-%m-%dT%H:%M:%S'), **info}
+        self.models.setdefault(name, {})[variant] = entry
+        self.save()
+        logger.info(f"Registered {name}/{variant} ({entry['model_version']}){'' if accepted else ' as REJECTED'}")
+        return entry
+
+    def get(self, name: str, variant: str = 'fp32') -> Optional[Dict]:
+        return self.models.get(name, {}).get(variant)
+
+    def resolve(self, name: str, variant: str = 'fp32', allow_rejected: bool = False) -> str:
+        """Path of a registered variant"""
+        entry = self.get(name, variant)
+        if entry is None:
+            raise KeyError(f"No {variant} variant of {name} in {self.path}")
+        if not entry['accepted'] and not allow_rejected:
+            raise ValueError(f"{name}/{variant} failed its accuracy gate "
+                             f"(mAP@0.5 delta {entry.get('map50_delta')}), pass allow_rejected to use it anyway")
+        return entry['path']
+
+    def find_by_path(self, path) -> Optional[str]:
+        """Name of the model whose FP32 variant is `path`"""
+        target = Path(path).resolve()
+        for name, variants in self.models.items():
+            if 'fp32' in variants and Path(variants['fp32']['path']).resolve() == target:
+                return name
+        return None
+
+
+def resolve_model(model: str, variant: str = 'fp32', registry_path=DEFAULT_REGISTRY,
+                  allow_rejected: bool = False) -> str:
+    """--model may be a file or a registry name; the variant is looked up in the registry
+
+    An FP32 file that is not registered is used as is, so plain paths keep
+    working without a registry.
+    """
+    if variant == 'fp32' and Path(model).is_file():
+        return model
+    registry = ModelRegistry(registry_path)
+    name = model if model in registry.models else registry.find_by_path(model)
+    if name is None:
+        raise KeyError(f"{model} is not in {registry_path}; quantize it first to get an {variant} variant")
+    return registry.resolve(name, variant, allow_rejected)
@@ -0,0 +1,117 @@
+"""
+Content-hash keyed detection result cache
+In-memory LRU in front of a size-bounded SQLite store, consulted before any decode
+"""
+
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def content_key(data: bytes) -> str:
+    return hashlib.sha1(data).hexdigest()
+
+
+def namespace_key(model_version: str, config: Dict) -> str:
+    """Results are only reusable for the same model weights and preprocessing"""
+    payload = json.dumps({'model': model_version, 'config': config}, sort_keys=True)
+    return hashlib.sha1(payload.encode()).hexdigest()[:16]
+
+
+class ResultCache:
+    """Persistent result cache keyed by (namespace, image content hash)
+
+    Entries remember how long they took to compute so hits can be reported
+    as saved compute. The disk store is trimmed by least-recent access once
+    it grows past `max_disk_bytes`.
+    """
+
+    def __init__(self, path, namespace: str, memory_entries: int = 4096, max_disk_bytes: int = 256 * 1024 ** 2):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.namespace = namespace
+        self.memory_entries = memory_entries
+        self.max_disk_bytes = max_disk_bytes
+        self._memory: "OrderedDict[str, Tuple[Dict, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.db = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS results (
+            namespace TEXT, key TEXT, value TEXT, bytes INTEGER, compute_ms REAL, last_access REAL,
+            PRIMARY KEY (namespace, key))""")
+        self.db.execute("CREATE INDEX IF NOT EXISTS results_access ON results (last_access)")
+        self._disk_bytes = self.db.execute("SELECT COALESCE(SUM(bytes), 0) FROM results").fetchone()[0]
+
+    def _remember(self, key: str, value: Dict, compute_ms: float):
+        self._memory[key] = (value, compute_ms)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str) -> Optional[Tuple[Dict, float]]:
+        """(result, compute_ms) or None"""
+        with self._lock:
+            hit = self._memory.get(key)
+            if hit is not None:
+                self._memory.move_to_end(key)
+                return hit
+            row = self.db.execute("SELECT value, compute_ms FROM results WHERE namespace = ? AND key = ?",
+                                  (self.namespace, key)).fetchone()
+            if row is None:
+                return None
+            self.db.execute("UPDATE results SET last_access = ? WHERE namespace = ? AND key = ?",
+                            (time.time(), self.namespace, key))
+            value = json.loads(row[0])
+            self._remember(key, value, row[1])
+            return value, row[1]
+
+    def put(self, key: str, value: Dict, compute_ms: float):
+        encoded = json.dumps(value)
+        with self._lock:
+            self._remember(key, value, compute_ms)
+            old = self.db.execute("SELECT bytes FROM results WHERE namespace = ? AND key = ?",
+                                  (self.namespace, key)).fetchone()
+            self.db.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?)",
+                            (self.namespace, key, encoded, len(encoded), compute_ms, time.time()))
+            self._disk_bytes += len(encoded) - (old[0] if old else 0)
+            if self._disk_bytes > self.max_disk_bytes:
+                self._evict()
+
+    def _evict(self):
+        """Drop least recently used rows (any namespace) until 90% of the budget"""
+        target = int(self.max_disk_bytes * 0.9)
+        evicted = 0
+        self.db.execute("BEGIN")
+        while self._disk_bytes > target:
+            rows = self.db.execute("SELECT namespace, key, bytes FROM results ORDER BY last_access LIMIT 512").fetchall()
+            if not rows:
+                break
+            for namespace, key, size in rows:
+                if self._disk_bytes <= target:
+                    break
+                self.db.execute("DELETE FROM results WHERE namespace = ? AND key = ?", (namespace, key))
+                self._disk_bytes -= size
+                evicted += 1
+                if namespace == self.namespace:
+                    self._memory.pop(key, None)
+        self.db.execute("COMMIT")
+        logger.info(f"Evicted {evicted} cached results, {self._disk_bytes / 1024 ** 2:.1f} MB on disk")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            count = self.db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+            return {'entries': count, 'disk_bytes': self._disk_bytes, 'memory_entries': len(self._memory)}
+
+    def close(self):
+        with self._lock:
+            self.db.close()
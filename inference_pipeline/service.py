@@ -0,0 +1,198 @@
+"""
+asyncio HTTP front end for the detection pipeline
+    POST /detect                 raw image body (or multipart field), one JSON result
+    POST /detect/listing         multipart with many photos, NDJSON lines streamed as each finishes
+    GET  /health                 queue depth, in-flight images, batch fill
+    GET  /metrics                full PipelineMetrics snapshot
+"""
+
+import asyncio
+import json
+import logging
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+
+from aiohttp import web
+
+from .pipeline import DetectionPipeline
+
+logger = logging.getLogger(__name__)
+
+
+class Saturated(Exception):
+    """Raised when admitting more images would exceed the in-flight budget"""
+
+
+class DetectionService:
+    """Admission-controlled HTTP wrapper around a DetectionPipeline
+
+    At most `max_pending` images are in flight (decoding, queued or being
+    inferred). A request that does not fit is answered 503 with Retry-After
+    right away rather than queueing, so latency stays bounded under overload.
+    Decoding and cache lookups run on a small thread pool, never on the loop.
+    """
+
+    def __init__(self, pipeline: DetectionPipeline, max_pending: int = 256, retry_after_s: int = 1,
+                 max_listing_images: int = 100, max_body_mb: int = 64, decode_threads: int = 4):
+        self.pipeline = pipeline
+        self.metrics = pipeline.metrics
+        self.max_pending = max_pending
+        self.retry_after_s = retry_after_s
+        self.max_listing_images = max_listing_images
+        self.max_body_mb = max_body_mb
+        self.pending = 0
+        self._decode_pool = ThreadPoolExecutor(max_workers=decode_threads, thread_name_prefix='decode')
+
+    # ---- admission -------------------------------------------------------
+
+    def _check(self, n: int):
+        # only touched from the event loop thread, so no lock
+        if self.pending + n > self.max_pending:
+            self.metrics.incr('http_rejected')
+            raise Saturated()
+
+    def _admit(self, n: int):
+        self._check(n)
+        self.pending += n
+
+    def _release(self, n: int = 1):
+        self.pending -= n
+
+    def _unavailable(self) -> web.Response:
+        return web.json_response({'error': 'saturated', 'pending': self.pending},
+                                 status=503, headers={'Retry-After': str(self.retry_after_s)})
+
+    async def _detect(self, data: bytes) -> Dict:
+        """One admitted image through the pipeline; releases its admission slot"""
+        loop = asyncio.get_running_loop()
+        try:
+            future = await loop.run_in_executor(self._decode_pool, self.pipeline.submit_bytes, data, False)
+            return await asyncio.wrap_future(future)
+        except queue.Full:
+            # the batcher queue is the last line of defence behind the admission budget
+            self.metrics.incr('http_rejected')
+            raise Saturated()
+        finally:
+            self._release()
+
+    # ---- handlers --------------------------------------------------------
+
+    async def _read_images(self, request: web.Request) -> List[Tuple[str, bytes]]:
+        if request.content_type.startswith('multipart/'):
+            images = []
+            reader = await request.multipart()
+            while True:
+                part = await reader.next()
+                if part is None:
+                    break
+                if part.filename is None and part.name not in ('image', 'images'):
+                    continue
+                images.append((part.filename or part.name, await part.read(decode=False)))
+            return images
+        return [('body', await request.read())]
+
+    async def detect(self, request: web.Request) -> web.Response:
+        start = time.perf_counter()
+        try:
+            # admitted before the body is read, so a saturated service does not buffer uploads it will reject
+            self._admit(1)
+        except Saturated:
+            return self._unavailable()
+        try:
+            images = await self._read_images(request)
+        except BaseException:
+            self._release()
+            raise
+        if len(images) != 1:
+            self._release()
+            return web.json_response({'error': 'expected exactly one image'}, status=400)
+        try:
+            result = await self._detect(images[0][1])
+        except Saturated:
+            return self._unavailable()
+        except ValueError as e:
+            return web.json_response({'error': str(e)}, status=422)
+        self.metrics.observe('http_ms', (time.perf_counter() - start) * 1000)
+        return web.json_response(result)
+
+    async def detect_listing(self, request: web.Request) -> web.StreamResponse:
+        """All photos of a listing in one request, results streamed in completion order"""
+        start = time.perf_counter()
+        try:
+            # the image count is only known from the body, but a full service rejects before reading it
+            self._check(1)
+        except Saturated:
+            return self._unavailable()
+        images = await self._read_images(request)
+        if not images:
+            return web.json_response({'error': 'no images'}, status=400)
+        if len(images) > self.max_listing_images:
+            return web.json_response({'error': f'at most {self.max_listing_images} images per listing'}, status=413)
+        try:
+            # all-or-nothing, a half-admitted listing would just time out on the client
+            self._admit(len(images))
+        except Saturated:
+            return self._unavailable()
+
+        async def run(index: int, name: str, data: bytes):
+            try:
+                result = await self._detect(data)
+                return dict(result, index=index, name=name)
+            except Saturated:
+                return {'index': index, 'name': name, 'error': 'saturated'}
+            except Exception as e:
+                return {'index': index, 'name': name, 'error': str(e)}
+
+        tasks = [asyncio.ensure_future(run(i, name, data)) for i, (name, data) in enumerate(images)]
+        response = web.StreamResponse(headers={'Content-Type': 'application/x-ndjson'})
+        try:
+            await response.prepare(request)
+            for task in asyncio.as_completed(tasks):
+                await response.write((json.dumps(await task) + '\n').encode())
+            await response.write_eof()
+        except (ConnectionResetError, asyncio.CancelledError):
+            # client went away; the remaining images still finish and free their slots
+            logger.info(f"Listing stream of {len(images)} images aborted by client")
+            raise
+        self.metrics.observe('http_listing_ms', (time.perf_counter() - start) * 1000)
+        return response
+
+    def health_status(self) -> Dict:
+        snapshot = self.metrics.snapshot()
+        fill = snapshot['series'].get('batch_fill', {})
+        latency = snapshot['series'].get('latency_ms', {})
+        return {
+            'status': 'saturated' if self.pending >= self.max_pending else 'ok',
+            'queue_depth': self.pipeline.batcher.queue_depth(),
+            'pending': self.pending,
+            'max_pending': self.max_pending,
+            'batch_fill': fill.get('mean'),
+            'latency_p95_ms': latency.get('p95'),
+            'rejected': snapshot['counters'].get('http_rejected', 0),
+        }
+
+    async def health(self, request: web.Request) -> web.Response:
+        return web.json_response(self.health_status())
+
+    async def metrics_handler(self, request: web.Request) -> web.Response:
+        return web.json_response(self.metrics.snapshot())
+
+    def app(self) -> web.Application:
+        app = web.Application(client_max_size=self.max_body_mb * 1024 ** 2)
+        app.router.add_post('/detect', self.detect)
+        app.router.add_post('/detect/listing', self.detect_listing)
+        app.router.add_get('/health', self.health)
+        app.router.add_get('/metrics', self.metrics_handler)
+        app.on_cleanup.append(self._cleanup)
+        return app
+
+    async def _cleanup(self, app: web.Application):
+        self._decode_pool.shutdown(wait=False)
+        self.pipeline.close()
+
+
+def serve(service: DetectionService, host: str = '127.0.0.1', port: int = 8080):
+    logger.info(f"Serving detection on http://{host}:{port}")
+    web.run_app(service.app(), host=host, port=port, print=None)
@@ -0,0 +1,147 @@
+"""
+Tiled inference for high-resolution photos
+Overlapping crops go through the detector as one batch, detections are merged with vectorized NMS / WBF
+"""
+
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .boxes import batched_nms, box_area, weighted_box_fusion
+
+DetectFn = Callable[[List[np.ndarray]], List[List[Dict]]]
+
+
+def tile_grid(width: int, height: int, tile: int, overlap: float = 0.2) -> np.ndarray:
+    """(T, 4) xyxy tiles covering the image with at least `overlap` between neighbours"""
+    def starts(length):
+        if length <= tile:
+            return np.array([0])
+        count = int(np.ceil((length - tile) / (tile * (1 - overlap)))) + 1
+        return np.round(np.linspace(0, length - tile, count)).astype(np.int64)
+
+    xs, ys = starts(width), starts(height)
+    x1, y1 = np.meshgrid(xs, ys)
+    x1, y1 = x1.ravel(), y1.ravel()
+    return np.stack([x1, y1, np.minimum(x1 + tile, width), np.minimum(y1 + tile, height)], axis=1)
+
+
+def merge_boxes(boxes: np.ndarray, scores: np.ndarray, classes: np.ndarray, iou_threshold: float = 0.55,
+                method: str = 'wbf') -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Merge overlapping same-class detections from several tiles
+
+    'nms' keeps the best box of each cluster; 'wbf' replaces it with the
+    score-weighted average of every box in the cluster, which repairs boxes
+    cut by a tile border.
+    """
+    if method == 'nms':
+        keep = batched_nms(boxes, scores, classes, iou_threshold)
+        return boxes[keep], scores[keep], classes[keep]
+    # one class at a time keeps the fusion's box x seed IoU matrix to a single class's detections
+    parts = [weighted_box_fusion(boxes[classes == c], scores[classes == c], classes[classes == c], iou_threshold)
+             for c in np.unique(classes)]
+    if not parts:
+        return boxes, scores, classes
+    return tuple(np.concatenate(arrays) for arrays in zip(*parts))
+
+
+def detections_to_arrays(detections: List[Dict], offset: Sequence[float] = (0, 0), top_k: Optional[int] = None):
+    if top_k is not None and len(detections) > top_k:
+        detections = sorted(detections, key=lambda d: -d['score'])[:top_k]
+    if not detections:
+        return np.zeros((0, 4), np.float32), np.zeros(0, np.float32), np.zeros(0, np.int64)
+    boxes = np.array([d['box'] for d in detections], dtype=np.float32)
+    boxes[:, 0::2] += offset[0]
+    boxes[:, 1::2] += offset[1]
+    scores = np.array([d['score'] for d in detections], dtype=np.float32)
+    classes = np.array([d['class_id'] for d in detections], dtype=np.int64)
+    return boxes, scores, classes
+
+
+def arrays_to_detections(boxes, scores, classes, class_names: Sequence[str]) -> List[Dict]:
+    order = np.argsort(-scores, kind='stable')
+    return [{'label': class_names[c], 'class_id': int(c), 'score': round(float(s), 4),
+             'box': [round(float(v), 1) for v in b]}
+            for b, s, c in zip(boxes[order], scores[order], classes[order])]
+
+
+class TiledDetector:
+    """Decides per image whether a tiled second pass is worth it and runs it
+
+    A large image is tiled only when the first full-frame pass looks unsure:
+    a detection inside the uncertainty band, or one so small it probably
+    lost detail to the downscale. Otherwise the first pass is returned as is.
+    """
+
+    def __init__(self, class_names: Sequence[str], input_size: int, tile_size: Optional[int] = None,
+                 overlap: float = 0.2, min_side: Optional[int] = None, uncertain_band: Tuple[float, float] = (0.25, 0.5),
+                 small_box_fraction: float = 0.002, always_tile_above: Optional[int] = None,
+                 merge: str = 'wbf', iou_threshold: float = 0.55, max_detections: int = 100,
+                 max_tiles_per_side: int = 4):
+        self.class_names = tuple(class_names)
+        self.tile_size = tile_size or input_size * 2
+        self.overlap = overlap
+        # below this size tiles would not be meaningfully sharper than the full-frame pass
+        self.min_side = min_side or int(self.tile_size * 1.5)
+        self.uncertain_band = uncertain_band
+        self.small_box_fraction = small_box_fraction
+        self.always_tile_above = always_tile_above
+        self.merge = merge
+        self.iou_threshold = iou_threshold
+        # same cap as a single pass (decode_detections), tiles otherwise add up their detections
+        self.max_detections = max_detections
+        # huge photos get bigger tiles rather than more of them, see tile_size_for()
+        self.max_tiles_per_side = max_tiles_per_side
+
+    @property
+    def config(self) -> Dict:
+        return {'tiling': {'tile_size': self.tile_size, 'overlap': self.overlap, 'min_side': self.min_side,
+                           'uncertain_band': list(self.uncertain_band), 'small_box_fraction': self.small_box_fraction,
+                           'always_tile_above': self.always_tile_above, 'merge': self.merge,
+                           'iou_threshold': self.iou_threshold, 'max_detections': self.max_detections,
+                           'max_tiles_per_side': self.max_tiles_per_side}}
+
+    def tile_reason(self, width: int, height: int, detections: List[Dict]) -> Optional[str]:
+        """Why this image should be tiled, or None"""
+        long_side = max(width, height)
+        if self.always_tile_above and long_side >= self.always_tile_above:
+            return 'size'
+        if long_side < self.min_side:
+            return None
+        if not detections:
+            return None
+        boxes, scores, _ = detections_to_arrays(detections)
+        lo, hi = self.uncertain_band
+        if np.any((scores >= lo) & (scores < hi)):
+            return 'uncertain'
+        if np.any(box_area(boxes) < self.small_box_fraction * width * height):
+            return 'small_boxes'
+        return None
+
+    def tile_size_for(self, width: int, height: int) -> int:
+        """tile_size, grown so the grid has at most max_tiles_per_side tiles along the long side"""
+        # n tiles with the configured overlap cover 1 + (n - 1) * (1 - overlap) tile sides
+        span = 1 + (self.max_tiles_per_side - 1) * (1 - self.overlap)
+        return max(self.tile_size, int(np.ceil(max(width, height) / span)))
+
+    def tile_count(self, width: int, height: int) -> int:
+        return len(tile_grid(width, height, self.tile_size_for(width, height), self.overlap))
+
+    def detect_tiles(self, img: np.ndarray, first_pass: List[Dict], detect: DetectFn) -> List[Dict]:
+        """Run every tile through `detect` in one call and merge with the first pass"""
+        height, width = img.shape[:2]
+        tiles = tile_grid(width, height, self.tile_size_for(width, height), self.overlap)
+        # crops are views, the engine letterboxes them straight into its batch buffer
+        crops = [img[y1:y2, x1:x2] for x1, y1, x2, y2 in tiles.tolist()]
+        per_tile = detect(crops)
+
+        parts = [detections_to_arrays(first_pass)]
+        # a tile contributes at most max_detections boxes, like a single pass
+        parts += [detections_to_arrays(dets, tile[:2], self.max_detections)
+                  for dets, tile in zip(per_tile, tiles.tolist())]
+        boxes = np.concatenate([p[0] for p in parts])
+        scores = np.concatenate([p[1] for p in parts])
+        classes = np.concatenate([p[2] for p in parts])
+        boxes, scores, classes = merge_boxes(boxes, scores, classes, self.iou_threshold, self.merge)
+        top = np.argsort(-scores, kind='stable')[:self.max_detections]
+        return arrays_to_detections(boxes[top], scores[top], classes[top], self.class_names)
@@ -0,0 +1,77 @@
+"""
+Generates a tiny YOLO-shaped ONNX detector so the pipeline can be exercised without trained weights
+Boxes sit on an 8x8-pixel grid; class scores are a fixed linear function of the cell's mean colour
+"""
+
+import logging
+from pathlib import Path
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+CELL = 8
+
+
+def build_tiny_model(path, input_size: int = 64, num_classes: int = 3, seed: int = 0, dynamic_batch: bool = True):
+    """Write the model to `path`; output is (N, P, 4 + num_classes) [cx, cy, w, h, scores]"""
+    import onnx
+    from onnx import TensorProto, helper, numpy_helper
+
+    rng = np.random.default_rng(seed)
+    grid = input_size // CELL
+    ys, xs = np.mgrid[0:grid, 0:grid]
+    centers = (np.stack([xs.ravel(), ys.ravel()], axis=1) * CELL + CELL / 2).astype(np.float32)[None]
+
+    initializers = [
+        numpy_helper.from_array(np.array([0, 3, -1], dtype=np.int64), 'flat_shape'),
+        numpy_helper.from_array(rng.normal(0, 3, (3, 2 + num_classes)).astype(np.float32), 'weight'),
+        numpy_helper.from_array(np.concatenate([rng.normal(-1, 0.5, 2), rng.normal(0, 1, num_classes)]).astype(np.float32),
+                                'bias'),
+        numpy_helper.from_array(centers, 'centers'),
+        numpy_helper.from_array(np.array(input_size / 2, dtype=np.float32), 'wh_scale'),
+        numpy_helper.from_array(np.array(0, dtype=np.float32), 'zero'),
+        numpy_helper.from_array(np.array([0], dtype=np.int64), 'start_wh'),
+        numpy_helper.from_array(np.array([2], dtype=np.int64), 'end_wh'),
+        numpy_helper.from_array(np.array([2 + num_classes], dtype=np.int64), 'end_cls'),
+        numpy_helper.from_array(np.array([-1], dtype=np.int64), 'last_axis'),
+    ]
+    nodes = [
+        helper.make_node('AveragePool', ['images'], ['pooled'], kernel_shape=[CELL, CELL], strides=[CELL, CELL]),
+        helper.make_node('Reshape', ['pooled', 'flat_shape'], ['flat']),
+        helper.make_node('Transpose', ['flat'], ['cells'], perm=[0, 2, 1]),
+        helper.make_node('MatMul', ['cells', 'weight'], ['linear']),
+        helper.make_node('Add', ['linear', 'bias'], ['logits']),
+        helper.make_node('Sigmoid', ['logits'], ['probs']),
+        helper.make_node('Slice', ['probs', 'start_wh', 'end_wh', 'last_axis'], ['wh_unit']),
+        helper.make_node('Slice', ['probs', 'end_wh', 'end_cls', 'last_axis'], ['scores']),
+        helper.make_node('Mul', ['wh_unit', 'wh_scale'], ['wh']),
+        helper.make_node('Mul', ['wh_unit', 'zero'], ['zeros']),
+        helper.make_node('Add', ['zeros', 'centers'], ['xy']),
+        helper.make_node('Concat', ['xy', 'wh', 'scores'], ['output0'], axis=-1),
+    ]
+    batch = 'batch' if dynamic_batch else 1
+    graph = helper.make_graph(
+        nodes, 'tiny_detector',
+        [helper.make_tensor_value_info('images', TensorProto.FLOAT, [batch, 3, input_size, input_size])],
+        [helper.make_tensor_value_info('output0', TensorProto.FLOAT, [batch, grid * grid, 4 + num_classes])],
+        initializers,
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid('', 13)], producer_name='tiny_model')
+    model.ir_version = 8
+    onnx.checker.check_model(model)
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    onnx.save(model, str(path))
+    logger.info(f"Wrote tiny {input_size}px detector with {num_classes} classes to {path}")
+    return path
+
+
+if __name__ == "__main__":
+    import argparse
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Generate a tiny test detector")
+    parser.add_argument("path", nargs="?", default="inference_pipeline/models/tiny.onnx")
+    parser.add_argument("--input-size", type=int, default=64)
+    args = parser.parse_args()
+    build_tiny_model(args.path, args.input_size)
@@ -0,0 +1,177 @@
+"""
+Incremental directory-watch inference over the collector output
+New or changed images are detected as they land and appended to a JSONL results store
+"""
+
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from .pipeline import DetectionPipeline
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+
+# Collector output directories, relative to the repo root
+DEFAULT_WATCH_DIRS = (
+    "data_collection/real_estate_photos/images",
+    "data_collection/real_estate_dataset/images",
+)
+
+
+class ResultsStore:
+    """Append-only JSONL of detection results plus the (size, mtime) state of every processed file
+
+    The results log is the record of what was scored: every line carries
+    its file's size and mtime, so the per-file state is rebuilt from it on
+    load. The small state file only keeps directory mtimes and is rewritten
+    when they change.
+    """
+
+    def __init__(self, results_path, state_path=None):
+        self.results_path = Path(results_path)
+        self.results_path.parent.mkdir(parents=True, exist_ok=True)
+        self.state_path = Path(state_path) if state_path else self.results_path.with_suffix('.state.json')
+        self.files: Dict[str, List[int]] = {}
+        self.dirs: Dict[str, int] = {}
+        self._saved_dirs: Dict[str, int] = {}
+        self._load()
+
+    def _load(self):
+        if self.state_path.exists():
+            with open(self.state_path) as f:
+                self.dirs = json.load(f).get('dirs', {})
+            self._saved_dirs = dict(self.dirs)
+        if not self.results_path.exists():
+            return
+        good = 0
+        with open(self.results_path, 'rb') as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # torn last line after a crash
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    good += len(line)
+                    continue
+                self.files[record['path']] = [record['size'], record['mtime_ns']]
+                good += len(line)
+        if good < self.results_path.stat().st_size:
+            # drop the torn tail so the next append starts on a fresh line
+            os.truncate(self.results_path, good)
+        logger.info(f"Loaded watch state for {len(self.files)} files from {self.results_path}")
+
+    def is_current(self, path: str, size: int, mtime_ns: int) -> bool:
+        return self.files.get(path) == [size, mtime_ns]
+
+    def append(self, records: Iterable[Dict]):
+        lines = []
+        for record in records:
+            self.files[record['path']] = [record['size'], record['mtime_ns']]
+            lines.append(json.dumps(record) + "\n")
+        if lines:
+            with open(self.results_path, 'a') as f:
+                f.writelines(lines)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def save_state(self):
+        """Persist the directory mtimes, only when they changed since the last save"""
+        if self.dirs == self._saved_dirs:
+            return
+        tmp = self.state_path.with_suffix('.tmp')
+        with open(tmp, 'w') as f:
+            json.dump({'dirs': self.dirs}, f)
+        os.replace(tmp, self.state_path)
+        self._saved_dirs = dict(self.dirs)
+
+
+class DirectoryWatcher:
+    """Polls collector directories and runs detection on files not yet in the results store
+
+    A directory is only listed when its mtime changed (new or renamed files),
+    with a full listing every `full_scan_every` polls to catch in-place
+    rewrites. Files younger than `settle_s` are left for the next poll so
+    half-written downloads are not scored.
+    """
+
+    def __init__(self, pipeline: DetectionPipeline, store: ResultsStore, dirs: Iterable = DEFAULT_WATCH_DIRS,
+                 poll_interval: float = 2.0, chunk_size: int = 64, settle_s: float = 1.0, full_scan_every: int = 30):
+        self.pipeline = pipeline
+        self.store = store
+        self.dirs = [Path(d) for d in dirs]
+        self.poll_interval = poll_interval
+        self.chunk_size = chunk_size
+        self.settle_s = settle_s
+        self.full_scan_every = full_scan_every
+        self._polls = 0
+
+    def scan(self) -> List[tuple]:
+        """(path, size, mtime_ns) of files that are new or changed since they were scored"""
+        full = self._polls % self.full_scan_every == 0
+        self._polls += 1
+        now_ns = time.time_ns()
+        settle_ns = int(self.settle_s * 1e9)
+        pending = []
+        for directory in self.dirs:
+            if not directory.is_dir():
+                continue
+            dir_key = str(directory.resolve())
+            dir_mtime = directory.stat().st_mtime_ns
+            if not full and self.store.dirs.get(dir_key) == dir_mtime:
+                continue
+            unsettled = False
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if not entry.name.lower().endswith(IMAGE_EXTENSIONS) or not entry.is_file():
+                        continue
+                    st = entry.stat()
+                    path = os.path.abspath(entry.path)
+                    if self.store.is_current(path, st.st_size, st.st_mtime_ns):
+                        continue
+                    if now_ns - st.st_mtime_ns < settle_ns:
+                        unsettled = True
+                        continue
+                    pending.append((path, st.st_size, st.st_mtime_ns))
+            # keep listing a directory until everything in it has settled
+            self.store.dirs[dir_key] = None if unsettled else dir_mtime
+        return sorted(pending)
+
+    def process(self, pending: List[tuple]) -> int:
+        """Score pending files chunk by chunk, committing results after each chunk"""
+        done = 0
+        for start in range(0, len(pending), self.chunk_size):
+            chunk = pending[start:start + self.chunk_size]
+            results = self.pipeline.detect_files([path for path, _, _ in chunk])
+            records = []
+            for (path, size, mtime_ns), result in zip(chunk, results):
+                record = {'path': path, 'size': size, 'mtime_ns': mtime_ns, 'processed_at': time.time()}
+                if result is None:
+                    record['error'] = 'detection_failed'
+                else:
+                    record.update(result)
+                records.append(record)
+            self.store.append(records)
+            done += len(chunk)
+            self.pipeline.metrics.incr('watch_processed', len(chunk))
+        return done
+
+    def run_once(self) -> int:
+        pending = self.scan()
+        processed = self.process(pending) if pending else 0
+        self.store.save_state()
+        if processed:
+            logger.info(f"Processed {processed} new images")
+        return processed
+
+    def run(self, max_idle_polls: Optional[int] = None):
+        """Poll forever (or until `max_idle_polls` consecutive polls found nothing)"""
+        idle = 0
+        logger.info(f"Watching {', '.join(str(d) for d in self.dirs)}")
+        while max_idle_polls is None or idle < max_idle_polls:
+            idle = 0 if self.run_once() else idle + 1
+            time.sleep(self.poll_interval)
@@ -0,0 +1,322 @@
+"""
+Multi-process CPU inference
+The front process letterboxes batches into shared-memory slabs; model worker processes pinned to
+disjoint core sets run the detector on them. Only slab indices and detections cross process boundaries.
+"""
+
+import logging
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+import cv2
+import numpy as np
+
+from .engine import CLASS_NAMES, DetectionEngine, DynamicBatcher, engine_config
+from .metrics import PipelineMetrics
+from .preprocess import BatchBuffer
+
+logger = logging.getLogger(__name__)
+
+
+def core_sets(workers: int, cores: Optional[Sequence[int]] = None) -> List[Set[int]]:
+    """Split the usable cores into `workers` disjoint, contiguous sets
+
+    With more workers than cores the sets wrap around and share cores.
+    """
+    cores = sorted(cores if cores is not None else os.sched_getaffinity(0))
+    if workers >= len(cores):
+        return [{cores[i % len(cores)]} for i in range(workers)]
+    bounds = np.linspace(0, len(cores), workers + 1).round().astype(int)
+    return [set(cores[bounds[i]:bounds[i + 1]]) for i in range(workers)]
+
+
+class ModelInfo:
+    """What the front process knows about the model its workers run"""
+
+    def __init__(self, model_path, input_size: int, class_names: Sequence[str], max_batch: int,
+                 conf_threshold: float, iou_threshold: float, model_version: str):
+        self.model_path = str(model_path)
+        self.input_size = input_size
+        self.class_names = tuple(class_names)
+        self.max_batch = max_batch
+        self.conf_threshold = conf_threshold
+        self.iou_threshold = iou_threshold
+        self.model_version = model_version
+
+    @property
+    def config(self) -> Dict:
+        return engine_config(self.input_size, self.class_names, self.conf_threshold, self.iou_threshold)
+
+
+def _model_worker(rank: int, cores: Set[int], engine_kwargs: Dict, staging_name: str, letterbox_name: str,
+                  shape, tasks, results):
+    """Worker process: pin, load the model, run slabs until a None task arrives"""
+    if hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cores)
+    cv2.setNumThreads(1)
+    staging_shm = shared_memory.SharedMemory(name=staging_name)
+    letterbox_shm = shared_memory.SharedMemory(name=letterbox_name)
+    staging = np.ndarray(shape, dtype=np.uint8, buffer=staging_shm.buf)
+    letterbox = np.ndarray(shape[:2] + (3,), dtype=np.float32, buffer=letterbox_shm.buf)
+    try:
+        engine = DetectionEngine(threads=len(cores), **engine_kwargs)
+        results.put(('ready', rank, engine.max_batch, engine.model_version))
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            slab, n, sizes = task
+            start = time.perf_counter()
+            try:
+                detections = engine.infer_letterboxed(staging[slab, :n], letterbox[slab, :n], sizes)
+                results.put(('done', slab, detections, (time.perf_counter() - start) * 1000))
+            except Exception as e:
+                results.put(('error', slab, f"{type(e).__name__}: {e}", 0.0))
+    except Exception as e:
+        results.put(('failed', rank, f"{type(e).__name__}: {e}", None))
+    finally:
+        del staging, letterbox
+        staging_shm.close()
+        letterbox_shm.close()
+
+
+class ProcessBatcher(DynamicBatcher):
+    """DynamicBatcher whose batches run on a pool of pinned model processes
+
+    Same submit()/detect_many() interface, so DetectionPipeline, the watcher
+    and the service work unchanged. The dispatcher thread collects a batch,
+    letterboxes it into a free slab and queues the slab index; any idle worker
+    takes it. Free slabs are the backpressure: with every slab in flight the
+    dispatcher waits and the request queue fills up.
+
+    If a worker process dies the batcher fails: in-flight and queued images
+    get the error and later submit() calls raise it.
+    """
+
+    def __init__(self, model_path, workers: int = 2, input_size: int = 640,
+                 class_names: Sequence[str] = CLASS_NAMES, max_batch: int = 8, max_wait_ms: float = 5.0,
+                 max_queue: int = 1024, backend: str = 'onnxruntime', conf_threshold: float = 0.25,
+                 iou_threshold: float = 0.45, slabs_per_worker: int = 2, cores: Optional[Sequence[int]] = None,
+                 metrics: Optional[PipelineMetrics] = None, start_timeout: float = 60.0):
+        self.workers = workers
+        self.max_wait = max_wait_ms / 1000.0
+        self.metrics = metrics or PipelineMetrics()
+        self.queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._failed: Optional[Exception] = None
+
+        slabs = workers * slabs_per_worker
+        self._shape = (slabs, max_batch, input_size, input_size, 3)
+        self._staging_shm = shared_memory.SharedMemory(create=True, size=int(np.prod(self._shape)))
+        self._letterbox_shm = shared_memory.SharedMemory(create=True, size=slabs * max_batch * 3 * 4)
+        staging = np.ndarray(self._shape, dtype=np.uint8, buffer=self._staging_shm.buf)
+        letterbox = np.ndarray((slabs, max_batch, 3), dtype=np.float32, buffer=self._letterbox_shm.buf)
+        self._slabs = [BatchBuffer(max_batch, input_size, staging=staging[i], letterbox=letterbox[i])
+                       for i in range(slabs)]
+        self._free = queue.Queue()
+        for i in range(slabs):
+            self._free.put(i)
+        self._inflight: Dict[int, list] = {}
+
+        ctx = mp.get_context()
+        self._tasks = ctx.Queue()
+        self._results = ctx.Queue()
+        engine_kwargs = dict(model_path=str(model_path), input_size=input_size, class_names=tuple(class_names),
+                             max_batch=max_batch, backend=backend, conf_threshold=conf_threshold,
+                             iou_threshold=iou_threshold)
+        self.core_sets = core_sets(workers, cores)
+        self._procs = []
+        for rank, worker_cores in enumerate(self.core_sets):
+            proc = ctx.Process(target=_model_worker, daemon=True, name=f'model-worker-{rank}',
+                               args=(rank, worker_cores, engine_kwargs, self._staging_shm.name,
+                                     self._letterbox_shm.name, self._shape, self._tasks, self._results))
+            proc.start()
+            self._procs.append(proc)
+
+        worker_batch, version = self._wait_ready(start_timeout)
+        self.max_batch = min(max_batch, worker_batch)
+        self.engine = ModelInfo(model_path, input_size, class_names, self.max_batch, conf_threshold,
+                                iou_threshold, version)
+        logger.info(f"Started {workers} model workers on cores {[sorted(c) for c in self.core_sets]}, "
+                    f"{slabs} slabs of {max_batch}x{input_size}x{input_size}")
+
+        self._receiver = threading.Thread(target=self._receive_loop, name='worker-results', daemon=True)
+        self._receiver.start()
+        self._thread = threading.Thread(target=self._loop, name='process-batcher', daemon=True)
+        self._thread.start()
+
+    def _wait_ready(self, timeout: float):
+        ready, worker_batch, version = 0, None, None
+        deadline = time.monotonic() + timeout
+        while ready < self.workers:
+            try:
+                kind, rank, value, detail = self._results.get(timeout=max(deadline - time.monotonic(), 0.01))
+            except queue.Empty:
+                self._shutdown()
+                raise RuntimeError(f"Only {ready}/{self.workers} model workers started")
+            if kind == 'failed':
+                self._shutdown()
+                raise RuntimeError(f"Model worker {rank} failed to start: {value}")
+            ready += 1
+            worker_batch = value if worker_batch is None else min(worker_batch, value)
+            version = detail
+        return worker_batch, version
+
+    def submit(self, image: np.ndarray, block: bool = True, source_size: Optional[Tuple[int, int]] = None) -> Future:
+        if self._failed is not None:
+            raise self._failed
+        return super().submit(image, block, source_size)
+
+    def _loop(self):
+        while not self._stop.is_set():
+            batch = self._collect()
+            if not batch:
+                continue
+            slab = self._free.get()
+            if self._failed is not None:
+                self._free.put(slab)
+                for _, _, future, _ in batch:
+                    future.set_exception(self._failed)
+                continue
+            buffer = self._slabs[slab]
+            sizes = []
+            for i, (img, source_size, _, _) in enumerate(batch):
+                buffer.load(i, img, source_size)
+                sizes.append(source_size or (img.shape[1], img.shape[0]))
+            self._inflight[slab] = batch
+            self._tasks.put((slab, len(batch), sizes))
+            if self._failed is not None:
+                self._fail_inflight(self._failed)  # the receiver gave up while this batch was loading
+
+    def _receive_loop(self):
+        while not self._stop.is_set() or self._inflight:
+            try:
+                kind, slab, payload, infer_ms = self._results.get(timeout=0.5)
+            except queue.Empty:
+                if self._stop.is_set() or all(p.is_alive() for p in self._procs):
+                    continue
+                self._fail(RuntimeError("Model worker died"))
+                return
+            except (EOFError, OSError):
+                return
+            if kind == 'failed':
+                logger.error(f"Model worker {slab} failed: {payload}")
+                continue
+            batch = self._inflight.pop(slab)
+            self._free.put(slab)
+            if kind == 'error':
+                logger.error(f"Batch of {len(batch)} failed: {payload}")
+                for _, _, future, _ in batch:
+                    future.set_exception(RuntimeError(payload))
+                continue
+
+            done = time.perf_counter()
+            self.metrics.incr('batches')
+            self.metrics.incr('images', len(batch))
+            self.metrics.observe('batch_size', len(batch))
+            self.metrics.observe('batch_fill', len(batch) / self.max_batch)
+            self.metrics.observe('infer_ms', infer_ms)
+            for (_, _, future, queued_at), result in zip(batch, payload):
+                self.metrics.observe('latency_ms', (done - queued_at) * 1000)
+                future.set_result(result)
+
+    def _fail_inflight(self, error: Exception):
+        for slab in list(self._inflight):
+            batch = self._inflight.pop(slab, None)
+            if batch is None:
+                continue  # failed by the other thread meanwhile
+            for _, _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(error)
+            self._free.put(slab)
+
+    def _fail(self, error: Exception):
+        """Stop taking work after a worker died and fail everything pending with `error`"""
+        logger.error(f"{error}, failing in-flight and queued images")
+        self._failed = error
+        self._stop.set()
+        self._fail_inflight(error)
+        self._fail_queued(error)
+
+    def _shutdown(self):
+        for _ in self._procs:
+            self._tasks.put(None)
+        for proc in self._procs:
+            proc.join(timeout=5)
+            if proc.is_alive():
+                proc.terminate()
+        self._procs = []
+        self._slabs = []
+        for shm in (self._staging_shm, self._letterbox_shm):
+            shm.close()
+            shm.unlink()
+
+    def close(self):
+        super().close()
+        # let workers finish what was dispatched before stopping them
+        self._receiver.join(timeout=30)
+        self._fail_inflight(RuntimeError("Batcher closed"))
+        self._shutdown()
+
+
+def benchmark_scaling(model_path, paths: List, worker_counts: Sequence[int] = (1, 2, 4), input_size: int = 640,
+                      max_batch: int = 8, rounds: int = 3, backend: str = 'onnxruntime') -> List[Dict]:
+    """Throughput for each worker count on the same decoded images
+
+    Images are decoded once up front so the curve shows model scaling, not
+    disk or JPEG decode. Efficiency is speedup over one worker divided by the
+    number of workers.
+    """
+    from .preprocess import decode_image
+    images = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            img, size = decode_image(f.read(), input_size)
+        if img is not None:
+            images.append((img, size))
+
+    rows = []
+    for workers in worker_counts:
+        with ProcessBatcher(model_path, workers, input_size, max_batch=max_batch, backend=backend,
+                            max_queue=len(images) + 1) as batcher:
+            warmup = [batcher.submit(img, source_size=size) for img, size in images[:max_batch * workers]]
+            [f.result() for f in warmup]
+            batcher.metrics.reset()
+            start = time.perf_counter()
+            for _ in range(rounds):
+                futures = [batcher.submit(img, source_size=size) for img, size in images]
+                [f.result() for f in futures]
+            elapsed = time.perf_counter() - start
+            fill = batcher.metrics.values('batch_fill')
+        ips = len(images) * rounds / elapsed
+        base = rows[0]['images_per_s'] / rows[0]['workers'] if rows else ips / workers
+        row = {'workers': workers, 'images_per_s': ips, 'speedup': ips / base,
+               'efficiency': ips / base / workers, 'batch_fill': float(fill.mean()) if len(fill) else 0.0}
+        rows.append(row)
+        logger.info(f"{workers:3d} workers: {ips:8.1f} images/s | speedup {row['speedup']:.2f}x "
+                    f"| efficiency {row['efficiency']:.0%} | batch fill {row['batch_fill']:.2f}")
+    return rows
+
+
+if __name__ == "__main__":
+    import argparse
+    from model_training.data_loader import list_images
+
+    parser = argparse.ArgumentParser(description="Multi-process inference scaling benchmark")
+    parser.add_argument("--model", required=True)
+    parser.add_argument("--images", required=True)
+    parser.add_argument("--workers", type=int, nargs="+",
+                        default=[w for w in (1, 2, 4, 8, 16, 32, 64) if w <= len(os.sched_getaffinity(0))])
+    parser.add_argument("--input-size", type=int, default=640)
+    parser.add_argument("--max-batch", type=int, default=8)
+    parser.add_argument("--limit", type=int, default=256)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    benchmark_scaling(args.model, list_images(args.images)[:args.limit], args.workers, args.input_size,
+                      args.max_batch)
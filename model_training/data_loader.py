@@ -0,0 +1,303 @@
+"""
+High-throughput training data loader over the flat JPEG directories the collectors produce
+Worker processes decode at reduced resolution and letterbox straight into shared-memory batch slots
+"""
+
+import logging
+import multiprocessing as mp
+import time
+from collections import namedtuple
+from multiprocessing import shared_memory
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import cv2
+import numpy as np
+
+from .transforms import PAD_VALUE, decode_reduced, hflip_, letterbox_into
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+
+# images: (n, S, S, 3) uint8 BGR view, params: (n, 3) float32 [scale, left, top],
+# labels: list of (k, 5) [class, cx, cy, w, h] arrays normalized to the letterboxed image
+Batch = namedtuple('Batch', ['images', 'params', 'labels', 'paths'])
+
+
+def list_images(image_dir) -> List[Path]:
+    """Sorted image files of a flat collector output directory"""
+    return sorted(p for p in Path(image_dir).iterdir() if p.suffix.lower() in IMAGE_EXTENSIONS)
+
+
+def load_yolo_labels(labels_dir: Optional[Path], image_path: Path) -> np.ndarray:
+    """YOLO txt labels for an image (see data_collection/utils/coco_export.py)"""
+    if labels_dir is None:
+        return np.zeros((0, 5), dtype=np.float32)
+    label_file = labels_dir / f"{image_path.stem}.txt"
+    if not label_file.exists() or label_file.stat().st_size == 0:
+        return np.zeros((0, 5), dtype=np.float32)
+    return np.loadtxt(label_file, dtype=np.float32, ndmin=2)
+
+
+def letterbox_labels(labels: np.ndarray, new_w: float, new_h: float, left: float, top: float,
+                     size_w: int, size_h: int) -> np.ndarray:
+    """Map normalized YOLO labels of the source image onto the letterboxed image"""
+    labels = labels.copy()
+    labels[:, 1] = (labels[:, 1] * new_w + left) / size_w
+    labels[:, 2] = (labels[:, 2] * new_h + top) / size_h
+    labels[:, 3] *= new_w / size_w
+    labels[:, 4] *= new_h / size_h
+    return labels
+
+
+def _load_into(path: Path, out: np.ndarray, params: np.ndarray, labels_dir: Optional[Path], flip: bool):
+    """Decode, letterbox and optionally flip one image into its batch slot
+
+    Returns (labels, decode_seconds, augment_seconds).
+    """
+    t0 = time.perf_counter()
+    img, _ = decode_reduced(path.read_bytes(), out.shape[0])
+    t1 = time.perf_counter()
+    labels = load_yolo_labels(labels_dir, path)
+    if img is None:
+        logger.warning(f"Could not decode {path}")
+        out[:] = PAD_VALUE
+        params[:] = (0.0, 0.0, 0.0)
+        return labels[:0], t1 - t0, 0.0
+
+    scale, left, top = letterbox_into(img, out)
+    params[:] = (scale, left, top)
+    if len(labels):
+        height, width = img.shape[:2]
+        labels = letterbox_labels(labels, width * scale, height * scale, left, top, out.shape[1], out.shape[0])
+    if flip:
+        hflip_(out)
+        labels[:, 1] = 1.0 - labels[:, 1]
+    return labels, t1 - t0, time.perf_counter() - t1
+
+
+def _worker_loop(images_name: str, params_name: str, shape, tasks, done, labels_dir, flip_prob: float, seed: int):
+    """Worker process: fill shared batch slots until a None task arrives"""
+    cv2.setNumThreads(1)
+    images_shm = shared_memory.SharedMemory(name=images_name)
+    params_shm = shared_memory.SharedMemory(name=params_name)
+    images = np.ndarray(shape, dtype=np.uint8, buffer=images_shm.buf)
+    params = np.ndarray(shape[:2] + (3,), dtype=np.float32, buffer=params_shm.buf)
+    rng = np.random.default_rng(seed)
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            slot, batch_index, paths = task
+            labels, decode_s, augment_s = [], 0.0, 0.0
+            for i, path in enumerate(paths):
+                lab, d, a = _load_into(Path(path), images[slot, i], params[slot, i], labels_dir,
+                                       rng.random() < flip_prob)
+                labels.append(lab)
+                decode_s += d
+                augment_s += a
+            done.put((slot, batch_index, labels, decode_s, augment_s))
+    finally:
+        del images, params
+        images_shm.close()
+        params_shm.close()
+
+
+class ImageFolderLoader:
+    """Iterate an image directory as preallocated uint8 NHWC letterboxed batches
+
+    With workers > 0 batches are produced by worker processes into a ring of
+    shared-memory slots; only slot indices and labels cross process
+    boundaries. A yielded batch is a view into its slot and stays valid until
+    the next batch is requested, so copy it if it has to outlive the step.
+    """
+
+    def __init__(self, image_dir, batch_size: int = 32, image_size: int = 640, workers: int = 4,
+                 prefetch: Optional[int] = None, shuffle: bool = True, flip_prob: float = 0.5,
+                 labels_dir=None, drop_last: bool = False, seed: int = 0):
+        self.paths = list_images(image_dir)
+        self.batch_size = batch_size
+        self.image_size = image_size
+        self.workers = workers
+        self.slots = prefetch or max(2, workers * 2)
+        self.shuffle = shuffle
+        self.flip_prob = flip_prob
+        self.labels_dir = Path(labels_dir) if labels_dir else None
+        self.drop_last = drop_last
+        self.seed = seed
+        self.epoch = 0
+        self.stats = {}
+
+        self._shape = (self.slots, batch_size, image_size, image_size, 3)
+        self._images_shm = None
+        self._params_shm = None
+        self._procs = []
+
+    def __len__(self):
+        full, rest = divmod(len(self.paths), self.batch_size)
+        return full if self.drop_last or not rest else full + 1
+
+    def _batch_indices(self) -> List[np.ndarray]:
+        order = np.arange(len(self.paths))
+        if self.shuffle:
+            np.random.default_rng(self.seed + self.epoch).shuffle(order)
+        return [order[i:i + self.batch_size] for i in range(0, len(self) * self.batch_size, self.batch_size)]
+
+    def start(self):
+        """Allocate the shared slots and launch the workers (done lazily by iteration)"""
+        if self._procs or self.workers <= 0:
+            return
+        nbytes = int(np.prod(self._shape))
+        self._images_shm = shared_memory.SharedMemory(create=True, size=nbytes)
+        self._params_shm = shared_memory.SharedMemory(create=True, size=int(np.prod(self._shape[:2])) * 3 * 4)
+        self._images = np.ndarray(self._shape, dtype=np.uint8, buffer=self._images_shm.buf)
+        self._params = np.ndarray(self._shape[:2] + (3,), dtype=np.float32, buffer=self._params_shm.buf)
+
+        ctx = mp.get_context()
+        self._tasks = ctx.Queue()
+        self._done = ctx.Queue()
+        for rank in range(self.workers):
+            proc = ctx.Process(target=_worker_loop, daemon=True,
+                               args=(self._images_shm.name, self._params_shm.name, self._shape, self._tasks,
+                                     self._done, self.labels_dir, self.flip_prob, self.seed * 1000 + rank))
+            proc.start()
+            self._procs.append(proc)
+        logger.info(f"Started {self.workers} loader workers, {self.slots} slots of "
+                    f"{self.batch_size}x{self.image_size}x{self.image_size} ({nbytes / 1e6:.0f} MB shared)")
+
+    def close(self):
+        for _ in self._procs:
+            self._tasks.put(None)
+        for proc in self._procs:
+            proc.join(timeout=5)
+            if proc.is_alive():
+                proc.terminate()
+        self._procs = []
+        for shm in (self._images_shm, self._params_shm):
+            if shm is not None:
+                self._images = self._params = None
+                shm.close()
+                shm.unlink()
+        self._images_shm = self._params_shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __iter__(self):
+        batches = self._batch_indices()
+        self.epoch += 1
+        self.stats = {'images': 0, 'decode_s': 0.0, 'augment_s': 0.0, 'collate_s': 0.0, 'wait_s': 0.0}
+        if self.workers <= 0:
+            yield from self._iter_inline(batches)
+        else:
+            self.start()
+            yield from self._iter_workers(batches)
+
+    def _make_batch(self, images, params, labels, indices) -> Batch:
+        start = time.perf_counter()
+        n = len(indices)
+        batch = Batch(images[:n], params[:n], labels, [self.paths[i] for i in indices])
+        self.stats['collate_s'] += time.perf_counter() - start
+        self.stats['images'] += n
+        return batch
+
+    def _iter_inline(self, batches):
+        images = np.empty(self._shape[1:], dtype=np.uint8)
+        params = np.empty((self.batch_size, 3), dtype=np.float32)
+        rng = np.random.default_rng(self.seed + self.epoch)
+        for indices in batches:
+            labels = []
+            for i, index in enumerate(indices):
+                lab, d, a = _load_into(self.paths[index], images[i], params[i], self.labels_dir,
+                                       rng.random() < self.flip_prob)
+                labels.append(lab)
+                self.stats['decode_s'] += d
+                self.stats['augment_s'] += a
+            yield self._make_batch(images, params, labels, indices)
+
+    def _iter_workers(self, batches):
+        free = list(range(self.slots))
+        ready = {}
+        submitted = 0
+
+        def submit():
+            nonlocal submitted
+            while free and submitted < len(batches):
+                paths = [str(self.paths[i]) for i in batches[submitted]]
+                self._tasks.put((free.pop(), submitted, paths))
+                submitted += 1
+
+        submit()
+        received = 0
+        try:
+            for batch_index in range(len(batches)):
+                wait_start = time.perf_counter()
+                while batch_index not in ready:
+                    slot, index, labels, decode_s, augment_s = self._done.get()
+                    received += 1
+                    ready[index] = (slot, labels)
+                    self.stats['decode_s'] += decode_s
+                    self.stats['augment_s'] += augment_s
+                self.stats['wait_s'] += time.perf_counter() - wait_start
+
+                slot, labels = ready.pop(batch_index)
+                yield self._make_batch(self._images[slot], self._params[slot], labels, batches[batch_index])
+                # The consumer is done with this slot once it asks for the next batch
+                free.append(slot)
+                submit()
+        finally:
+            # Drain batches still in flight if the epoch was abandoned early
+            while received < submitted:
+                self._done.get()
+                received += 1
+
+
+def benchmark_loader(image_dir, batch_size: int = 32, image_size: int = 640, workers: int = 4,
+                     epochs: int = 2, target_ips: Optional[float] = None) -> Dict[str, float]:
+    """Run full epochs and report images/s plus per-image decode, augment and collate time
+
+    decode/augment are summed over workers (CPU time per image); wait is how
+    long the training loop stalled on the loader.
+    """
+    results = {}
+    with ImageFolderLoader(image_dir, batch_size, image_size, workers) as loader:
+        for epoch in range(epochs):
+            start = time.perf_counter()
+            for _ in loader:
+                pass
+            elapsed = time.perf_counter() - start
+            n = max(loader.stats['images'], 1)
+            results = {
+                'images_per_s': loader.stats['images'] / elapsed,
+                'decode_ms': loader.stats['decode_s'] * 1000 / n,
+                'augment_ms': loader.stats['augment_s'] * 1000 / n,
+                'collate_ms': loader.stats['collate_s'] * 1000 / n,
+                'wait_ms': loader.stats['wait_s'] * 1000 / n,
+            }
+            logger.info(f"epoch {epoch}: {results['images_per_s']:.1f} images/s | decode {results['decode_ms']:.2f} ms "
+                        f"| augment {results['augment_ms']:.2f} ms | collate {results['collate_ms']:.3f} ms "
+                        f"| wait {results['wait_ms']:.2f} ms per image")
+    if target_ips is not None:
+        met = results.get('images_per_s', 0) >= target_ips
+        logger.info(f"Target {target_ips:.0f} images/s {'met' if met else 'NOT met'}")
+        results['target_met'] = met
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Benchmark the training data loader")
+    parser.add_argument("image_dir", nargs="?", default="data_collection/real_estate_photos/images")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--image-size", type=int, default=640)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--epochs", type=int, default=2)
+    parser.add_argument("--target", type=float, help="images/s the training loop needs")
+    args = parser.parse_args()
+    benchmark_loader(args.image_dir, args.batch_size, args.image_size, args.workers, args.epochs, args.target)
@@ -0,0 +1,221 @@
+"""
+Preprocessed memory-mapped tensor cache for training epochs
+Images are decoded and letterboxed once; later epochs and runs read uint8 rows straight from the page cache
+"""
+
+import hashlib
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+
+from .data_loader import Batch, letterbox_labels, list_images, load_yolo_labels
+from .transforms import PAD_VALUE, decode_reduced, letterbox_into
+
+logger = logging.getLogger(__name__)
+
+CACHE_VERSION = 1
+
+# per-row letterbox parameters: scale, left, top, resized width, resized height
+PARAM_COLUMNS = 5
+
+
+def config_key(config: Dict) -> str:
+    """Stable short hash of a preprocessing config"""
+    return hashlib.sha1(json.dumps(config, sort_keys=True).encode()).hexdigest()[:12]
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha1(data).hexdigest()
+
+
+class TensorCache:
+    """Fixed-size preprocessed images in a memory-mapped uint8 array
+
+    Rows are keyed by image content hash; the array lives in a directory named
+    after the preprocessing config, so changing the config starts a fresh
+    cache and changed images simply get a new row. `sync()` appends only
+    images it has not seen and reuses hashes of files whose size and mtime
+    did not change.
+    """
+
+    def __init__(self, cache_dir, image_size: int = 640, pad_value: int = PAD_VALUE):
+        self.config = {'version': CACHE_VERSION, 'image_size': image_size, 'pad_value': pad_value,
+                       'decode': 'reduced', 'layout': 'HWC', 'color': 'BGR'}
+        self.image_size = image_size
+        self.pad_value = pad_value
+        self.dir = Path(cache_dir) / config_key(self.config)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.index_file = self.dir / "index.json"
+        self.images_file = self.dir / "images.u8"
+        self.params_file = self.dir / "params.f32"
+
+        self.index = {'config': self.config, 'count': 0, 'capacity': 0, 'entries': {}, 'files': {}}
+        if self.index_file.exists():
+            with open(self.index_file) as f:
+                self.index = json.load(f)
+        self._map()
+
+    @property
+    def row_shape(self):
+        return (self.image_size, self.image_size, 3)
+
+    def __len__(self):
+        return len(self.index['files'])
+
+    def _map(self):
+        capacity = self.index['capacity']
+        if capacity == 0:
+            self.images = np.zeros((0,) + self.row_shape, dtype=np.uint8)
+            self.params = np.zeros((0, PARAM_COLUMNS), dtype=np.float32)
+            return
+        self.images = np.memmap(self.images_file, dtype=np.uint8, mode='r+', shape=(capacity,) + self.row_shape)
+        self.params = np.memmap(self.params_file, dtype=np.float32, mode='r+', shape=(capacity, PARAM_COLUMNS))
+
+    def _reserve(self, rows: int):
+        """Grow the backing files geometrically so appends stay amortized O(1)"""
+        needed = self.index['count'] + rows
+        if needed <= self.index['capacity']:
+            return
+        capacity = max(needed, self.index['capacity'] * 2, 64)
+        self.images = self.params = None
+        for path, row_bytes in ((self.images_file, int(np.prod(self.row_shape))), (self.params_file, PARAM_COLUMNS * 4)):
+            with open(path, 'ab') as f:
+                f.truncate(capacity * row_bytes)
+        self.index['capacity'] = capacity
+        self._map()
+
+    def _save_index(self):
+        if isinstance(self.images, np.memmap):
+            self.images.flush()
+            self.params.flush()
+        tmp = self.index_file.with_suffix('.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(self.index, f)
+        os.replace(tmp, self.index_file)
+
+    def _file_hash(self, path: Path, key: str, old_files: Dict) -> Optional[tuple]:
+        """(size, mtime_ns, hash, data) for a file, reading it only when it changed"""
+        st = path.stat()
+        known = old_files.get(key)
+        if known and known[0] == st.st_size and known[1] == st.st_mtime_ns:
+            return st.st_size, st.st_mtime_ns, known[2], None
+        data = path.read_bytes()
+        return st.st_size, st.st_mtime_ns, content_hash(data), data
+
+    def sync(self, image_dir) -> Dict[str, int]:
+        """Bring the cache in line with `image_dir`: append new images, forget removed ones
+
+        Only the entries of `image_dir` are replaced; files synced from other
+        directories stay in the index (and survive compact()).
+        """
+        start = time.perf_counter()
+        image_dir = Path(image_dir).resolve()
+        old_files = self.index['files']
+        entries = self.index['entries']
+        others = {key: value for key, value in old_files.items() if Path(key).parent != image_dir}
+        files = {}
+        pending = []
+        for path in list_images(image_dir):
+            key = str(path)
+            size, mtime, digest, data = self._file_hash(path, key, old_files)
+            files[key] = [size, mtime, digest]
+            if digest not in entries:
+                pending.append((digest, path, data))
+
+        added = 0
+        if pending:
+            self._reserve(len(pending))
+        for digest, path, data in pending:
+            if digest in entries:  # duplicate bytes under two names
+                continue
+            row = self.index['count']
+            img, _ = decode_reduced(data if data is not None else path.read_bytes(), self.image_size)
+            if img is None:
+                logger.warning(f"Could not decode {path}, not cached")
+                files.pop(str(path), None)
+                continue
+            scale, left, top = letterbox_into(img, self.images[row], self.pad_value)
+            height, width = img.shape[:2]
+            self.params[row] = (scale, left, top, width * scale, height * scale)
+            entries[digest] = row
+            self.index['count'] += 1
+            added += 1
+
+        removed = len(set(old_files) - set(others) - set(files))
+        merged = dict(others, **files)
+        self.index['files'] = merged
+        self._save_index()
+
+        live = {digest for _, _, digest in merged.values()}
+        stale = len(entries) - len(live & set(entries))
+        if stale and stale * 2 > len(entries):
+            self.compact()
+        logger.info(f"Cache sync: {added} added, {removed} removed, {len(files)} images in {image_dir}, "
+                    f"{len(merged)} total in {time.perf_counter() - start:.2f}s ({self.dir})")
+        return {'added': added, 'removed': removed, 'total': len(merged)}
+
+    def compact(self):
+        """Drop rows no file refers to anymore by rewriting the live rows densely"""
+        live = sorted({digest for _, _, digest in self.index['files'].values()}, key=self.index['entries'].get)
+        # live rows are visited in ascending old-row order, so moving each one down never
+        # overwrites a row that is still to be read
+        for new_row, digest in enumerate(live):
+            old_row = self.index['entries'][digest]
+            if old_row != new_row:
+                self.images[new_row] = self.images[old_row]
+                self.params[new_row] = self.params[old_row]
+        self.index['entries'] = {d: i for i, d in enumerate(live)}
+        self.index['count'] = len(live)
+        self._save_index()
+        logger.info(f"Compacted cache to {len(live)} rows")
+
+    def rows(self, paths: Optional[List] = None) -> np.ndarray:
+        """Cache rows for `paths` (default: every cached file, sorted by path)"""
+        files = self.index['files']
+        keys = sorted(files) if paths is None else [str(Path(p).resolve()) for p in paths]
+        return np.array([self.index['entries'][files[k][2]] for k in keys], dtype=np.int64)
+
+    def batches(self, batch_size: int = 32, shuffle: bool = True, seed: int = 0, labels_dir=None) -> Iterator[Batch]:
+        """Yield loader-compatible batches read straight from the memory map"""
+        keys = sorted(self.index['files'])
+        rows = self.rows()
+        order = np.arange(len(rows))
+        if shuffle:
+            np.random.default_rng(seed).shuffle(order)
+        labels_dir = Path(labels_dir) if labels_dir else None
+        for i in range(0, len(order), batch_size):
+            chunk = order[i:i + batch_size]
+            # reading rows in ascending order keeps page-cache access mostly sequential
+            chunk = chunk[np.argsort(rows[chunk])]
+            images = self.images[rows[chunk]]
+            params = self.params[rows[chunk]]
+            paths = [Path(keys[j]) for j in chunk]
+            labels = []
+            for path, p in zip(paths, params):
+                lab = load_yolo_labels(labels_dir, path)
+                if len(lab):
+                    lab = letterbox_labels(lab, p[3], p[4], p[1], p[2], self.image_size, self.image_size)
+                labels.append(lab)
+            yield Batch(images, params[:, :3], labels, paths)
+
+
+if __name__ == "__main__":
+    import argparse
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Build or update the preprocessed training cache")
+    parser.add_argument("image_dir", nargs="?", default="data_collection/real_estate_photos/images")
+    parser.add_argument("--cache-dir", default="model_training/cache")
+    parser.add_argument("--image-size", type=int, default=640)
+    args = parser.parse_args()
+
+    cache = TensorCache(args.cache_dir, args.image_size)
+    cache.sync(args.image_dir)
+    start = time.perf_counter()
+    n = sum(len(batch.paths) for batch in cache.batches())
+    elapsed = time.perf_counter() - start
+    logger.info(f"Cached epoch: {n} images in {elapsed:.2f}s ({n / max(elapsed, 1e-9):.0f} images/s)")
@@ -0,0 +1,103 @@
+"""
+Image decode and resize helpers shared by training and inference
+Everything writes into caller-owned buffers so batches can be preallocated
+"""
+
+from typing import Optional, Tuple
+
+import cv2
+import numpy as np
+
+PAD_VALUE = 114
+
+# SOF0..SOF15 minus DHT (C4), JPG (C8) and DAC (CC)
+_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+_REDUCED_COLOR = ((8, cv2.IMREAD_REDUCED_COLOR_8),
+                  (4, cv2.IMREAD_REDUCED_COLOR_4),
+                  (2, cv2.IMREAD_REDUCED_COLOR_2))
+
+
+def jpeg_size(data) -> Optional[Tuple[int, int]]:
+    """(width, height) read from the JPEG frame header, without decoding"""
+    buf = memoryview(data).cast('B')
+    n = len(buf)
+    if n < 4 or buf[0] != 0xFF or buf[1] != 0xD8:
+        return None
+    i = 2
+    while i + 9 < n:
+        if buf[i] != 0xFF:
+            i += 1
+            continue
+        marker = buf[i + 1]
+        if marker == 0xFF:
+            i += 1
+            continue
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            i += 2
+            continue
+        if marker in _SOF_MARKERS:
+            height = (buf[i + 5] << 8) | buf[i + 6]
+            width = (buf[i + 7] << 8) | buf[i + 8]
+            return width, height
+        i += 2 + ((buf[i + 2] << 8) | buf[i + 3])
+    return None
+
+
+def reduced_decode_flag(width: int, height: int, target: int) -> Tuple[int, int]:
+    """Largest JPEG DCT downscale that keeps the long side >= target, as (factor, imread flag)"""
+    long_side = max(width, height)
+    for factor, flag in _REDUCED_COLOR:
+        if long_side // factor >= target:
+            return factor, flag
+    return 1, cv2.IMREAD_COLOR
+
+
+def decode_reduced(data, target: int) -> Tuple[Optional[np.ndarray], int]:
+    """Decode image bytes to BGR, letting libjpeg skip resolution we would throw away
+
+    Returns (image, factor) where factor is the downscale applied by the decoder.
+    """
+    buf = np.frombuffer(data, dtype=np.uint8)
+    size = jpeg_size(buf)
+    factor, flag = 1, cv2.IMREAD_COLOR
+    if size is not None:
+        factor, flag = reduced_decode_flag(size[0], size[1], target)
+    return cv2.imdecode(buf, flag), factor
+
+
+def letterbox_params(width: int, height: int, out_w: int, out_h: int) -> Tuple[float, int, int, int, int]:
+    """Scale and placement of a width x height image letterboxed into out_w x out_h
+
+    Returns (scale, left, top, new_w, new_h).
+    """
+    scale = min(out_w / width, out_h / height)
+    new_w = max(1, min(out_w, int(round(width * scale))))
+    new_h = max(1, min(out_h, int(round(height * scale))))
+    left = (out_w - new_w) // 2
+    top = (out_h - new_h) // 2
+    return scale, left, top, new_w, new_h
+
+
+def letterbox_into(img: np.ndarray, out: np.ndarray, pad_value: int = PAD_VALUE) -> Tuple[float, int, int]:
+    """Resize `img` keeping aspect ratio directly into the HWC uint8 slot `out`
+
+    Only the padding border is filled, the resize writes straight into `out`.
+    Returns (scale, left, top) to map boxes back to the source image.
+    """
+    out_h, out_w = out.shape[:2]
+    height, width = img.shape[:2]
+    scale, left, top, new_w, new_h = letterbox_params(width, height, out_w, out_h)
+
+    out[:top] = pad_value
+    out[top + new_h:] = pad_value
+    out[top:top + new_h, :left] = pad_value
+    out[top:top + new_h, left + new_w:] = pad_value
+    interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR
+    cv2.resize(img, (new_w, new_h), dst=out[top:top + new_h, left:left + new_w], interpolation=interpolation)
+    return scale, left, top
+
+
+def hflip_(out: np.ndarray):
+    """Horizontal flip of an HWC slot in place"""
+    out[:] = out[:, ::-1]
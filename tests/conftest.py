@@ -0,0 +1,10 @@
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# inference_pipeline / model_training import from the repo root, the data_collection
+# scripts as `utils.*` from their own directory
+for path in (ROOT, ROOT / "data_collection"):
+    if str(path) not in sys.path:
+        sys.path.insert(0, str(path))
@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+
+from inference_pipeline.boxes import (batched_nms, cxcywh_to_xyxy, nms, pairwise_iou, random_boxes, soft_nms,
+                                      weighted_box_fusion, xywh_to_xyxy, xyxy_to_cxcywh, xyxy_to_xywh)
+
+
+def random_case(seed):
+    rng = np.random.default_rng(seed)
+    n = int(rng.integers(0, 60))
+    boxes = random_boxes(n, seed=seed)
+    scores = rng.random(n).astype(np.float32)
+    classes = rng.integers(0, 3, n)
+    return boxes, scores, classes
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_format_round_trips(seed):
+    boxes, _, _ = random_case(seed)
+    for fwd, back in ((xyxy_to_xywh, xywh_to_xyxy), (xyxy_to_cxcywh, cxcywh_to_xyxy)):
+        np.testing.assert_allclose(back(fwd(boxes)), boxes, atol=1e-3)
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_pairwise_iou(seed):
+    boxes, _, _ = random_case(seed)
+    iou = pairwise_iou(boxes, boxes)
+    assert np.all((iou >= 0) & (iou <= 1 + 1e-6))
+    np.testing.assert_allclose(iou, iou.T, atol=1e-6)
+    np.testing.assert_allclose(np.diag(iou), 1, atol=1e-5)
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_nms(seed):
+    boxes, scores, _ = random_case(seed)
+    keep = nms(boxes, scores, 0.5)
+    assert np.all(np.diff(scores[keep]) <= 0)
+    kept_iou = pairwise_iou(boxes[keep], boxes[keep])
+    np.fill_diagonal(kept_iou, 0)
+    assert np.all(kept_iou <= 0.5 + 1e-6)
+    # every suppressed box overlaps a kept box with a higher score
+    dropped = np.setdiff1d(np.arange(len(boxes)), keep)
+    if len(dropped):
+        assert np.all(pairwise_iou(boxes[dropped], boxes[keep]).max(axis=1) > 0.5 - 1e-6)
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_batched_nms_matches_per_class_nms(seed):
+    boxes, scores, classes = random_case(seed)
+    keep = batched_nms(boxes, scores, classes, 0.5)
+    for c in range(3):
+        mask = classes == c
+        expected = np.flatnonzero(mask)[nms(boxes[mask], scores[mask], 0.5)]
+        assert set(keep[classes[keep] == c].tolist()) == set(expected.tolist())
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_soft_nms_only_decays(seed):
+    boxes, scores, _ = random_case(seed)
+    keep, decayed = soft_nms(boxes, scores)
+    assert np.all(decayed <= scores[keep] + 1e-6)
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_weighted_box_fusion(seed):
+    boxes, scores, classes = random_case(seed)
+    fused, _, _ = weighted_box_fusion(boxes, scores, classes, 0.5)
+    assert len(fused) == len(batched_nms(boxes, scores, classes, 0.5))
+    assert np.all(fused[:, 2:] >= fused[:, :2])
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_weighted_box_fusion_with_degenerate_boxes(seed):
+    boxes, scores, classes = random_case(seed)
+    # collapse every third box to a line or a point
+    boxes[::3, 2] = boxes[::3, 0]
+    boxes[::6, 3] = boxes[::6, 1]
+    fused, fused_scores, _ = weighted_box_fusion(boxes, scores, classes, 0.5)
+    assert np.isfinite(fused).all() and np.isfinite(fused_scores).all()
+    assert np.all(fused[:, 2:] >= fused[:, :2])
+
+
+def test_weighted_box_fusion_zero_area_seed():
+    boxes = np.array([[10, 10, 10, 50], [0, 0, 100, 100], [1, 1, 99, 99]], dtype=np.float32)
+    scores = np.array([0.9, 0.8, 0.7], dtype=np.float32)
+    fused, fused_scores, _ = weighted_box_fusion(boxes, scores, np.zeros(3, dtype=np.int64))
+    assert np.isfinite(fused).all()
+    np.testing.assert_allclose(fused[0], boxes[0])
+    np.testing.assert_allclose(fused_scores, [0.9, 0.8])
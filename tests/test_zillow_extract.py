@@ -0,0 +1,60 @@
+from pathlib import Path
+
+from utils.zillow_extract import (extract_gallery, extract_listings, fixture_fetcher, merge_listings, photo_key,
+                                  search_url)
+
+FIXTURES = Path(__file__).parent / "fixtures" / "zillow"
+PHOTOS = "https://photos.zillowstatic.com/fp/"
+LISTING_URL = "https://www.zillow.com/homedetails/123-Main-St-Austin-TX-78701/29384756_zpid/"
+
+fetch = fixture_fetcher(FIXTURES)
+
+
+def search_page():
+    return fetch(search_url("Austin TX", 1))
+
+
+def test_listings_are_deduped_by_zpid():
+    listings = extract_listings(search_page())
+    assert [listing['zpid'] for listing in listings] == ['29384756', '29384757', '29384758']
+
+
+def test_listing_urls_are_canonical():
+    urls = [listing['url'] for listing in extract_listings(search_page())]
+    assert urls == [
+        LISTING_URL,
+        "https://www.zillow.com/homedetails/456-Oak-Ave-Austin-TX-78702/29384757_zpid/",
+        "https://www.zillow.com/homedetails/789-Pine-Rd-Austin-TX-78703/29384758_zpid/",
+    ]
+
+
+def test_duplicate_listing_merges_card_photos_at_large_rendition():
+    first = extract_listings(search_page())[0]
+    assert [photo_key(url) for url in first['photos']] == ['a1b2c3d4e5f60718', 'b2c3d4e5f6071829',
+                                                           'd4e5f60718293a4b']
+    assert all(url.endswith("-uncropped_scaled_within_1536_1152.jpg") for url in first['photos'])
+
+
+def test_markup_fallback_without_embedded_state():
+    html = ('<a href="/homedetails/1-Elm-St-Austin-TX/111_zpid/?x=1">1 Elm</a>'
+            '<a href="/homedetails/1-Elm-St-Austin-TX/111_zpid/">1 Elm</a>')
+    url = "https://www.zillow.com/homedetails/1-Elm-St-Austin-TX/111_zpid/"
+    assert extract_listings(html) == [{'zpid': '111', 'url': url, 'photos': []}]
+
+
+def test_gallery_picks_widest_rendition_once_per_photo():
+    gallery = extract_gallery(fetch(LISTING_URL))
+    assert gallery == [
+        PHOTOS + "a1b2c3d4e5f60718-cc_ft_1536.jpg",
+        PHOTOS + "b2c3d4e5f6071829-cc_ft_1536.jpg",
+        # jpeg is preferred, webp only when a photo has no jpeg rendition
+        PHOTOS + "f60718293a4b5c6d-cc_ft_1152.webp",
+    ]
+
+
+def test_merge_listings_across_pages():
+    page = extract_listings(search_page())
+    extra = [dict(page[1], photos=[PHOTOS + "0718293a4b5c6d7e-p_e.jpg"])]
+    merged = merge_listings([page, extra])
+    assert [listing['zpid'] for listing in merged] == ['29384756', '29384757', '29384758']
+    assert merged[1]['photos'] == page[1]['photos'] + extra[0]['photos']